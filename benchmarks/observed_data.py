@@ -0,0 +1,54 @@
+"""Benchmark the additional checks on observed-data objects with many
+embedded cyber observable objects.
+
+The time taken per object should grow linearly with the number of embedded
+objects, since each check runs once per object. Run it from the root of a
+source checkout:
+
+    python benchmarks/observed_data.py
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from stix2validator import ValidationOptions
+from stix2validator.validator import (_get_musts, _get_shoulds,
+                                      _iter_errors_custom)
+
+NUMBER = 20
+
+
+def observed_data(count):
+    return {
+        "type": "observed-data",
+        "spec_version": "2.1",
+        "id": "observed-data--b67d30ff-02ac-498a-92f9-32f845f448cf",
+        "created": "2016-04-06T19:58:16.000Z",
+        "modified": "2016-04-06T19:58:16.000Z",
+        "first_observed": "2015-12-21T19:00:00Z",
+        "last_observed": "2015-12-21T19:00:00Z",
+        "number_observed": 50,
+        "objects": dict((str(i), {
+            "type": "file",
+            "name": "file%d.exe" % i,
+            "hashes": {"SHA-256": "%064x" % i},
+        }) for i in range(count)),
+    }
+
+
+def main():
+    options = ValidationOptions(version='2.1')
+    musts = _get_musts(options)
+    shoulds = _get_shoulds(options)
+    for count in (1, 10, 100, 1000):
+        instance = observed_data(count)
+        seconds = timeit.timeit(lambda: (list(_iter_errors_custom(instance, musts, options)),
+                                         list(_iter_errors_custom(instance, shoulds, options))),
+                                number=NUMBER)
+        print("%4d embedded objects: %8.1f us per observed-data object"
+              % (count, seconds / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
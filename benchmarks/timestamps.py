@@ -0,0 +1,64 @@
+"""Benchmark parsing STIX timestamps with the validator's parser against the
+regular expression and dateutil parser the 'MUST' timestamp checks used to
+run on every timestamp.
+
+The cache of parsed timestamps is cleared before each run, so both sides
+parse every timestamp. dateutil is no longer a dependency; the comparison is
+skipped if it is not installed. Run it from the root of a source checkout:
+
+    python benchmarks/timestamps.py
+"""
+
+from __future__ import print_function
+
+import re
+import timeit
+
+from stix2validator import formats
+
+NUMBER = 10
+
+# Distinct timestamps of each precision, some of them invalid
+TIMESTAMPS = [
+    "20%02d-%02d-%02dT%02d:%02d:%02d%sZ" % (i % 30, i % 12 + 1, i % 31 + 1, i % 24, i % 60, i % 61,
+                                            ('', '.000', '.123456789')[i % 3])
+    for i in range(1000)
+]
+
+
+def parse_with_formats():
+    formats._TIMESTAMPS.clear()
+    for value in TIMESTAMPS:
+        try:
+            formats.timestamp_key(value)
+        except ValueError:
+            pass
+
+
+def parse_with_dateutil():
+    from dateutil import parser
+    for value in TIMESTAMPS:
+        ts_re = re.compile(r"^[0-9]{4}-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])T([01][0-9]|2[0-3]):"
+                           r"([0-5][0-9]):([0-5][0-9]|60)(\.[0-9]+)?Z$")
+        if ts_re.match(value):
+            try:
+                parser.parse(value)
+            except ValueError:
+                pass
+
+
+def main():
+    runs = [('formats', parse_with_formats)]
+    try:
+        import dateutil  # noqa: F401
+        runs.append(('dateutil', parse_with_dateutil))
+    except ImportError:
+        print("dateutil is not installed; only timing the validator's parser")
+    for name, run in runs:
+        seconds = timeit.timeit(run, number=NUMBER)
+        print("%-8s: %6.2f us per timestamp"
+              % (name, seconds / NUMBER / len(TIMESTAMPS) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
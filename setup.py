@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
 
+import os
+
 from setuptools import find_packages, setup
+from setuptools.command.build_py import build_py
 
 with open('README.rst') as f:
     readme = f.read()
@@ -16,12 +19,35 @@ def get_version():
         raise AttributeError("Package does not have a __version__")
 
 
+class BuildPyCommand(build_py):
+    """Also write the bundle of the schemas for each version of STIX into the
+    built package.
+    """
+    def run(self):
+        build_py.run(self)
+
+        # Load the module directly; the package's dependencies may not be
+        # installed yet
+        schema_bundle = {}
+        with open('stix2validator/schema_bundle.py') as f:
+            exec(f.read(), schema_bundle)
+
+        for version in ('2.0', '2.1'):
+            schema_dir = os.path.join('stix2validator', 'schemas-' + version)
+            path = os.path.join(self.build_lib, schema_bundle['bundle_path'](schema_dir))
+            self.announce('writing schema bundle %s' % path, level=2)
+            if not self.dry_run:
+                schema_bundle['write_bundle'](schema_dir, path)
+
+
 install_requires = [
     'appdirs',
     'colorama<0.4.2',
     'cpe',
-    'jsonschema[format]>=3.0.0',
-    'python-dateutil',
+    # The validator relies on jsonschema 3.x internals: the ref resolver's
+    # _scopes_stack, which STIXRefResolver keeps per thread, and attributes
+    # such as the PatternCache attached to each validator instance
+    'jsonschema[format]>=3.0.0,<4',
     'requests',
     'requests_cache',
     'simplejson',
@@ -57,9 +83,13 @@ setup(
     packages=find_packages(exclude=['*.test.*']),
     install_requires=install_requires,
     include_package_data=True,
+    cmdclass={
+        'build_py': BuildPyCommand,
+    },
     entry_points={
         'console_scripts': [
             'stix2_validator = stix2validator.scripts.stix2_validator:main',
+            'stix2_compile_schemas = stix2validator.scripts.stix2_compile_schemas:main',
         ],
     },
 )
@@ -0,0 +1,611 @@
+"""Compile JSON schemas into specialized Python validation functions.
+
+Each node of a schema becomes one plain Python function, with `$ref`s resolved
+once at compile time and each keyword's test inlined. The generated code only
+decides *whether* an instance is valid: whenever an inlined test fails, the
+errors are produced by calling jsonschema's own implementation of that keyword,
+and their paths are built exactly as `Draft7Validator.iter_errors` builds
+them. Compiled validators therefore report the same errors as the generic
+validator they were compiled from, only faster.
+
+Generated code is saved under the validator's user cache directory, with a
+hash of the schema files it was generated from and a digest of the code
+itself, and reused until one of them changes. Saved code is only run if its
+digest matches, and if its file belongs to the current user and can't be
+written by anyone else.
+"""
+
+from functools import partial
+import hashlib
+from numbers import Number
+import os
+import re
+
+import simplejson as json
+from six import integer_types, iteritems, string_types
+from six.moves.urllib.parse import unquote, urldefrag
+
+from . import schema_bundle
+from .formats import TIMESTAMP_PATTERN, match_timestamp
+from .util import get_cache_dir
+
+COMPILER_VERSION = 5
+
+# Python expressions equivalent to the Draft 7 type checker's checks
+TYPE_CHECKS = {
+    'array': 'isinstance({0}, list)',
+    'boolean': 'isinstance({0}, bool)',
+    'integer': ('(isinstance({0}, integer_types) and not isinstance({0}, bool) '
+                'or isinstance({0}, float) and {0}.is_integer())'),
+    'null': '{0} is None',
+    'number': '(isinstance({0}, Number) and not isinstance({0}, bool))',
+    'object': 'isinstance({0}, dict)',
+    'string': 'isinstance({0}, string_types)',
+}
+
+# Keywords whose size limit is checked with len(), with the type they apply to
+# and the comparison that makes an instance invalid
+LENGTH_KEYWORDS = {
+    'minLength': ('string', '<'),
+    'maxLength': ('string', '>'),
+    'minItems': ('array', '<'),
+    'maxItems': ('array', '>'),
+    'minProperties': ('object', '<'),
+    'maxProperties': ('object', '>'),
+}
+
+
+def keyword_errors(validator, schema, keyword, instance, scope):
+    """Return the errors found by the generic validator for a single keyword
+    of a schema, exactly as its ``iter_errors`` would report them.
+    """
+    value = schema[keyword]
+    validator.resolver.push_scope(scope)
+    try:
+        errors = list(validator.VALIDATORS[keyword](validator, value, instance, schema) or ())
+    finally:
+        validator.resolver.pop_scope()
+
+    for error in errors:
+        error._set(validator=keyword, validator_value=value, instance=instance, schema=schema)
+        error.schema_path.appendleft(keyword)
+    return errors
+
+
+def schema_errors(validator, schema, instance, scope):
+    """Return the errors found by the generic validator for a whole schema.
+    """
+    validator.resolver.push_scope(scope)
+    try:
+        return list(validator.iter_errors(instance, schema))
+    finally:
+        validator.resolver.pop_scope()
+
+
+def descend(errors, path, schema_path, keyword):
+    """Add a subschema's location to the paths of the errors found with it.
+    """
+    for error in errors:
+        if path is not None:
+            error.path.appendleft(path)
+        if schema_path is not None:
+            error.schema_path.appendleft(schema_path)
+        error.schema_path.appendleft(keyword)
+    return errors
+
+
+def _is_valid_regex(pattern):
+    try:
+        re.compile(pattern)
+    except (re.error, TypeError):
+        return False
+    return True
+
+
+class SchemaCompiler(object):
+    """Generates the Python source code for validating against one schema.
+
+    Args:
+        validator: The generic validator for the schema, whose resolver is
+            used to resolve `$ref`s.
+        load_ref: Optional function called with the resolver and each `$ref`
+            before it is resolved. It should make sure the referenced schema
+            is in the resolver's store, and return the path of the local file
+            it was loaded from, if any.
+    """
+    def __init__(self, validator, load_ref=None):
+        self.validator = validator
+        self.resolver = validator.resolver
+        self.load_ref = load_ref
+        # Schema documents whose nodes the generated code refers to
+        self.docs = []
+        self._doc_indexes = {}
+        # Local schema files the generated code depends on
+        self.sources = set()
+        self._constants = []
+        self._constant_names = {}
+        self._functions = {}
+        self._pending = []
+        self._code = []
+
+    def compile(self):
+        """Generate the code for the validator's schema.
+
+        Returns:
+            The generated source code. It defines two functions taking an
+            instance: ``iter_errors``, which returns a list of the errors found
+            in it, and ``is_valid``.
+        """
+        schema = self.validator.schema
+        location = (self._doc(schema), ())
+        scope = self.resolver.resolution_scope
+        roots = [
+            'iter_errors = %s' % self._function(schema, location, scope),
+            'is_valid = %s' % self._function(schema, location, scope, check=True),
+        ]
+        while self._pending:
+            self._emit(*self._pending.pop())
+
+        return '\n\n\n'.join(['\n'.join(self._constants)] + self._code + ['\n'.join(roots)]) + '\n'
+
+    def _doc(self, document):
+        try:
+            return self._doc_indexes[id(document)]
+        except KeyError:
+            self._doc_indexes[id(document)] = len(self.docs)
+            self.docs.append(document)
+            return len(self.docs) - 1
+
+    def _constant(self, prefix, expression):
+        try:
+            return self._constant_names[expression]
+        except KeyError:
+            name = '%s%d' % (prefix, len(self._constants))
+            self._constants.append('%s = %s' % (name, expression))
+            self._constant_names[expression] = name
+            return name
+
+    def _node(self, location):
+        doc, path = location
+        return self._constant('S', '_DOCS[%d]%s' % (doc, ''.join('[%r]' % key for key in path)))
+
+    def _function(self, node, location, scope, check=False):
+        """Return the name of the function validating against a schema node,
+        queueing it to be generated if it hasn't been already.
+
+        Two functions can be generated for each node: one returning the list
+        of errors found, and one (if `check` is True) only returning whether
+        there are any, for use where the errors themselves are not reported
+        (e.g. in the subschemas of 'anyOf').
+        """
+        key = (id(node), scope, check)
+        try:
+            return self._functions[key]
+        except KeyError:
+            name = '_%s%d' % ('check' if check else 'errors', len(self._functions))
+            self._functions[key] = name
+            self._pending.append((name, node, location, scope, check))
+            return name
+
+    def _resolve(self, ref, scope):
+        """Resolve a `$ref` in the given scope, returning the URL it resolves
+        to, and the location and value of the schema it refers to.
+        """
+        resolver = self.resolver
+        resolver.push_scope(scope)
+        try:
+            if self.load_ref is not None:
+                local_path = self.load_ref(resolver, ref)
+                if local_path:
+                    self.sources.add(local_path)
+            url, target = resolver.resolve(ref)
+        finally:
+            resolver.pop_scope()
+
+        # Find the target's location the same way the resolver found it
+        document_url, fragment = urldefrag(url)
+        node = resolver.store[document_url]
+        path = []
+        fragment = fragment.lstrip(u'/')
+        for part in unquote(fragment).split(u'/') if fragment else []:
+            part = part.replace(u'~1', u'/').replace(u'~0', u'~')
+            if isinstance(node, list):
+                part = int(part)
+            node = node[part]
+            path.append(part)
+        if node is not target:
+            raise ValueError('Could not locate %r in its schema' % ref)
+
+        return url, (self._doc(resolver.store[document_url]), tuple(path)), target
+
+    def _emit(self, name, node, location, scope, check):
+        lines = ['def %s(instance):' % name]
+        if node is True:
+            lines.append('    return %s' % ('True' if check else '[]'))
+        elif not isinstance(node, dict):
+            lines.append('    return %s_schema_errors(%s, instance, %s)' % (
+                'not ' if check else '', self._node(location), self._constant('U', repr(scope))))
+        else:
+            if node.get('$id'):
+                scope = self.resolver._urljoin_cache(scope, node['$id'])
+
+            ref = node.get('$ref')
+            if ref is not None:
+                # Like the generic validator, ignore everything else beside a $ref
+                url, target_location, target = self._resolve(ref, scope)
+                lines.append('    return %s(instance)' % self._function(target, target_location, url, check))
+            else:
+                body = []
+                for keyword, value in iteritems(node):
+                    if keyword in self.validator.VALIDATORS:
+                        body.extend(self._keyword(node, location, scope, check, keyword, value))
+                if check:
+                    lines.extend('    ' + line for line in body)
+                    lines.append('    return True')
+                elif body:
+                    lines.append('    errors = []')
+                    lines.extend('    ' + line for line in body)
+                    lines.append('    return errors')
+                else:
+                    lines.append('    return []')
+
+        self._code.append('\n'.join(lines))
+
+    def _keyword(self, node, location, scope, check, keyword, value):
+        """Return the lines of code that check one keyword of a schema node.
+        """
+        doc, path = location
+        delegate = '_keyword_errors(%s, %r, instance, %s)' % (
+            self._node(location), keyword, self._constant('U', repr(scope)))
+        # What to do when an instance fails the keyword's test
+        fail = 'return False' if check else 'errors.extend(%s)' % delegate
+
+        def subschema(subnode, *subpath, **kwargs):
+            return self._function(subnode, (doc, path + (keyword,) + subpath), scope,
+                                  kwargs.get('check', check))
+
+        def child_errors(function, argument, error_path, schema_path):
+            if check:
+                return ['if not %s(%s):' % (function, argument), '    return False']
+            return [
+                'errors_ = %s(%s)' % (function, argument),
+                'if errors_:',
+                '    errors.extend(_descend(errors_, %s, %r, %r))' % (error_path, schema_path, keyword),
+            ]
+
+        lines = None
+        if keyword == 'type':
+            types = [value] if isinstance(value, string_types) else value
+            if (isinstance(types, list) and types and
+                    all(isinstance(t, string_types) and t in TYPE_CHECKS for t in types)):
+                checks = ' or '.join(TYPE_CHECKS[t].format('instance') for t in types)
+                lines = ['if not (%s):' % checks, '    ' + fail]
+
+        elif keyword == 'required':
+            if isinstance(value, list) and all(isinstance(p, string_types) for p in value):
+                if not value:
+                    return []
+                missing = ' or '.join('%r not in instance' % p for p in value)
+                lines = ['if isinstance(instance, dict) and (%s):' % missing, '    ' + fail]
+
+        elif keyword == 'enum':
+            if isinstance(value, list) and value and all(isinstance(v, string_types) for v in value):
+                # Only strings can equal one of these values
+                enum = self._constant('E', 'frozenset(%s[%r])' % (self._node(location), keyword))
+                lines = ['if not (isinstance(instance, string_types) and instance in %s):' % enum,
+                         '    ' + fail]
+
+        elif keyword == 'pattern':
+            if value == TIMESTAMP_PATTERN:
+                # Parse timestamps while matching them, for the 'MUST' timestamp check to reuse
+                lines = ['if isinstance(instance, string_types) and not _match_timestamp(instance):',
+                         '    ' + fail]
+            elif isinstance(value, string_types) and _is_valid_regex(value):
+                regex = self._constant('P', '_patterns.compile(%r)' % value)
+                lines = ['if isinstance(instance, string_types) and not %s.search(instance):' % regex,
+                         '    ' + fail]
+
+        elif keyword in LENGTH_KEYWORDS:
+            if isinstance(value, integer_types) and not isinstance(value, bool):
+                type_, operator = LENGTH_KEYWORDS[keyword]
+                lines = ['if %s and len(instance) %s %r:' % (TYPE_CHECKS[type_].format('instance'), operator, value),
+                         '    ' + fail]
+
+        elif keyword in ('minimum', 'maximum'):
+            if isinstance(value, Number) and not isinstance(value, bool):
+                operator = '<' if keyword == 'minimum' else '>'
+                lines = ['if %s and instance %s %r:' % (TYPE_CHECKS['number'].format('instance'), operator, value),
+                         '    ' + fail]
+
+        elif keyword == 'properties':
+            if isinstance(value, dict):
+                if not value:
+                    return []
+                lines = ['if isinstance(instance, dict):']
+                for prop, subnode in iteritems(value):
+                    lines.append('    if %r in instance:' % prop)
+                    lines.extend('        ' + line for line in child_errors(
+                        subschema(subnode, prop), 'instance[%r]' % prop, repr(prop), prop))
+
+        elif keyword == 'patternProperties':
+            if isinstance(value, dict) and all(_is_valid_regex(p) for p in value):
+                if not value:
+                    return []
+                lines = ['if isinstance(instance, dict):']
+                for pattern, subnode in iteritems(value):
+                    regex = self._constant('P', '_patterns.compile(%r)' % pattern)
+                    lines.extend([
+                        '    for key, value in iteritems(instance):',
+                        '        if %s.search(key):' % regex,
+                    ])
+                    lines.extend('            ' + line for line in child_errors(
+                        subschema(subnode, pattern), 'value', 'key', pattern))
+
+        elif keyword == 'additionalProperties':
+            properties = node.get('properties', {})
+            patterns = '|'.join(node.get('patternProperties', {}))
+            if isinstance(properties, dict) and _is_valid_regex(patterns):
+                conditions = []
+                if properties:
+                    names = self._constant('N', 'frozenset(%s[%r])' % (self._node(location), 'properties'))
+                    conditions.append('key not in %s' % names)
+                if patterns:
+                    conditions.append('not %s.search(key)' % self._constant('P', '_patterns.compile(%r)' % patterns))
+                # Iterate over the extra properties in the same order as the
+                # generic validator does
+                extras = 'set(key for key in instance%s)' % (
+                    ' if ' + ' and '.join(conditions) if conditions else '')
+
+                if isinstance(value, dict):
+                    lines = ['if isinstance(instance, dict):',
+                             '    for extra in %s:' % extras]
+                    lines.extend('        ' + line for line in child_errors(
+                        subschema(value), 'instance[extra]', 'extra', None))
+                elif not value:
+                    lines = ['if isinstance(instance, dict) and %s:' % extras, '    ' + fail]
+                else:
+                    return []
+
+        elif keyword == 'items':
+            if isinstance(value, list):
+                lines = ['if isinstance(instance, list):']
+                for index, subnode in enumerate(value):
+                    lines.append('    if len(instance) > %d:' % index)
+                    lines.extend('        ' + line for line in child_errors(
+                        subschema(subnode, index), 'instance[%d]' % index, index, index))
+            elif isinstance(value, (dict, bool)):
+                lines = ['if isinstance(instance, list):',
+                         '    for index, item in enumerate(instance):']
+                lines.extend('        ' + line for line in child_errors(
+                    subschema(value), 'item', 'index', None))
+
+        elif keyword == 'allOf':
+            if isinstance(value, list):
+                lines = []
+                for index, subnode in enumerate(value):
+                    lines.extend(child_errors(subschema(subnode, index), 'instance', None, index))
+
+        elif keyword in ('anyOf', 'oneOf'):
+            if isinstance(value, list) and value:
+                # Errors in the subschemas are only reported as the context of
+                # this keyword's error, so just check whether they match
+                functions = ['%s(instance)' % subschema(subnode, index, check=True)
+                             for index, subnode in enumerate(value)]
+                if keyword == 'anyOf':
+                    test = 'not (%s)' % ' or '.join(functions)
+                else:
+                    test = '(%s) != 1' % ' + '.join(functions)
+                lines = ['if %s:' % test, '    ' + fail]
+
+        elif keyword == 'not':
+            lines = ['if %s(instance):' % subschema(value, check=True), '    ' + fail]
+
+        if lines is None:
+            # Not a keyword (or a form of one) worth specializing
+            lines = ['if %s:' % delegate, '    return False'] if check else [fail]
+        return lines
+
+
+class CompiledValidator(object):
+    """A validator which checks instances with code generated from its schema.
+
+    It can be used in place of the generic validator it was compiled from,
+    which it relies on to report the details of any errors found.
+    """
+    def __init__(self, validator, source, docs):
+        self.validator = validator
+        self.schema = validator.schema
+        self.source = source
+        namespace = {
+            '_DOCS': docs,
+            '_keyword_errors': partial(keyword_errors, validator),
+            '_schema_errors': partial(schema_errors, validator),
+            '_descend': descend,
+            '_match_timestamp': match_timestamp,
+            '_patterns': validator.patterns,
+            'Number': Number,
+            'integer_types': integer_types,
+            'iteritems': iteritems,
+            'string_types': string_types,
+        }
+        exec(compile(source, '<compiled schema %s>' % validator.resolver.base_uri, 'exec'), namespace)
+        self._iter_errors = namespace['iter_errors']
+        self.is_valid = namespace['is_valid']
+
+    def iter_errors(self, instance):
+        return iter(self._iter_errors(instance))
+
+
+def compiled_path(schema_path, merged_schema_path=None):
+    """Return the path of the file the code compiled from a schema (merged
+    with another, if `merged_schema_path` is given) is saved in.
+    """
+    key = os.path.abspath(schema_path)
+    if merged_schema_path is not None:
+        key += os.pathsep + os.path.abspath(merged_schema_path)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(get_cache_dir(), 'compiled-schema-%s.json' % digest)
+
+
+# Bundled schema directory (with a trailing separator) -> the path of its
+# bundle, for the directories whose bundles were built with the package
+_SCHEMA_BUNDLE_PATHS = None
+
+# Path of a bundle -> (its modification time, a hash of its contents)
+_BUNDLE_HASHES = {}
+
+
+def _schema_bundle_paths():
+    global _SCHEMA_BUNDLE_PATHS
+    if _SCHEMA_BUNDLE_PATHS is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        paths = {}
+        for version in ('2.0', '2.1'):
+            schema_dir = os.path.join(package_dir, 'schemas-' + version)
+            path = schema_bundle.bundle_path(schema_dir)
+            if os.path.exists(path):
+                paths[schema_dir + os.sep] = path
+        _SCHEMA_BUNDLE_PATHS = paths
+    return _SCHEMA_BUNDLE_PATHS
+
+
+def _source_files(sources):
+    """Return the files to check for changes to the schemas in `sources`:
+    the bundle for those in a bundled schema directory with a bundle, which
+    holds the same schemas, and otherwise the schema files themselves.
+    """
+    bundle_paths = _schema_bundle_paths()
+    files = set()
+    for source in sources:
+        source = os.path.abspath(source)
+        for schema_dir, bundle_path in iteritems(bundle_paths):
+            if source.startswith(schema_dir):
+                files.add(bundle_path)
+                break
+        else:
+            files.add(source)
+    return sorted(files)
+
+
+def _file_hash(path):
+    bundle_hash = _BUNDLE_HASHES.get(path)
+    if bundle_hash is not None and bundle_hash[0] == os.stat(path).st_mtime:
+        return bundle_hash[1]
+    with open(path, 'rb') as source_file:
+        file_hash = hashlib.sha256(source_file.read()).digest()
+    if path in _schema_bundle_paths().values():
+        # Bundles are shared by many schemas; only hash each once
+        _BUNDLE_HASHES[path] = (os.stat(path).st_mtime, file_hash)
+    return file_hash
+
+
+def _schema_hash(files):
+    """Return a hash of the paths and contents of the files in `files`, as
+    returned by _source_files().
+    """
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(path.encode('utf-8'))
+        digest.update(_file_hash(path))
+    return digest.hexdigest()
+
+
+def _code_digest(source, docs):
+    """Return a digest of generated code and the schema documents it uses.
+    """
+    digest = hashlib.sha256(source.encode('utf-8'))
+    digest.update(json.dumps(docs, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _is_private(compiled_file):
+    # Only trust saved code which no other user could have written
+    if not hasattr(os, 'getuid'):
+        return True
+    stat = os.fstat(compiled_file.fileno())
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def _load_compiled(schema_path, merged_schema_path=None):
+    try:
+        with open(compiled_path(schema_path, merged_schema_path)) as compiled_file:
+            if not _is_private(compiled_file):
+                return None
+            compiled = json.load(compiled_file)
+        if (compiled['compiler_version'] != COMPILER_VERSION or
+                compiled['schema_path'] != schema_path or
+                compiled.get('merged_schema_path') != merged_schema_path):
+            return None
+        for source, mtime in iteritems(compiled['sources']):
+            if os.stat(source).st_mtime != mtime:
+                return None
+        # Only run code generated from exactly the schemas on disk, and which
+        # hasn't been changed since
+        if compiled['schema_hash'] != _schema_hash(compiled['sources']):
+            return None
+        if compiled['code_digest'] != _code_digest(compiled['source'], compiled['docs']):
+            return None
+        return compiled
+    except (EnvironmentError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_compiled(compiled):
+    # Saving is only an optimization, so don't fail if it isn't possible
+    try:
+        files = _source_files(compiled['sources'])
+        compiled['schema_hash'] = _schema_hash(files)
+        compiled['sources'] = dict((path, os.stat(path).st_mtime) for path in files)
+        compiled['code_digest'] = _code_digest(compiled['source'], compiled['docs'])
+        path = compiled_path(compiled['schema_path'], compiled['merged_schema_path'])
+        # Replace any existing file, so that it gets the permissions below
+        if os.path.exists(path):
+            os.remove(path)
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as compiled_file:
+            json.dump(compiled, compiled_file)
+    except EnvironmentError:
+        pass
+
+
+def compile_validator(validator, schema_path, load_ref=None, merged_schema_path=None):
+    """Compile the schema of a validator into a :class:`CompiledValidator`.
+
+    Code saved by an earlier compilation of the same schema is reused if none
+    of the schema files it was generated from have changed since (neither
+    their modification times nor a hash of their contents), and the code
+    itself is unchanged. For the schemas bundled with the package, the bundle
+    built with it is checked instead of each schema file.
+
+    Args:
+        validator: The generic validator for the schema at `schema_path`.
+        schema_path: The filename of the JSON schema.
+        load_ref: Passed to :class:`SchemaCompiler`.
+        merged_schema_path: The filename of another JSON schema, if the
+            validator's schema merges it with the one at `schema_path`.
+
+    Returns:
+        A CompiledValidator.
+    """
+    compiled = _load_compiled(schema_path, merged_schema_path)
+    if compiled is None:
+        compiler = SchemaCompiler(validator, load_ref)
+        source = compiler.compile()
+        schema_paths = set([schema_path, merged_schema_path]) - set([None])
+        compiled = {
+            'compiler_version': COMPILER_VERSION,
+            'schema_path': schema_path,
+            'merged_schema_path': merged_schema_path,
+            'sources': sorted(compiler.sources | schema_paths),
+            'docs': compiler.docs,
+            'source': source,
+        }
+        _save_compiled(dict(compiled))
+        docs = compiler.docs
+    else:
+        docs = compiled['docs']
+        # Register the schemas the code was compiled from, as resolving their
+        # $refs would have, for the generic validator to use
+        for doc in docs:
+            if isinstance(doc, dict) and doc.get('$id') and doc['$id'] not in validator.resolver.store:
+                validator.resolver.store[doc['$id']] = doc
+    return CompiledValidator(validator, compiled['source'], docs)
@@ -13,6 +13,36 @@ class PatternError(schema_exceptions.ValidationError):
         super(PatternError, self).__init__(msg, path=deque([instance_id]))
 
 
+class PatternLimitError(PatternError):
+    """Represent a STIX Pattern which exceeds one of the limits set on the
+    patterns the validator parses.
+
+    Attributes:
+        limit: Which limit was exceeded: 'length', 'depth', 'comparisons' or
+            'time'.
+        value: The pattern's length, nesting depth or number of comparisons,
+            or None for the 'time' limit.
+        maximum: The limit's maximum.
+
+    """
+    DESCRIPTIONS = {
+        'length': "the pattern's length of %s exceeds the maximum of %s",
+        'depth': "the pattern's nesting depth of %s exceeds the maximum of %s",
+        'comparisons': "the pattern's %s comparisons exceed the maximum of %s",
+        'time': "parsing the pattern took longer than the maximum of %s seconds",
+    }
+
+    def __init__(self, limit, value, maximum, instance_id=None):
+        if limit == 'time':
+            msg = self.DESCRIPTIONS[limit] % maximum
+        else:
+            msg = self.DESCRIPTIONS[limit] % (value, maximum)
+        super(PatternLimitError, self).__init__(msg, instance_id)
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+
 class NoJSONFileFoundError(OSError):
     """Represent a problem finding the input JSON file(s).
 
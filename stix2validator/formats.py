@@ -0,0 +1,139 @@
+"""Format checkers and a parser for STIX timestamps and identifiers.
+
+The bundled STIX schemas check these values with ``pattern`` keywords. Code
+compiled from them matches timestamps with :func:`match_timestamp`, which
+parses each timestamp as it matches it and remembers the result, so that the
+'MUST' timestamp checks do not need to parse it again. The format checkers
+are registered with the validator's format checker, for use by custom schemas.
+"""
+
+from calendar import monthrange
+from datetime import datetime
+import re
+
+from jsonschema import draft7_format_checker
+from six import string_types
+
+# The pattern the STIX schemas use for timestamps
+TIMESTAMP_PATTERN = (r"^[0-9]{4}-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])T([01][0-9]|2[0-3]):"
+                     r"([0-5][0-9]):([0-5][0-9]|60)(\.[0-9]+)?Z$")
+TIMESTAMP_RE = re.compile(TIMESTAMP_PATTERN)
+TIMESTAMP_MILLIS_RE = re.compile(r"T\d{2}:\d{2}:\d{2}\.\d{3,}Z$")
+IDENTIFIER_RE = re.compile(r"^[a-z][a-z0-9-]+[a-z0-9]--[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[1-5][0-9a-fA-F]{3}"
+                           r"-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}$")
+
+# Maximum number of timestamps to remember the parse results of
+TIMESTAMP_CACHE_SIZE = 10000
+
+# Maps timestamps to their timestamp_key(), None if they don't match
+# TIMESTAMP_PATTERN, or an error message if they match it but are not valid
+# dates and times
+_TIMESTAMPS = {}
+
+
+def _parse_timestamp(value):
+    if not TIMESTAMP_RE.search(value):
+        return None
+    # The pattern fixes where each field is; a fraction of a second may follow
+    # the seconds, and a newline may follow the 'Z'
+    end = value.rindex('Z')
+    year, month, day = int(value[0:4]), int(value[5:7]), int(value[8:10])
+    hour, minute, second = int(value[11:13]), int(value[14:16]), int(value[17:19])
+    try:
+        datetime(year, month, day, hour, minute, min(second, 59))
+    except ValueError as e:
+        # Same message as dateutil's parser gives
+        return '%s: %s' % (e, value)
+    # RFC 3339 only allows leap seconds at the end of a month
+    if second == 60 and not (hour == 23 and minute == 59 and
+                             day == monthrange(year, month)[1]):
+        return 'second must be in 0..59: %s' % value
+    fraction = value[20:end].rstrip('0') if end > 19 else ''
+    return year, month, day, hour, minute, second, fraction
+
+
+def _lookup_timestamp(value):
+    try:
+        return _TIMESTAMPS[value]
+    except KeyError:
+        pass
+    result = _parse_timestamp(value)
+    if len(_TIMESTAMPS) >= TIMESTAMP_CACHE_SIZE:
+        _TIMESTAMPS.clear()
+    _TIMESTAMPS[value] = result
+    return result
+
+
+def match_timestamp(value):
+    """Return True if the string `value` matches the pattern the STIX schemas
+    use for timestamps (even if it is not a valid date and time).
+    """
+    return _lookup_timestamp(value) is not None
+
+
+def timestamp_key(value):
+    """Parse a STIX timestamp into a value which compares with those of other
+    timestamps in the same order as the times they represent, whatever the
+    precision of each timestamp.
+
+    Returns:
+        A tuple of the year, month, day, hour, minute and second (60 for a
+        leap second) as integers, and the digits of the fraction of a second
+        without trailing zeros as a string; or None if `value` does not match
+        the pattern the STIX schemas use for timestamps (schema validation
+        reports those).
+
+    Raises:
+        ValueError: If `value` matches the pattern, but is not a valid date
+            and time (e.g. February 30th, or a leap second anywhere but at
+            the end of a month).
+    """
+    result = _lookup_timestamp(value)
+    if isinstance(result, string_types):
+        raise ValueError(result)
+    return result
+
+
+def parse_timestamp(value):
+    """Parse a STIX timestamp.
+
+    Returns:
+        A naive datetime in UTC, or None if `value` does not match the pattern
+        the STIX schemas use for timestamps (schema validation reports those).
+        Since datetimes can't represent leap seconds, a leap second is given
+        as the last microsecond of the minute before it.
+
+    Raises:
+        ValueError: If `value` matches the pattern, but is not a valid date
+            and time (e.g. February 30th, or a leap second anywhere but at
+            the end of a month).
+    """
+    key = timestamp_key(value)
+    if key is None:
+        return None
+    year, month, day, hour, minute, second, fraction = key
+    if second == 60:
+        return datetime(year, month, day, hour, minute, 59, 999999)
+    return datetime(year, month, day, hour, minute, second,
+                    int(fraction[:6].ljust(6, '0')))
+
+
+@draft7_format_checker.checks('stix-timestamp', raises=ValueError)
+def is_timestamp(instance):
+    if not isinstance(instance, string_types):
+        return True
+    return timestamp_key(instance) is not None
+
+
+@draft7_format_checker.checks('stix-timestamp-millis', raises=ValueError)
+def is_timestamp_millis(instance):
+    if not isinstance(instance, string_types):
+        return True
+    return is_timestamp(instance) and TIMESTAMP_MILLIS_RE.search(instance) is not None
+
+
+@draft7_format_checker.checks('stix-identifier')
+def is_identifier(instance):
+    if not isinstance(instance, string_types):
+        return True
+    return IDENTIFIER_RE.match(instance) is not None
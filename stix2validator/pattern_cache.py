@@ -0,0 +1,545 @@
+"""A cache of the results of parsing STIX patterns.
+
+Parsing a pattern with the ANTLR-based parser in stix2patterns is the most
+expensive part of checking an indicator, and both the 'MUST' pattern check and
+the strict types and properties checks need the same results for the same
+pattern. Feeds of indicators also tend to repeat the same patterns, so the
+results are kept in a bounded, least recently used cache shared by all checks
+in the process. Optionally, the results are also kept in a PatternStore on
+disk, so that later runs need not parse the same patterns again, and the
+patterns of many indicators can be parsed up front across a pool of worker
+processes.
+
+When a time limit is set, patterns are parsed in background threads. Python
+threads can't be stopped, so a parse which takes longer than the limit carries
+on in the background until it finishes. At most PATTERN_PARSE_THREADS parses
+run in the background at once (in each process); while that many are running,
+patterns which are not parsed yet are reported as exceeding the time limit
+straight away, rather than started.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import multiprocessing
+import re
+import sqlite3
+import threading
+import time
+
+from six import text_type
+from stix2patterns.inspector import INDEX_STAR
+from stix2patterns.v20.pattern import Pattern as Pattern20
+from stix2patterns.v21.pattern import Pattern as Pattern21
+from stix2patterns.validator import run_validator
+
+# Maximum number of parsed patterns to keep in memory
+PARSED_PATTERN_CACHE_SIZE = 4096
+
+# Maximum number of parsed patterns to keep in a PatternStore
+PATTERN_STORE_SIZE = 1000000
+
+# Maximum number of patterns to parse in background threads at once
+PATTERN_PARSE_THREADS = 8
+_PARSE_THREADS = threading.BoundedSemaphore(PATTERN_PARSE_THREADS)
+
+# String, binary, hex and timestamp literals, which may contain anything
+PATTERN_LITERAL_RE = re.compile(r"[bht]?'(?:\\.|[^'\\])*'")
+PATTERN_BRACKET_RE = re.compile(r"[\[\]()]")
+PATTERN_COMPARISON_RE = re.compile(r"!=|<=|>=|=|<|>|\b(?:IN|LIKE|MATCHES|ISSUBSET|ISSUPERSET|EXISTS)\b")
+
+
+def pattern_complexity(pattern):
+    """Measure how complex a STIX pattern is without parsing it.
+
+    Returns:
+        A tuple of the deepest nesting of brackets and parentheses in the
+        pattern (not counting list indexes in object paths), and the number
+        of comparisons in it.
+    """
+    text = PATTERN_LITERAL_RE.sub("''", pattern)
+    depth = max_depth = 0
+    # Whether each open bracket is an index into a list in an object path,
+    # such as "[*]", which doesn't count towards the nesting
+    indexes = []
+    for match in PATTERN_BRACKET_RE.finditer(text):
+        char = match.group()
+        if char in '[(':
+            start = match.start()
+            is_index = (char == '[' and start > 0 and
+                        (text[start - 1].isalnum() or text[start - 1] in "_-'"))
+            indexes.append(is_index)
+            if not is_index:
+                depth += 1
+                max_depth = max(max_depth, depth)
+        elif indexes and not indexes.pop():
+            depth -= 1
+    return max_depth, len(PATTERN_COMPARISON_RE.findall(text))
+
+
+def complexity_limit_exceeded(pattern, options):
+    """Check a STIX pattern against the limits on its length, nesting depth
+    and number of comparisons in `options`, without parsing it.
+
+    Returns:
+        A (limit, value, maximum) tuple for the first limit the pattern
+        exceeds, or None if it exceeds none of them.
+    """
+    if options.pattern_max_length is not None and len(pattern) > options.pattern_max_length:
+        return 'length', len(pattern), options.pattern_max_length
+    if options.pattern_max_depth is None and options.pattern_max_comparisons is None:
+        return None
+    depth, comparisons = pattern_complexity(pattern)
+    if options.pattern_max_depth is not None and depth > options.pattern_max_depth:
+        return 'depth', depth, options.pattern_max_depth
+    if options.pattern_max_comparisons is not None and comparisons > options.pattern_max_comparisons:
+        return 'comparisons', comparisons, options.pattern_max_comparisons
+    return None
+
+
+class ParsedPattern(object):
+    """The results of parsing a STIX pattern with a version of the STIX
+    patterning grammar, each worked out the first time it is needed.
+
+    The results are shared between all the checks which parse the same
+    pattern, and must not be modified. If a PatternStore is given, the results
+    are saved in it once they have all been worked out.
+    """
+    def __init__(self, pattern, version, store=None):
+        self.pattern = pattern
+        self.version = version
+        self._store = store
+        self._errors = None
+        self._comparisons = None
+        self._thread = None
+        self._timed_out = False
+
+    @property
+    def errors(self):
+        """The list of syntax error messages for the pattern, as returned by
+        stix2patterns' run_validator(); empty if the pattern is valid.
+        """
+        if self._errors is None:
+            self._errors = run_validator(self.pattern, self.version)
+            self._save()
+        return self._errors
+
+    @property
+    def comparisons(self):
+        """The comparison expressions in the pattern, grouped by object type,
+        as returned by stix2patterns' Pattern.inspect().
+
+        Raises:
+            ParseException: If the pattern is not valid.
+        """
+        if self._comparisons is None:
+            pattern_class = Pattern21 if self.version == '2.1' else Pattern20
+            self._comparisons = pattern_class(self.pattern).inspect().comparisons
+            self._save()
+        return self._comparisons
+
+    def finish(self, timeout=None):
+        """Parse the pattern, and find its comparisons if it is valid, in a
+        background thread, waiting at most `timeout` seconds for the results.
+        If `timeout` is None, the results are left to be worked out when they
+        are first needed.
+
+        The pattern is only waited on once: if it has already taken longer
+        than a timeout, or if PATTERN_PARSE_THREADS other patterns are being
+        parsed in the background, this returns straight away.
+
+        Returns:
+            False if the pattern is still being parsed (or could not be
+            started), in which case the thread carries on parsing it for the
+            next lookup; True otherwise.
+        """
+        if timeout is None or (self._errors is not None and
+                               (self._errors or self._comparisons is not None)):
+            return True
+        thread = self._thread
+        if thread is None:
+            threads = _PARSE_THREADS
+            if timeout <= 0 or not threads.acquire(False):
+                return False
+            thread = self._thread = threading.Thread(target=self._parse, args=(threads,))
+            thread.daemon = True
+            thread.start()
+        if self._timed_out:
+            return not thread.is_alive()
+        thread.join(timeout)
+        self._timed_out = thread.is_alive()
+        return not self._timed_out
+
+    def _parse(self, threads):
+        try:
+            if not self.errors:
+                self.comparisons
+        except Exception:
+            # Raised again when the comparisons are looked up
+            pass
+        finally:
+            threads.release()
+
+    def _save(self):
+        # Save the results once the pattern has been parsed; saving works out
+        # whichever of the errors and comparisons aren't yet
+        store = self._store
+        if store is not None:
+            self._store = None
+            store.save(self)
+
+
+def _stix2patterns_version():
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:
+        # Before Python 3.8
+        import stix2patterns
+        return getattr(stix2patterns, '__version__', None)
+    try:
+        return version('stix2-patterns')
+    except PackageNotFoundError:
+        return None
+
+
+def _encode_comparisons(comparisons):
+    # Paths may contain INDEX_STAR, for "[*]"; store it as null
+    return json.dumps(dict(
+        (obj_type, [([None if step is INDEX_STAR else step for step in path], op, value)
+                    for path, op, value in expressions])
+        for obj_type, expressions in comparisons.items()))
+
+
+def _decode_comparisons(data):
+    return dict(
+        (obj_type, [([INDEX_STAR if step is None else step for step in path], op, value)
+                    for path, op, value in expressions])
+        for obj_type, expressions in json.loads(data).items())
+
+
+def _encode_results(parsed):
+    # Parse the pattern if needed; comparisons are only worked out for
+    # patterns without syntax errors
+    errors = [text_type(error) for error in parsed.errors]
+    comparisons = None if errors else _encode_comparisons(parsed.comparisons)
+    return errors, comparisons
+
+
+def _decode_results(pattern, version, errors, comparisons):
+    parsed = ParsedPattern(pattern, version)
+    parsed._errors = errors
+    if comparisons is not None:
+        parsed._comparisons = _decode_comparisons(comparisons)
+    return parsed
+
+
+def _init_worker():
+    # Parses running in the parent process when the worker was started don't
+    # run in the worker
+    global _PARSE_THREADS
+    _PARSE_THREADS = threading.BoundedSemaphore(PATTERN_PARSE_THREADS)
+
+
+def _parse_in_worker(key, timeout=None):
+    # Results are sent back encoded, since INDEX_STAR can't be pickled; None
+    # is sent back for a pattern which couldn't be parsed in time
+    parsed = ParsedPattern(*key)
+    if not parsed.finish(timeout):
+        return None
+    return _encode_results(parsed)
+
+
+class PatternStore(object):
+    """An sqlite database of the syntax errors and comparisons of parsed STIX
+    patterns.
+
+    Results are keyed by a hash of the pattern, the version of the grammar it
+    was parsed with, and the version of stix2patterns which parsed it, so that
+    upgrading stix2patterns does not reuse stale results. When the database
+    holds `maxsize` patterns, the tenth which were stored first is deleted.
+
+    Several processes may share a database. Each keeps its own count of the
+    patterns in it, which is read again from the database whenever it reaches
+    `maxsize`, and after every tenth of `maxsize` patterns the process adds,
+    so the database can only briefly grow beyond `maxsize`.
+    """
+    def __init__(self, path, maxsize=PATTERN_STORE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._library_version = _stix2patterns_version()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS patterns '
+                             '(key TEXT PRIMARY KEY, errors TEXT NOT NULL, comparisons TEXT)')
+        self._count = self._read_count()
+        # Number of patterns added since the count was last read
+        self._added = 0
+
+    def _key(self, pattern, version):
+        data = json.dumps([pattern, version, self._library_version])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def load(self, pattern, version):
+        """Return a ParsedPattern with the stored results for `pattern` with
+        the given version of the grammar, or None if there are none.
+        """
+        key = self._key(pattern, version)
+        with self._lock:
+            row = self._db.execute('SELECT errors, comparisons FROM patterns WHERE key = ?',
+                                   (key,)).fetchone()
+        if row is None:
+            return None
+        return _decode_results(pattern, version, json.loads(row[0]), row[1])
+
+    def save(self, parsed):
+        """Parse a ParsedPattern's pattern if needed, and store the results.
+        Comparisons are only stored for patterns without syntax errors.
+        """
+        errors, comparisons = _encode_results(parsed)
+        errors = json.dumps(errors)
+        key = self._key(parsed.pattern, parsed.version)
+        with self._lock, self._db:
+            if self._count >= self.maxsize or self._added >= max(self.maxsize // 10, 1):
+                # Other processes may have added or deleted patterns since
+                # the count was last read
+                self._count = self._read_count()
+                self._added = 0
+                if self._count >= self.maxsize:
+                    self._db.execute('DELETE FROM patterns WHERE rowid IN '
+                                     '(SELECT rowid FROM patterns ORDER BY rowid LIMIT ?)',
+                                     (max(self.maxsize // 10, 1),))
+                    self._count = self._read_count()
+            cursor = self._db.execute('INSERT OR IGNORE INTO patterns VALUES (?, ?, ?)',
+                                      (key, errors, comparisons))
+            if cursor.rowcount == 1:
+                self._count += 1
+                self._added += 1
+            else:
+                self._db.execute('UPDATE patterns SET errors = ?, comparisons = ? WHERE key = ?',
+                                 (errors, comparisons, key))
+
+    def _read_count(self):
+        return self._db.execute('SELECT COUNT(*) FROM patterns').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._read_count()
+
+
+class ParsedPatternCache(object):
+    """A least recently used cache of ParsedPatterns, keyed by the pattern and
+    the version of the grammar it is parsed with, optionally backed by a
+    PatternStore.
+
+    Patterns parsed up front by prefetch() are held apart from the cache until
+    they are first looked up, so that the cache's size does not limit how
+    many can be prefetched. They are parsed in the worker processes of
+    `pool`, if set, or else of a pool started for each call to prefetch().
+    """
+    def __init__(self, maxsize=PARSED_PATTERN_CACHE_SIZE, store=None):
+        self.maxsize = maxsize
+        self.store = store
+        self.pool = None
+        self.hits = 0
+        self.misses = 0
+        self._patterns = OrderedDict()
+        self._prefetched = {}
+        self._lock = threading.Lock()
+
+    def get(self, pattern, version):
+        """Return the ParsedPattern for `pattern` with the given version of
+        the grammar, loading or creating it if it is not in the cache.
+        """
+        key = (pattern, version)
+        with self._lock:
+            parsed = self._patterns.pop(key, None)
+            if parsed is not None:
+                self.hits += 1
+                # Reinsert it as the most recently used pattern
+                self._patterns[key] = parsed
+                return parsed
+            self.misses += 1
+            parsed = self._prefetched.pop(key, None)
+
+        if parsed is None:
+            store = self.store
+            if store is not None:
+                parsed = store.load(pattern, version)
+            if parsed is None:
+                # The results are saved in the store once they are parsed
+                parsed = ParsedPattern(pattern, version, store)
+
+        with self._lock:
+            if len(self._patterns) >= self.maxsize:
+                self._patterns.popitem(last=False)
+            self._patterns[key] = parsed
+        return parsed
+
+    def prefetch(self, keys, processes=None, timeout=None):
+        """Parse the patterns for `keys`, an iterable of (pattern, version)
+        pairs, which are not in the cache or its store yet, across a pool of
+        `processes` worker processes (by default, one per CPU).
+
+        If `timeout` is not None, each pattern is given at most that many
+        seconds to parse. Patterns which take longer are not prefetched, and
+        are left to be parsed, within the same limit, when looked up.
+        """
+        with self._lock:
+            keys = [key for key in OrderedDict.fromkeys(keys)
+                    if key not in self._patterns and key not in self._prefetched]
+
+        store = self.store
+        if store is not None:
+            missing = []
+            for key in keys:
+                parsed = store.load(*key)
+                if parsed is None:
+                    missing.append(key)
+                else:
+                    self._prefetched[key] = parsed
+            keys = missing
+
+        # Starting a pool isn't worth it for a single pattern
+        if len(keys) < 2:
+            return
+
+        pool = self.pool
+        if pool is None:
+            pool = multiprocessing.Pool(processes, _init_worker)
+        try:
+            results = [pool.apply_async(_parse_in_worker, (key, timeout)) for key in keys]
+            if timeout is None:
+                results = [result.get() for result in results]
+            else:
+                # Each worker gives up on a pattern after the timeout, so the
+                # patterns should be done by the time each worker has had
+                # its share of them; allow as long again for starting up
+                processes = processes or multiprocessing.cpu_count()
+                rounds = -(-len(keys) // processes)
+                deadline = time.time() + 2 * rounds * timeout + 1
+                for i, result in enumerate(results):
+                    try:
+                        results[i] = result.get(max(deadline - time.time(), 0))
+                    except multiprocessing.TimeoutError:
+                        results[i] = None
+        finally:
+            if pool is not self.pool:
+                # Terminating the pool also stops any parses which timed out
+                pool.terminate()
+                pool.join()
+
+        for (pattern, version), result in zip(keys, results):
+            if result is None:
+                continue
+            parsed = _decode_results(pattern, version, *result)
+            if store is not None:
+                store.save(parsed)
+            with self._lock:
+                self._prefetched[(pattern, version)] = parsed
+
+    def clear_prefetched(self):
+        """Drop the prefetched patterns which have not been looked up."""
+        with self._lock:
+            self._prefetched.clear()
+
+    def clear(self):
+        with self._lock:
+            self._patterns.clear()
+            self._prefetched.clear()
+
+    def __len__(self):
+        return len(self._patterns)
+
+
+PARSED_PATTERNS = ParsedPatternCache()
+
+
+def parse_pattern(pattern, version):
+    """Return the ParsedPattern for `pattern` with the given version ('2.0' or
+    '2.1') of the STIX patterning grammar, from the shared cache.
+    """
+    return PARSED_PATTERNS.get(pattern, version)
+
+
+def prefetch_patterns(keys, processes=None, timeout=None):
+    """Parse the patterns for `keys`, an iterable of (pattern, version) pairs,
+    across a pool of `processes` worker processes, giving each at most
+    `timeout` seconds, ahead of the checks which look them up in the shared
+    cache.
+    """
+    PARSED_PATTERNS.prefetch(keys, processes, timeout)
+
+
+def init_pattern_pool(processes=None):
+    """Start a pool of `processes` worker processes for prefetch_patterns()
+    to parse patterns in, until close_pattern_pool() is called.
+    """
+    close_pattern_pool()
+    PARSED_PATTERNS.pool = multiprocessing.Pool(processes, _init_worker)
+
+
+def close_pattern_pool():
+    """Stop the pool started by init_pattern_pool(), including any parses
+    which timed out and are still running in it.
+    """
+    pool = PARSED_PATTERNS.pool
+    if pool is not None:
+        PARSED_PATTERNS.pool = None
+        pool.terminate()
+        pool.join()
+
+
+def pattern_deadline(options):
+    """Return the time by which patterns parsed from now on must be parsed
+    to stay within the time limit in `options`, or None if there is none.
+    """
+    if options.pattern_timeout is None:
+        return None
+    return time.time() + options.pattern_timeout
+
+
+def pattern_limit_exceeded(pattern, version, options, deadline=None):
+    """Check a STIX pattern against the limits in `options`: first those on
+    its length, nesting depth and number of comparisons, then the time allowed
+    for parsing it with the given version of the grammar.
+
+    A check which parses a pattern with several versions of the grammar can
+    share one time limit between them, by passing each call the same
+    `deadline`, from pattern_deadline(). By default, the pattern gets the
+    whole time limit.
+
+    Returns:
+        A (limit, value, maximum) tuple for the first limit the pattern
+        exceeds, or None if it exceeds none of them, in which case the results
+        of parsing it are ready.
+    """
+    exceeded = complexity_limit_exceeded(pattern, options)
+    if exceeded is None and options.pattern_timeout is not None:
+        if deadline is None:
+            deadline = pattern_deadline(options)
+        if not parse_pattern(pattern, version).finish(max(deadline - time.time(), 0)):
+            exceeded = 'time', None, options.pattern_timeout
+    return exceeded
+
+
+def clear_prefetched_patterns():
+    """Drop the prefetched patterns which no check has looked up."""
+    PARSED_PATTERNS.clear_prefetched()
+
+
+def init_pattern_store(path, maxsize=PATTERN_STORE_SIZE):
+    """Back the shared cache of parsed patterns with the PatternStore at
+    `path`, creating it if it doesn't exist yet.
+    """
+    store = PARSED_PATTERNS.store
+    if store is not None and store.path == path:
+        return
+    PARSED_PATTERNS.store = PatternStore(path, maxsize)
+    if store is not None:
+        store.close()
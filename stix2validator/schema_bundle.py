@@ -0,0 +1,87 @@
+"""Bundle all the JSON schemas for a version of STIX into a single file.
+
+When the package is built, setup.py uses this module to write one bundle per
+version of the STIX specification next to the bundled schema directories, so
+that the validator can load every schema for a version with a single read
+instead of opening each schema file (and each file it references) separately.
+
+This module must only depend on the standard library, since setup.py loads it
+before the package's dependencies are installed. Run it as a script to write
+the bundles into a source checkout.
+"""
+
+import io
+import json
+import os
+import sys
+
+FORMAT_VERSION = 1
+
+
+def bundle_path(schema_dir):
+    """Return the path of the bundle of the schemas in `schema_dir`.
+    """
+    return os.path.normpath(schema_dir) + '.json'
+
+
+def build_bundle(schema_dir):
+    """Load every schema in `schema_dir` into a bundle.
+
+    Returns:
+        A list of ``[path, schema]`` pairs, where each path is relative to
+        `schema_dir` and uses ``/`` as its separator.
+    """
+    schemas = []
+    for root, dirnames, filenames in os.walk(schema_dir):
+        # Example STIX content is not schemas; don't descend into it
+        dirnames[:] = sorted(d for d in dirnames if "examples" not in d)
+        for filename in sorted(filenames):
+            if filename.endswith('.json'):
+                path = os.path.join(root, filename)
+                with io.open(path, encoding='utf-8') as schema_file:
+                    schema = json.load(schema_file)
+                relpath = os.path.relpath(path, schema_dir).replace(os.sep, '/')
+                schemas.append([relpath, schema])
+    return schemas
+
+
+def write_bundle(schema_dir, path=None):
+    """Write the bundle of the schemas in `schema_dir` to `path` (by default,
+    the path returned by :func:`bundle_path`).
+    """
+    if path is None:
+        path = bundle_path(schema_dir)
+    with open(path, 'w') as bundle_file:
+        json.dump({
+            'format_version': FORMAT_VERSION,
+            'schemas': build_bundle(schema_dir),
+        }, bundle_file)
+
+
+def read_bundle(schema_dir):
+    """Read the bundle of the schemas in `schema_dir`.
+
+    Returns:
+        A list of ``(path, schema)`` pairs as written by
+        :func:`write_bundle`, with each path joined to `schema_dir`; or None
+        if there is no usable bundle.
+    """
+    try:
+        with open(bundle_path(schema_dir)) as bundle_file:
+            bundle = json.load(bundle_file)
+        if bundle['format_version'] != FORMAT_VERSION:
+            return None
+        return [(os.path.join(schema_dir, *relpath.split('/')), schema)
+                for relpath, schema in bundle['schemas']]
+    except (EnvironmentError, ValueError, KeyError, TypeError):
+        return None
+
+
+def main():
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for version in sys.argv[1:] or ['2.0', '2.1']:
+        write_bundle(os.path.join(package_dir, 'schemas-' + version))
+
+
+if __name__ == '__main__':
+    main()
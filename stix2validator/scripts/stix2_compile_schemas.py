@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""Compile STIX JSON schemas into Python code ahead of time.
+"""
+
+import argparse
+import logging
+import sys
+
+from stix2validator import codes, output
+from stix2validator.validator import SCHEMA_REGISTRY
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile the STIX JSON schemas bundled with the validator "
+                    "(or a directory of custom schemas) into Python code, so "
+                    "that later validation runs need not compile them."
+    )
+    parser.add_argument(
+        "-s",
+        "--schemas",
+        dest="schema_dir",
+        help="Custom schema directory. If not provided, the schemas bundled "
+             "with this package for each version of STIX 2 are compiled."
+    )
+    args = parser.parse_args(sys.argv[1:])
+
+    try:
+        if args.schema_dir:
+            count = SCHEMA_REGISTRY.load_all(schema_dir=args.schema_dir)
+        else:
+            count = sum(SCHEMA_REGISTRY.load_all(version) for version in ('2.0', '2.1'))
+    except Exception as ex:
+        output.error("Fatal error occurred: %s" % str(ex))
+        sys.exit(codes.EXIT_FAILURE)
+
+    logger.info("Compiled %d schemas.", count)
+
+
+if __name__ == '__main__':
+    main()
@@ -220,3 +220,11 @@ class IndicatorTestCases(ValidatorTest):
         results = validate_parsed_json(objects, options)
         assert results[0].is_valid
         assert not results[1].is_valid
+
+    def test_indicator_pattern_limits(self):
+        indicator = copy.deepcopy(self.valid_indicator)
+        indicator['pattern'] = "[file:size = 1 OR file:name = 'a'] FOLLOWEDBY ([file:size > 2])"
+        self.assertTrueWithOptions(indicator, pattern_max_depth=2, pattern_max_comparisons=3)
+        self.assertFalseWithOptions(indicator, pattern_max_depth=1)
+        self.assertFalseWithOptions(indicator, pattern_max_comparisons=2)
+        self.assertFalseWithOptions(indicator, pattern_max_length=20)
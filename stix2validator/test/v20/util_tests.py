@@ -1,5 +1,12 @@
-from ... import parse_args, validate_string
+import json
+import threading
+
+from ... import (ValidationOptions, parse_args, pattern_cache,
+                 validate_instance, validate_string)
+from ...v20 import enums, musts, shoulds
+from ...validator import CheckTable
 from .indicator_tests import VALID_INDICATOR
+from .tool_tests import VALID_TOOL
 
 
 def test_parse_args():
@@ -47,3 +54,82 @@ def test_parse_args_no_files():
 
     results = validate_string(VALID_INDICATOR, options)
     assert results.is_valid
+
+
+def _checks_for(checks, obj_type):
+    calls, walker = checks.for_object({'type': obj_type})
+    return [check for check, needs_options, visits, needs_context in calls]
+
+
+def test_check_table():
+    options = ValidationOptions(version='2.0')
+    checks = CheckTable(shoulds.list_shoulds(options))
+    relationship_checks = _checks_for(checks, 'relationship')
+    assert shoulds.relationships_strict in relationship_checks
+    assert shoulds.extref_hashes in relationship_checks
+    assert not any(check.__name__.startswith('vocab_') for check in relationship_checks)
+    assert shoulds.vocab_malware_label in _checks_for(checks, 'malware')
+    assert shoulds.vocab_hash_algo in _checks_for(checks, 'observed-data')
+    assert relationship_checks == [check for check in checks.checks if check in relationship_checks]
+
+    must_checks = CheckTable(musts.list_musts(options))
+    assert musts.patterns in _checks_for(must_checks, 'indicator')
+    assert musts.patterns not in _checks_for(must_checks, 'x-example')
+    assert musts.object_marking_circular_refs in _checks_for(must_checks, 'marking-definition')
+    assert musts.object_marking_circular_refs not in _checks_for(must_checks, 'indicator')
+
+
+def test_vocabularies():
+    assert shoulds.VOCABULARIES['TOOL_LABEL']['tool'] == (('labels', frozenset(enums.TOOL_LABEL_OV)),)
+    assert 'KILL_CHAIN_PHASE' not in shoulds.VOCABULARIES
+
+    tool = json.loads(VALID_TOOL)
+    assert not list(shoulds.vocab_tool_label(tool))
+    tool['labels'] = ['exploitation', 'something-else']
+    assert len(list(shoulds.vocab_tool_label(tool))) == 1
+
+
+def test_custom_prefix_classes(monkeypatch):
+    monkeypatch.setattr(shoulds, '_PREFIX_CLASSES', {})
+    assert shoulds.prefix_class('property', 'x_example_foo') == shoulds.PREFIX_STRICT
+    assert shoulds.prefix_class('property', 'x_foo') == shoulds.PREFIX_LAX
+    assert shoulds.prefix_class('property', 'foo') == shoulds.PREFIX_INVALID
+    assert shoulds.prefix_class('extension', 'x-example-foo-ext') == shoulds.PREFIX_STRICT
+    assert shoulds.prefix_class('type', 'x-foo') == shoulds.PREFIX_LAX
+
+    tool = json.loads(VALID_TOOL)
+    tool['x_foo'] = 'bar'
+    tool['foo'] = 'bar'
+    strict = [str(error) for error in shoulds.custom_prefix_strict(tool)]
+    lax = [str(error) for error in shoulds.custom_prefix_lax(tool)]
+    assert len(strict) == 2
+    assert len(lax) == 1 and "'foo'" in lax[0]
+    assert strict == [str(error) for error in shoulds.custom_property_prefix_strict(tool)]
+
+
+def test_enum_sets():
+    assert enums.TYPES_SET == frozenset(enums.TYPES)
+    assert enums.PROPERTIES_SETS['indicator'] == frozenset(enums.PROPERTIES['indicator'])
+    assert enums.SOFTWARE_LANG_CODES_SET == frozenset(enums.SOFTWARE_LANG_CODES)
+    assert isinstance(enums.HASH_ALGO_OV_SET, enums.ValueSet)
+
+
+def test_pattern_timeout(monkeypatch):
+    finished = threading.Event()
+
+    def slow_validator(pattern, version):
+        finished.wait(10)
+        return []
+
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', pattern_cache.ParsedPatternCache())
+    monkeypatch.setattr(pattern_cache, 'run_validator', slow_validator)
+    indicator = json.loads(VALID_INDICATOR)
+    options = ValidationOptions(version='2.0', pattern_timeout=0.05)
+    results = validate_instance(indicator, options)
+    assert [error.message for error in results.errors] == [
+        "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f: Pattern failed to validate: "
+        "parsing the pattern took longer than the maximum of 0.05 seconds."
+    ]
+    finished.set()
+    pattern_cache.parse_pattern(indicator['pattern'], '2.0')._thread.join()
+    assert validate_instance(indicator, options).is_valid
@@ -272,3 +272,27 @@ class IndicatorTestCases(ValidatorTest):
         del indicator["pattern_type"]
 
         self.assertFalseWithOptions(indicator)
+
+    def test_indicator_pattern_version_not_string(self):
+        indicator = copy.deepcopy(self.valid_indicator)
+        indicator["pattern_version"] = ["2.1"]
+
+        results = validate_parsed_json(indicator, self.options)
+        self.assertEqual(results.is_valid, False)
+        self.assertEqual(len(results.errors), 1)
+        self.assertIn("pattern_version", results.errors[0].message)
+
+    def test_indicator_pattern_limits(self):
+        indicator = copy.deepcopy(self.valid_indicator)
+        indicator["pattern"] = "([file:size = 1] OR [file:size IN (2, 3)]) AND [file:name = '[(']"
+        self.assertTrueWithOptions(indicator, pattern_max_length=100, pattern_max_depth=3,
+                                   pattern_max_comparisons=3)
+
+        results = validate_parsed_json(indicator, ValidationOptions(pattern_max_length=50))
+        self.assertEqual(results.errors[0].message,
+                         "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f: Pattern failed to validate: "
+                         "the pattern's length of 65 exceeds the maximum of 50.")
+        self.assertFalseWithOptions(indicator, pattern_max_depth=2)
+        self.assertFalseWithOptions(indicator, pattern_max_comparisons=2)
+        self.assertFalseWithOptions(indicator, pattern_max_comparisons=2, strict_types=True,
+                                    strict_properties=True)
@@ -1,4 +1,5 @@
 from io import open
+import json
 import logging
 import os
 import re
@@ -6,8 +7,9 @@ import sys
 
 import pytest
 
-from ... import (NoJSONFileFoundError, ValidationOptions, print_results,
-                 run_validation, validate_file, validate_string)
+from ... import (NoJSONFileFoundError, ValidationOptions, is_valid_instance,
+                 print_results, run_validation, validate_file,
+                 validate_instance, validate_string)
 from .tool_tests import VALID_TOOL
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
@@ -120,6 +122,34 @@ def test_validate_string_invalid_timestamp(caplog):
     assert re.search("'modified' .+ must be later than or equal to 'created'", caplog.text)
 
 
+def _load_example(fn):
+    with open(fn, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_is_valid_instance():
+    assert is_valid_instance(_load_example(IDENTITY))
+    # Schema error
+    assert not is_valid_instance(_load_example(INVALID_IDENTITY))
+    # 'MUST' check error
+    assert not is_valid_instance(_load_example(INVALID_TIMESTAMP))
+    # 'SHOULD' checks are skipped, even in strict mode
+    options = ValidationOptions(strict=True)
+    assert not validate_instance(_load_example(IDENTITY_CUSTOM), options).is_valid
+    assert is_valid_instance(_load_example(IDENTITY_CUSTOM), options)
+
+
+def test_validate_instance_fail_fast():
+    options = ValidationOptions(fail_fast=True)
+    results = validate_instance(_load_example(INVALID_IDENTITY), options)
+    assert not results.is_valid
+    assert results.errors == []
+
+    results = validate_instance(_load_example(IDENTITY_CUSTOM), options)
+    assert results.is_valid
+    assert results.warnings == []
+
+
 def test_print_results_invalid_parameter():
     with pytest.raises(ValueError) as excinfo:
         print_results('these results are valid')
@@ -682,6 +682,12 @@ class ObservedDataTestCases(ValidatorTest):
         observed_data['hashes'][hash_name] = "8D98A25E9D0662B1F4CA3BF22D6F53E9"
         self.assertFalseWithOptions(observed_data)
 
+        observed_data = copy.deepcopy(self.valid_object)
+        hash_name = "x_abcdefghijklmnopqrstuvwxyz0123456789"
+        observed_data['hashes'][hash_name] = "8D98A25E9D0662B1F4CA3BF22D6F53E9"
+        self.assertFalseWithOptions(observed_data)
+        self.check_ignore(observed_data, 'hash-length')
+
     def test_invalid_accessed_timestamp(self):
         observed_data = copy.deepcopy(self.valid_object)
         observed_data['created'] = "2016-11-31T08:17:27.000000Z"
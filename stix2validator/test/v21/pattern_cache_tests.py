@@ -0,0 +1,283 @@
+import json
+import threading
+import time
+
+from ... import (ValidationOptions, parse_args, pattern_cache, run_validation,
+                 validate_instance, validate_parsed_json, validator)
+from .indicator_tests import VALID_INDICATOR
+from .misc_tests import EXAMPLE
+
+
+def test_parsed_pattern_cache(monkeypatch):
+    patterns = pattern_cache.ParsedPatternCache(maxsize=2)
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', patterns)
+    indicator = json.loads(VALID_INDICATOR)
+    options = ValidationOptions(strict_types=True, strict_properties=True)
+    assert validate_instance(indicator, options).is_valid
+    # The MUST check and both strict checks share the results of one parse
+    assert (patterns.hits, patterns.misses) == (3, 1)
+    assert validate_instance(indicator, options).is_valid
+    assert (patterns.hits, patterns.misses) == (7, 1)
+
+    parsed = patterns.get("[file:name = 'a']", '2.1')
+    assert parsed.comparisons == {'file': [(['name'], '=', "'a'")]}
+    assert patterns.get("[file:name = 'a'", '2.1').errors
+    assert len(patterns) == 2
+    # The least recently used pattern is dropped
+    patterns.get(indicator['pattern'], '2.0')
+    assert len(patterns) == 2
+    assert patterns.get("[file:name = 'a']", '2.1') is not parsed
+
+
+def test_pattern_store(monkeypatch, tmp_path):
+    path = str(tmp_path / 'patterns.db')
+    pattern = "[file:name = 'a' AND file:extensions.'ntfs-ext'.alternate_data_streams[*].size > 1]"
+    store = pattern_cache.PatternStore(path, maxsize=10)
+    # Results are keyed by the installed version of stix2patterns
+    assert store._library_version
+    patterns = pattern_cache.ParsedPatternCache(store=store)
+    comparisons = patterns.get(pattern, '2.1').comparisons
+    errors = patterns.get("[file:name = 'a'", '2.1').errors
+    assert errors
+    assert len(store) == 2
+    store.close()
+
+    # A hit in the store skips the parser entirely
+    def fail(*args):
+        raise AssertionError('pattern parsed again')
+    monkeypatch.setattr(pattern_cache, 'run_validator', fail)
+    monkeypatch.setattr(pattern_cache, 'Pattern21', fail)
+    store = pattern_cache.PatternStore(path, maxsize=10)
+    patterns = pattern_cache.ParsedPatternCache(store=store)
+    assert patterns.get(pattern, '2.1').comparisons == comparisons
+    assert patterns.get("[file:name = 'a'", '2.1').errors == errors
+    monkeypatch.undo()
+
+    for i in range(10):
+        patterns.get("[file:size = %d]" % i, '2.1').errors
+    assert len(store) <= 10
+    assert store.load(pattern, '2.1') is None
+    store.close()
+
+
+def test_pattern_store_count(tmp_path):
+    path = str(tmp_path / 'patterns.db')
+    store = pattern_cache.PatternStore(path, maxsize=3)
+    other = pattern_cache.PatternStore(path, maxsize=3)
+    first = pattern_cache.ParsedPattern("[file:size = 0]", '2.1')
+    # Storing a pattern again doesn't count it again
+    for i in range(5):
+        store.save(first)
+    assert len(store) == 1
+    other.save(pattern_cache.ParsedPattern("[file:size = 1]", '2.1'))
+    store.save(pattern_cache.ParsedPattern("[file:size = 2]", '2.1'))
+    assert len(store) == len(other) == 3
+    assert store.load(first.pattern, '2.1') is not None
+
+    # Patterns stored by other processes count towards the maximum
+    other.save(pattern_cache.ParsedPattern("[file:size = 3]", '2.1'))
+    store.save(pattern_cache.ParsedPattern("[file:size = 4]", '2.1'))
+    assert len(store) == 3
+    assert store.load(first.pattern, '2.1') is None
+    store.close()
+    other.close()
+
+    assert parse_args(['--pattern-cache', path]).pattern_cache == path
+
+
+def test_prefetch_patterns(monkeypatch):
+    indicators = []
+    for i, pattern in enumerate(["[file:size = 1]", "[file:size = 2]", "[file:size = ",
+                                 "[x_file:size = 1]", "[file:size = 1]"]):
+        indicator = json.loads(VALID_INDICATOR)
+        indicator['id'] = indicator['id'][:-1] + str(i)
+        indicator['pattern'] = pattern
+        indicators.append(indicator)
+    indicators[1]['pattern_version'] = '2.0'
+    bundle = {
+        "type": "bundle",
+        "id": "bundle--44af6c39-c09b-49c5-9de2-394224b04982",
+        "objects": indicators,
+    }
+    assert sorted(set(validator._pattern_keys(bundle))) == [
+        ("[file:size = ", '2.1'),
+        ("[file:size = 1]", '2.1'),
+        ("[file:size = 2]", '2.0'),
+        ("[file:size = 2]", '2.1'),
+        ("[x_file:size = 1]", '2.1'),
+    ]
+
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', pattern_cache.ParsedPatternCache())
+    expected = validate_parsed_json(bundle, ValidationOptions(version='2.1'))
+
+    patterns = pattern_cache.ParsedPatternCache()
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', patterns)
+    patterns.prefetch(validator._pattern_keys(bundle), 2)
+    assert len(patterns._prefetched) == 5
+    results = validate_parsed_json(bundle, ValidationOptions(version='2.1', pattern_processes=2))
+    assert not results.is_valid
+    assert results.as_dict() == expected.as_dict()
+    # Every check used the prefetched results
+    assert not patterns._prefetched
+    assert len(patterns) == 5
+
+
+def _indicator_bundle(patterns):
+    indicators = []
+    for i, pattern in enumerate(patterns):
+        indicator = json.loads(VALID_INDICATOR)
+        indicator['id'] = indicator['id'][:-1] + str(i)
+        indicator['pattern'] = pattern
+        indicators.append(indicator)
+    return {
+        "type": "bundle",
+        "id": "bundle--44af6c39-c09b-49c5-9de2-394224b04982",
+        "objects": indicators,
+    }
+
+
+def test_prefetch_patterns_timeout(monkeypatch):
+    run_validator = pattern_cache.run_validator
+
+    def slow_validator(pattern, version):
+        if '9' in pattern:
+            time.sleep(5)
+        return run_validator(pattern, version)
+
+    patterns = pattern_cache.ParsedPatternCache()
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', patterns)
+    monkeypatch.setattr(pattern_cache, 'run_validator', slow_validator)
+    bundle = _indicator_bundle(["[file:size = 1]", "[file:size = 9]", "[file:size = 2]"])
+
+    # The pattern which takes too long to parse isn't prefetched
+    patterns.prefetch(validator._pattern_keys(bundle), 2, 0.2)
+    assert sorted(patterns._prefetched) == [("[file:size = 1]", '2.1'), ("[file:size = 2]", '2.1')]
+    patterns.clear()
+
+    # ...so the pattern check still reports it
+    options = ValidationOptions(version='2.1', pattern_timeout=0.2, pattern_processes=2)
+    results = validate_parsed_json(bundle, options)
+    assert [error.message for error in results.errors] == [
+        "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd31: Pattern failed to validate: "
+        "parsing the pattern took longer than the maximum of 0.2 seconds."
+    ]
+
+
+def test_run_validation_pattern_pool(monkeypatch):
+    pools = []
+    pool_class = pattern_cache.multiprocessing.Pool
+
+    def record_pool(*args):
+        pools.append(pool_class(*args))
+        return pools[-1]
+    monkeypatch.setattr(pattern_cache.multiprocessing, 'Pool', record_pool)
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', pattern_cache.ParsedPatternCache())
+    options = ValidationOptions(files=[EXAMPLE, EXAMPLE], pattern_processes=2)
+    assert all(result.is_valid for result in run_validation(options))
+    assert len(pools) == 1
+    assert pattern_cache.PARSED_PATTERNS.pool is None
+
+
+def test_pattern_timeout(monkeypatch):
+    finished = threading.Event()
+
+    def slow_validator(pattern, version):
+        finished.wait(10)
+        return []
+
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', pattern_cache.ParsedPatternCache())
+    monkeypatch.setattr(pattern_cache, 'run_validator', slow_validator)
+    indicator = json.loads(VALID_INDICATOR)
+    options = ValidationOptions(pattern_timeout=0.05, strict_types=True)
+    results = validate_instance(indicator, options)
+    assert [error.message for error in results.errors] == [
+        "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f: Pattern failed to validate: "
+        "parsing the pattern took longer than the maximum of 0.05 seconds."
+    ]
+    # Once parsed, the results are used without waiting
+    finished.set()
+    pattern_cache.parse_pattern(indicator['pattern'], '2.1')._thread.join()
+    assert validate_instance(indicator, options).is_valid
+
+
+def test_pattern_timeout_store(monkeypatch, tmp_path):
+    finished = threading.Event()
+    run_validator = pattern_cache.run_validator
+
+    def slow_validator(pattern, version):
+        finished.wait(10)
+        return run_validator(pattern, version)
+
+    store = pattern_cache.PatternStore(str(tmp_path / 'patterns.db'))
+    patterns = pattern_cache.ParsedPatternCache(store=store)
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', patterns)
+    monkeypatch.setattr(pattern_cache, 'run_validator', slow_validator)
+    indicator = json.loads(VALID_INDICATOR)
+    options = ValidationOptions(pattern_timeout=0.2)
+    # The check doesn't wait for the pattern to be parsed and stored
+    results = validate_instance(indicator, options)
+    assert not finished.is_set()
+    assert [error.message for error in results.errors] == [
+        "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f: Pattern failed to validate: "
+        "parsing the pattern took longer than the maximum of 0.2 seconds."
+    ]
+    assert len(store) == 0
+
+    # The results are stored once the pattern has been parsed
+    finished.set()
+    parsed = patterns.get(indicator['pattern'], '2.1')
+    parsed._thread.join()
+    assert store.load(indicator['pattern'], '2.1').comparisons == parsed.comparisons
+    store.close()
+
+
+def _time_limit_errors(results):
+    return [error.message for error in results.errors if 'took longer' in error.message]
+
+
+def test_pattern_timeout_shared(monkeypatch):
+    now = [1000.0]
+
+    def slow_validator(pattern, version):
+        # Parsing with the declared version uses up the whole time limit
+        if version == '2.0':
+            now[0] += 10
+        return []
+
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', pattern_cache.ParsedPatternCache())
+    monkeypatch.setattr(pattern_cache, 'run_validator', slow_validator)
+    monkeypatch.setattr(pattern_cache.time, 'time', lambda: now[0])
+    indicator = json.loads(VALID_INDICATOR)
+    indicator['pattern_version'] = '2.0'
+    # Parsing the pattern with both versions of the grammar shares the limit,
+    # so parsing it with version 2.1 isn't started
+    results = validate_instance(indicator, ValidationOptions(pattern_timeout=5))
+    assert len(_time_limit_errors(results)) == 1
+    assert pattern_cache.parse_pattern(indicator['pattern'], '2.0').finish(5)
+    assert pattern_cache.parse_pattern(indicator['pattern'], '2.1')._thread is None
+
+
+def test_pattern_parse_threads_bounded(monkeypatch):
+    finished = threading.Event()
+
+    def slow_validator(pattern, version):
+        finished.wait(10)
+        return []
+
+    monkeypatch.setattr(pattern_cache, 'PARSED_PATTERNS', pattern_cache.ParsedPatternCache())
+    monkeypatch.setattr(pattern_cache, 'run_validator', slow_validator)
+    # Once PATTERN_PARSE_THREADS patterns are being parsed in the
+    # background, more aren't started
+    monkeypatch.setattr(pattern_cache, '_PARSE_THREADS', threading.BoundedSemaphore(1))
+    indicator = json.loads(VALID_INDICATOR)
+    options = ValidationOptions(pattern_timeout=0.05)
+    indicator['pattern'] = "[file:size = 1]"
+    assert len(_time_limit_errors(validate_instance(indicator, options))) == 1
+    assert pattern_cache.parse_pattern("[file:size = 1]", '2.1')._thread.is_alive()
+    indicator['pattern'] = "[file:size = 2]"
+    assert len(_time_limit_errors(validate_instance(indicator, options))) == 1
+    assert pattern_cache.parse_pattern("[file:size = 2]", '2.1')._thread is None
+
+    finished.set()
+    pattern_cache.parse_pattern("[file:size = 1]", '2.1')._thread.join()
+    assert validate_instance(indicator, options).is_valid
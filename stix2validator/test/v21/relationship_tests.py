@@ -94,6 +94,18 @@ class RelationshipTestCases(ValidatorTest):
         results = validate_parsed_json(relationship, self.options)
         self.assertTrue(results.is_valid)
 
+    def test_relationship_types_single_target(self):
+        relationship = copy.deepcopy(self.valid_relationship)
+        relationship['source_ref'] = "attack-pattern--31b940d4-6f7f-459a-80ea-9c1f17b5891b"
+        relationship['target_ref'] = "malware--a2576331-d670-4fb3-8ff3-6fb6b4e698b2"
+        relationship['relationship_type'] = "delivers"
+        self.assertTrueWithOptions(relationship)
+
+        # Not accepted as part of the name of the one suggested target type
+        relationship['target_ref'] = "mal--a2576331-d670-4fb3-8ff3-6fb6b4e698b2"
+        self.assertFalseWithOptions(relationship)
+        self.check_ignore(relationship, 'relationship-types')
+
     def test_missing_required(self):
         relationship = copy.deepcopy(self.valid_relationship)
         del relationship['relationship_type']
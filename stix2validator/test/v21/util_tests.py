@@ -1,5 +1,32 @@
-from ... import parse_args, validate_string
+import copy
+from datetime import datetime
+from io import open
+import json
+import os
+import random
+import re
+import sys
+import threading
+
+from jsonschema import Draft7Validator, draft7_format_checker
+import pytest
+
+from ... import (ValidationOptions, compiler, formats, is_valid_instance,
+                 parse_args, schema_bundle, util, validate_instance,
+                 validate_string, validator)
+from ...util import ObjectContext, PropertyWalker, cyber_observable_check
+from ...v21 import enums, musts, shoulds
+from ...v21.errors import JSONError
+from ...validator import (CheckTable, PatternCache, SchemaIndex,
+                          SchemaRegistry, SchemaStore, bundled_schema_dir,
+                          get_schema_index)
 from .indicator_tests import VALID_INDICATOR
+from .misc_tests import IDENTITY, INVALID_IDENTITY, _load_example
+from .observed_data_tests import VALID_OBJECT, VALID_OBSERVED_DATA_DEFINITION
+from .tool_tests import VALID_TOOL
+
+CUSTOM_SCHEMA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                 'test_schemas')
 
 
 def test_parse_args():
@@ -44,3 +71,657 @@ def test_parse_args_no_files():
 
     results = validate_string(VALID_INDICATOR, options)
     assert results.is_valid
+
+
+def test_parse_args_fail_fast():
+    assert parse_args(['--fail-fast']).fail_fast
+    assert not parse_args([]).fail_fast
+
+
+def test_parse_timestamp():
+    assert formats.parse_timestamp('2016-02-29T01:02:03.1234567Z') == datetime(2016, 2, 29, 1, 2, 3, 123456)
+    assert formats.parse_timestamp('2016-02-29') is None
+    with pytest.raises(ValueError) as excinfo:
+        formats.parse_timestamp('2017-02-29T00:00:00Z')
+    assert str(excinfo.value) == 'day is out of range for month: 2017-02-29T00:00:00Z'
+
+    # Leap seconds may only come at the end of a month
+    assert formats.parse_timestamp('2016-12-31T23:59:60.5Z') == datetime(2016, 12, 31, 23, 59, 59, 999999)
+    assert formats.timestamp_key('2016-12-31T23:59:60.5Z') == (2016, 12, 31, 23, 59, 60, '5')
+    with pytest.raises(ValueError) as excinfo:
+        formats.parse_timestamp('2016-12-30T23:59:60Z')
+    assert str(excinfo.value) == 'second must be in 0..59: 2016-12-30T23:59:60Z'
+
+
+def test_timestamp_compare():
+    key = formats.timestamp_key
+    assert key('2016-01-01T00:00:00Z') == key('2016-01-01T00:00:00.000Z')
+    assert key('2016-12-31T23:59:59.9999999Z') < key('2016-12-31T23:59:60Z') < key('2017-01-01T00:00:00Z')
+    assert key('2016-01-01T00:00:00.05Z') < key('2016-01-01T00:00:00.1Z')
+
+    indicator = {
+        'type': 'indicator',
+        'id': 'indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f',
+        'created': '2016-04-06T20:03:48Z',
+        'modified': '2016-04-06T20:03:48.000Z',
+        'valid_from': '2016-04-06T20:03:48.1Z',
+        'valid_until': '2016-04-06T20:03:48.10Z',
+    }
+    errors = [str(error) for error in musts.timestamp_compare(indicator, ObjectContext(indicator))]
+    assert errors == ["'valid_until' (2016-04-06T20:03:48.10Z) must be later than "
+                      "'valid_from' (2016-04-06T20:03:48.1Z)"]
+
+
+def test_timestamp_parsed_once(monkeypatch):
+    parsed = []
+    parse_timestamp = formats._parse_timestamp
+
+    def record_parse_timestamp(value):
+        parsed.append(value)
+        return parse_timestamp(value)
+    monkeypatch.setattr(formats, '_parse_timestamp', record_parse_timestamp)
+    monkeypatch.setattr(formats, '_TIMESTAMPS', {})
+
+    identity = _load_example(IDENTITY)
+    identity['created'] = identity['modified'] = '2016-02-30T00:00:00.000Z'
+    results = validate_instance(identity)
+    assert not results.is_valid
+    assert "'created': '2016-02-30T00:00:00.000Z' is not a valid timestamp: day is out of range for month" in results.errors[0].message
+    assert parsed == ['2016-02-30T00:00:00.000Z']
+
+
+def test_format_checkers():
+    schema = {
+        'properties': {
+            'id': {'format': 'stix-identifier'},
+            'created': {'format': 'stix-timestamp-millis'},
+            'start': {'format': 'stix-timestamp'},
+        },
+    }
+    format_validator = Draft7Validator(schema, format_checker=draft7_format_checker)
+    assert format_validator.is_valid({
+        'id': 'identity--8c6af861-7b20-41ef-9b59-6344fd872a8f',
+        'created': '2016-08-08T15:50:10.983Z',
+        'start': '2016-08-08T15:50:10Z',
+    })
+    errors = format_validator.iter_errors({
+        'id': 'identity--8c6af861',
+        'created': '2016-08-08T15:50:10Z',
+        'start': '2016-08-32T15:50:10Z',
+    })
+    assert sorted(error.path[0] for error in errors) == ['created', 'id', 'start']
+
+
+def test_schema_registry_reuses_validators():
+    registry = SchemaRegistry()
+    schema_dir = bundled_schema_dir('2.1')
+    validator = registry.get_validator(schema_dir, 'identity')
+    assert validator is registry.get_validator(schema_dir, 'identity')
+
+    # Custom types without a schema share the default schema's validator
+    custom = registry.get_validator(schema_dir, 'x-example-com-customobject')
+    assert custom is registry.get_validator(schema_dir, 'core')
+    assert registry.get_validator(schema_dir, 'x-example', 'x-no-such-schema') is None
+
+
+def test_schema_registry_load_all():
+    registry = SchemaRegistry()
+    num_schemas = registry.load_all('2.1')
+    num_validators = len(registry)
+    assert num_validators > 1
+    assert num_schemas == len(get_schema_index(bundled_schema_dir('2.1')).schemas)
+
+    registry.get_validator(bundled_schema_dir('2.1'), 'indicator')
+    registry.get_validator(bundled_schema_dir('2.1'), 'x-custom', 'cyber-observable-core')
+    assert len(registry) == num_validators
+
+
+def test_schema_index(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.mkdir('cache'))
+    monkeypatch.setattr(validator, 'get_cache_dir', lambda: cache_dir)
+    schema_dir = tmpdir.mkdir('schemas')
+    schema_dir.mkdir('sdos').join('x-foo.json').write('{}')
+    schema_dir.mkdir('examples').join('x-bar.json').write('{}')
+
+    index = SchemaIndex.load(str(schema_dir))
+    assert index.find('x-foo') == str(schema_dir.join('sdos', 'x-foo.json'))
+    assert index.find('x-bar') is None
+    assert os.path.exists(SchemaIndex.index_path(str(schema_dir)))
+
+    # The saved index is reused while the directory is unchanged...
+    with monkeypatch.context() as m:
+        m.setattr(SchemaIndex, 'build', None)
+        assert SchemaIndex.load(str(schema_dir)).schemas == index.schemas
+
+    # ...and rebuilt once it has been modified
+    schema_dir.join('sdos', 'x-bar.json').write('{}')
+    os.utime(str(schema_dir.join('sdos')), (0, 0))
+    assert not index.is_current()
+    index = SchemaIndex.load(str(schema_dir))
+    assert index.find('x-bar') == str(schema_dir.join('sdos', 'x-bar.json'))
+
+
+def test_schema_registry_clear(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.mkdir('cache'))
+    monkeypatch.setattr(validator, 'get_cache_dir', lambda: cache_dir)
+    monkeypatch.setattr(compiler, 'get_cache_dir', lambda: cache_dir)
+    schema_dir = tmpdir.mkdir('schemas')
+    schema_dir.mkdir('sdos').join('x-foo.json').write('{"type": "object"}')
+    registry = SchemaRegistry()
+    assert registry.get_validator(str(schema_dir), 'x-foo') is not None
+    assert registry.get_validator(str(schema_dir), 'x-bar') is None
+
+    # Schemas added while the process runs are found once it is cleared
+    schema_dir.join('sdos', 'x-bar.json').write('{"type": "object"}')
+    os.utime(str(schema_dir.join('sdos')), (0, 0))
+    assert registry.get_validator(str(schema_dir), 'x-bar') is None
+    registry.clear()
+    assert registry.get_validator(str(schema_dir), 'x-bar') is not None
+
+
+def test_schema_bundle(tmpdir, monkeypatch):
+    schema_dir = tmpdir.mkdir('schemas-2.1')
+    schema_path = schema_dir.mkdir('sdos').join('x-foo.json')
+    schema_path.write('{"$id": "http://example.com/schemas/sdos/x-foo.json", "type": "object"}')
+    schema_dir.mkdir('examples').join('x-bar.json').write('{}')
+    schema = {"$id": "http://example.com/schemas/sdos/x-foo.json", "type": "object"}
+
+    schema_bundle.write_bundle(str(schema_dir))
+    assert schema_bundle.read_bundle(str(schema_dir)) == [(str(schema_path), schema)]
+
+    monkeypatch.setattr(validator, 'bundled_schema_dir', lambda version: str(schema_dir))
+    for cache in ('_SCHEMA_BUNDLES', '_BUNDLED_SCHEMAS', '_SCHEMA_INDEXES'):
+        monkeypatch.setattr(validator, cache, {})
+    assert validator.find_schema(str(schema_dir), 'x-foo') == str(schema_path)
+    assert validator.find_schema(str(schema_dir), 'x-bar') is None
+    assert SchemaStore.from_dir(str(schema_dir))[schema['$id']] == schema
+
+    # Bundled schemas are not read from their files
+    schema_path.remove()
+    assert validator.load_schema(str(schema_path)) == schema
+
+
+def _error_details(errors):
+    return [(e.message, list(e.path), list(e.schema_path), e.validator, e.schema,
+             [c.message for c in e.context]) for e in errors]
+
+
+def test_compiled_validator(tmpdir, monkeypatch):
+    monkeypatch.setattr(compiler, 'get_cache_dir', lambda: str(tmpdir))
+    schema_dir = bundled_schema_dir('2.1')
+    generic = SchemaRegistry(compile_schemas=False).get_validator(schema_dir, 'indicator')
+    compiled = SchemaRegistry().get_validator(schema_dir, 'indicator')
+    assert isinstance(compiled, compiler.CompiledValidator)
+
+    indicator = {
+        "type": "indicator",
+        "spec_version": "2.1",
+        "id": "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f",
+        "created": "2016-04-06T20:03:48.000Z",
+        "modified": "2016-04-06T20:03:48.000Z",
+        "indicator_types": ["malicious-activity"],
+        "pattern": "[file:hashes.MD5 = 'd41d8cd98f00b204e9800998ecf8427e']",
+        "pattern_type": "stix",
+        "valid_from": "2016-01-01T00:00:00Z",
+    }
+    assert compiled.is_valid(indicator)
+    assert list(compiled.iter_errors(indicator)) == []
+
+    indicator.update({
+        "id": "malware--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f",
+        "modified": "yesterday",
+        "kill_chain_phases": [{"kill_chain_name": "foo"}],
+        "granular_markings": [{"selectors": []}],
+        "Invalid": True,
+    })
+    del indicator["pattern"]
+    assert not compiled.is_valid(indicator)
+    assert _error_details(compiled.iter_errors(indicator)) == _error_details(generic.iter_errors(indicator))
+
+
+def test_schema_errors_only_collected_for_invalid_objects(monkeypatch):
+    registry = SchemaRegistry()
+    monkeypatch.setattr(validator, 'SCHEMA_REGISTRY', registry)
+    schema_validator = registry.get_validator(bundled_schema_dir('2.1'), 'identity')
+    iter_errors = schema_validator.iter_errors
+    checked = []
+
+    def record_iter_errors(instance):
+        checked.append(instance)
+        return iter_errors(instance)
+    monkeypatch.setattr(schema_validator, 'iter_errors', record_iter_errors)
+
+    assert validate_instance(_load_example(IDENTITY)).is_valid
+    assert checked == []
+
+    invalid_identity = _load_example(INVALID_IDENTITY)
+    results = validate_instance(invalid_identity)
+    assert checked == [invalid_identity]
+    assert len(results.errors) == 1
+
+    # No details are collected in fail-fast mode
+    del checked[:]
+    assert not is_valid_instance(invalid_identity)
+    assert not validate_instance(invalid_identity, ValidationOptions(fail_fast=True)).is_valid
+    assert checked == []
+
+
+def test_compiled_validator_cache(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.mkdir('cache'))
+    monkeypatch.setattr(compiler, 'get_cache_dir', lambda: cache_dir)
+    schema_dir = tmpdir.mkdir('schemas')
+    schema_dir.mkdir('common').join('x-name.json').write(
+        '{"$id": "http://example.com/schemas/common/x-name.json", "type": "string", "minLength": 2}')
+    schema_path = schema_dir.mkdir('sdos').join('x-foo.json')
+    schema_path.write(
+        '{"$id": "http://example.com/schemas/sdos/x-foo.json", "type": "object",'
+        ' "properties": {"name": {"$ref": "../common/x-name.json"}}}')
+
+    foo = SchemaRegistry().get_validator(str(schema_dir), 'x-foo')
+    assert isinstance(foo, compiler.CompiledValidator)
+    assert [e.message for e in foo.iter_errors({"name": "a"})] == ["'a' is too short"]
+    assert os.path.exists(compiler.compiled_path(str(schema_path)))
+
+    # The saved code is reused while the schemas it was compiled from are
+    # unchanged...
+    with monkeypatch.context() as m:
+        m.setattr(compiler.SchemaCompiler, 'compile', None)
+        foo = SchemaRegistry().get_validator(str(schema_dir), 'x-foo')
+        assert isinstance(foo, compiler.CompiledValidator)
+        assert not foo.is_valid({"name": "a"})
+
+    # ...and regenerated once one of them has been modified, even if its
+    # modification time is unchanged
+    name_path = str(schema_dir.join('common', 'x-name.json'))
+    mtime = os.stat(name_path).st_mtime
+    schema_dir.join('common', 'x-name.json').write(
+        '{"$id": "http://example.com/schemas/common/x-name.json", "type": "string", "minLength": 3}')
+    os.utime(name_path, (mtime, mtime))
+    assert compiler._load_compiled(str(schema_path)) is None
+    foo = SchemaRegistry().get_validator(str(schema_dir), 'x-foo')
+    assert [e.message for e in foo.iter_errors({"name": "ab"})] == ["'ab' is too short"]
+
+    os.utime(name_path, (0, 0))
+    assert compiler._load_compiled(str(schema_path)) is None
+
+
+def test_compiled_validator_cache_bundle(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.mkdir('cache'))
+    monkeypatch.setattr(compiler, 'get_cache_dir', lambda: cache_dir)
+    schema_dir = tmpdir.mkdir('schemas')
+    schema_dir.mkdir('common').join('x-name.json').write(
+        '{"$id": "http://example.com/schemas/common/x-name.json", "type": "string"}')
+    schema_path = schema_dir.mkdir('sdos').join('x-foo.json')
+    schema_path.write(
+        '{"$id": "http://example.com/schemas/sdos/x-foo.json", "type": "object",'
+        ' "properties": {"name": {"$ref": "../common/x-name.json"}}}')
+    bundle_path = schema_bundle.bundle_path(str(schema_dir))
+    schema_bundle.write_bundle(str(schema_dir), bundle_path)
+    monkeypatch.setattr(compiler, '_SCHEMA_BUNDLE_PATHS', {str(schema_dir) + os.sep: bundle_path})
+    monkeypatch.setattr(compiler, '_BUNDLE_HASHES', {})
+
+    SchemaRegistry().get_validator(str(schema_dir), 'x-foo')
+    # Only the bundle is checked for changes to the schemas in it
+    with open(compiler.compiled_path(str(schema_path))) as compiled_file:
+        assert list(json.load(compiled_file)['sources']) == [bundle_path]
+    assert compiler._load_compiled(str(schema_path)) is not None
+    assert list(compiler._BUNDLE_HASHES) == [bundle_path]
+
+    with open(bundle_path, 'a') as bundle_file:
+        bundle_file.write(' ')
+    assert compiler._load_compiled(str(schema_path)) is None
+
+
+def test_compiled_validator_cache_tampered(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.mkdir('cache'))
+    monkeypatch.setattr(compiler, 'get_cache_dir', lambda: cache_dir)
+    schema_path = tmpdir.mkdir('schemas').join('x-foo.json')
+    schema_path.write('{"$id": "http://example.com/schemas/x-foo.json", "type": "object"}')
+    SchemaRegistry().get_validator(str(tmpdir.join('schemas')), 'x-foo')
+    path = compiler.compiled_path(str(schema_path))
+    assert compiler._load_compiled(str(schema_path)) is not None
+
+    # Saved code which has been changed is not run...
+    with open(path) as compiled_file:
+        compiled = json.load(compiled_file)
+    compiled['source'] += '\nraise AssertionError("saved code run")\n'
+    os.remove(path)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600), 'w') as compiled_file:
+        json.dump(compiled, compiled_file)
+    assert compiler._load_compiled(str(schema_path)) is None
+    assert SchemaRegistry().get_validator(str(tmpdir.join('schemas')), 'x-foo').is_valid({})
+
+    # ...nor is saved code which other users could have changed
+    if hasattr(os, 'getuid'):
+        assert compiler._load_compiled(str(schema_path)) is not None
+        os.chmod(path, 0o666)
+        assert compiler._load_compiled(str(schema_path)) is None
+
+
+@pytest.mark.parametrize('compile_schemas', [True, False])
+def test_pattern_cache(compile_schemas):
+    registry = SchemaRegistry(compile_schemas)
+    schema_dir = bundled_schema_dir('2.1')
+    identifier = registry.get_validator(schema_dir, 'identifier')
+    assert len(registry.patterns) > 100
+
+    # Every pattern used while validating was compiled ahead of time
+    misses = registry.patterns.misses
+    assert identifier.is_valid('indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f')
+    errors = list(identifier.iter_errors('indicator--not-a-uuid'))
+    assert [error.validator for error in errors] == ['pattern']
+    assert registry.patterns.misses == misses
+    assert registry.patterns.hits > 0
+
+
+def test_pattern_cache_bounded():
+    patterns = PatternCache(maxsize=2)
+    patterns.add_schema({'properties': {'pattern': {'pattern': '^a'}}, 'patternProperties': {'^b': {}}})
+    assert len(patterns) == 2
+    assert patterns.compile('^a').search('abc')
+    assert (patterns.hits, patterns.misses) == (1, 0)
+
+    assert patterns.compile('^c').search('cde')
+    assert (patterns.hits, patterns.misses) == (1, 1)
+    assert len(patterns) == 1
+
+
+def _checks_for(checks, obj_type):
+    calls, walker = checks.for_object({'type': obj_type})
+    return [check for check, needs_options, visits, needs_context in calls]
+
+
+def test_check_table():
+    options = ValidationOptions(version='2.1')
+    checks = CheckTable(shoulds.list_shoulds(options))
+    relationship_checks = _checks_for(checks, 'relationship')
+    assert shoulds.relationships_strict in relationship_checks
+    assert shoulds.extref_hashes in relationship_checks
+    assert not any(check.__name__.startswith('vocab_') for check in relationship_checks)
+    assert shoulds.vocab_malware_types in _checks_for(checks, 'malware')
+    assert shoulds.vocab_hash_algo in _checks_for(checks, 'file')
+    assert shoulds.vocab_hash_algo in _checks_for(checks, 'observed-data')
+    # Checks keep their order
+    assert relationship_checks == [check for check in checks.checks if check in relationship_checks]
+
+    must_checks = CheckTable(musts.list_musts(options))
+    assert musts.patterns in _checks_for(must_checks, 'indicator')
+    assert musts.process not in _checks_for(must_checks, 'indicator')
+    assert musts.patterns not in _checks_for(must_checks, 'x-example')
+    assert _checks_for(must_checks, ['indicator']) == must_checks.checks
+    calls, walker = must_checks.for_object({'type': 'indicator'})
+    assert walker is None
+    needs_options = dict((check, needs) for check, needs, visits, needs_context in calls)
+    assert needs_options[musts.patterns]
+    assert not needs_options[musts.timestamp]
+
+
+def test_object_context(monkeypatch):
+    process = {
+        'type': 'process',
+        'spec_version': '2.1',
+        'id': 'process--f52a906a-0dfc-40bd-92f1-e7778ead38a9',
+        'pid': 1221,
+    }
+    context = ObjectContext(process)
+    assert context.uuid.version == 4
+    assert context.has_cyber_observable_data('2.1')
+    assert not context.has_cyber_observable_data('2.0')
+
+    # The 'MUST' and 'SHOULD' checks share one context for each object
+    parsed = []
+    original_uuid = util.uuid.UUID
+
+    def record_uuid(value):
+        parsed.append(value)
+        return original_uuid(value)
+
+    monkeypatch.setattr(util.uuid, 'UUID', record_uuid)
+    assert validate_instance(process, ValidationOptions(version='2.1')).is_valid
+    assert parsed == ['f52a906a-0dfc-40bd-92f1-e7778ead38a9']
+
+    process['id'] = 'process--f52a906a-0dfc-50bd-92f1-e7778ead38a9'
+    results = validate_instance(process, ValidationOptions(version='2.1'))
+    assert not results.is_valid
+    assert len(results.errors) == 1
+
+
+def test_property_walker():
+    walker = PropertyWalker(shoulds.HASHES_PATHS)
+    observable = json.loads(VALID_OBJECT)
+    observable['extensions'] = {
+        'ntfs-ext': {'alternate_data_streams': [{'name': 'second.stream'}]},
+        'windows-pebinary-ext': {'pe_type': 'exe', 'optional_header': {'hashes': {'SHA-256': 'abc'}}},
+    }
+    assert walker.walk(observable) == {
+        shoulds.HASHES_PATH: observable['hashes'],
+        shoulds.NTFS_ADS_PATH: [{'name': 'second.stream'}],
+        shoulds.PE_OPTIONAL_HEADER_HASHES_PATH: {'SHA-256': 'abc'},
+    }
+    assert walker.walk({'type': 'file', 'extensions': ['ntfs-ext']}) == {}
+
+    checks = CheckTable(shoulds.list_shoulds(ValidationOptions(version='2.1')))
+    calls, walker = checks.for_object({'type': 'file'})
+    assert walker.walk(observable) == PropertyWalker(shoulds.HASHES_PATHS).walk(observable)
+    calls, walker = checks.for_object({'type': 'relationship'})
+    assert walker is None
+
+    # The checks which visit the hashes can still be called directly
+    observable['hashes']['sha-256'] = 'abc'
+    observable['hashes']['x' * 31] = 'abc'
+    assert len(list(shoulds.vocab_hash_algo(observable))) == 2
+    assert len(list(shoulds.hash_length(observable))) == 1
+
+
+def test_check_type_errors_not_swallowed():
+    def check(instance):
+        raise TypeError('bug in check')
+
+    with pytest.raises(TypeError, match='bug in check'):
+        list(validator._iter_errors_custom({'type': 'indicator'}, [check], ValidationOptions()))
+
+
+def test_cyber_observable_check_runs_once():
+    calls = []
+
+    @cyber_observable_check("2.1")
+    def check(instance):
+        calls.append(instance['id'])
+        return JSONError("Checked.", instance['id'])
+
+    observed_data = json.loads(VALID_OBSERVED_DATA_DEFINITION)
+    observed_data['objects'] = dict((str(i), {'type': 'x-example'}) for i in range(10))
+    assert len(list(check(observed_data))) == 1
+    assert calls == [observed_data['id']]
+
+    assert list(check(json.loads(VALID_TOOL))) == []
+    assert len(calls) == 1
+
+
+def test_vocabularies():
+    assert shoulds.VOCABULARIES['TOOL_TYPE']['tool'] == (('tool_types', frozenset(enums.TOOL_TYPE_OV)),)
+    assert 'KILL_CHAIN_PHASE' not in shoulds.VOCABULARIES
+
+    tool = json.loads(VALID_TOOL)
+    assert not list(shoulds.vocab_tool_types(tool))
+    tool['tool_types'] = ['exploitation', 'something-else']
+    assert len(list(shoulds.vocab_tool_types(tool))) == 1
+    tool['tool_types'] = [{'exploitation': 1}]
+    assert len(list(shoulds.vocab_tool_types(tool))) == 1
+
+
+def test_custom_prefix_classes(monkeypatch):
+    monkeypatch.setattr(shoulds, '_PREFIX_CLASSES', {})
+    assert shoulds.prefix_class('property', 'x_example_foo') == shoulds.PREFIX_STRICT
+    assert shoulds.prefix_class('property', 'x_foo') == shoulds.PREFIX_LAX
+    assert shoulds.prefix_class('property', 'foo') == shoulds.PREFIX_INVALID
+    assert shoulds.prefix_class('extension', 'x-example-foo-ext') == shoulds.PREFIX_STRICT
+    assert shoulds.prefix_class('type', 'x-foo') == shoulds.PREFIX_LAX
+    assert len(shoulds._PREFIX_CLASSES) == 5
+
+    tool = json.loads(VALID_TOOL)
+    tool['x_foo'] = 'bar'
+    tool['foo'] = 'bar'
+    strict = [str(error) for error in shoulds.custom_prefix_strict(tool)]
+    lax = [str(error) for error in shoulds.custom_prefix_lax(tool)]
+    assert len(strict) == 2
+    assert len(lax) == 1 and "'foo'" in lax[0]
+    assert strict == [str(error) for error in shoulds.custom_property_prefix_strict(tool)]
+
+
+def test_enum_sets():
+    assert enums.TYPES_SET == frozenset(enums.TYPES)
+    assert enums.PROPERTIES_SETS['indicator'] == frozenset(enums.PROPERTIES['indicator'])
+    assert enums.OBSERVABLE_EXTENSIONS_SETS['file'] == frozenset(enums.OBSERVABLE_EXTENSIONS['file'])
+    assert {'name': 'x'} not in enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES_SETS['ntfs-ext']['alternate_data_streams']
+
+    # Every table the checks test for membership of is a set form; these
+    # are iterated over in order
+    ordered = ('MARKING_DEFINITION_TYPES', 'VOCAB_PROPERTIES', 'DEPRECATED_PROPERTIES',
+               'OBSERVABLE_PROP_REFS', 'TIMESTAMP_PROPERTIES', 'TIMESTAMP_COMPARE', 'TIMESTAMP_OBSERVABLE_PROPERTIES',
+               'TIMESTAMP_COMPARE_OBSERVABLE', 'CHECK_CODES')
+    for module in (musts, shoulds):
+        with open(module.__file__.replace('.pyc', '.py'), encoding='utf-8') as source:
+            names = set(re.findall(r'\benums\.([A-Z_]+)\b', source.read()))
+        for name in names:
+            table = getattr(enums, name)
+            if name in ordered or name.endswith('_USES'):
+                continue
+            if isinstance(table, dict):
+                assert all(isinstance(value, (enums.ValueSet, dict)) for value in table.values()), name
+            else:
+                assert isinstance(table, enums.ValueSet), name
+
+
+def test_check_tables_cached(monkeypatch):
+    calls = []
+    original_list_shoulds = shoulds.list_shoulds
+
+    def list_shoulds(options):
+        calls.append(options)
+        return original_list_shoulds(options)
+
+    monkeypatch.setattr(shoulds, 'list_shoulds', list_shoulds)
+    monkeypatch.setattr(validator, '_CHECK_TABLES', {})
+    tool = json.loads(VALID_TOOL)
+    options = ValidationOptions(version='2.1', disabled='tool-types')
+    validate_instance(tool, options)
+    results = validate_instance(tool, ValidationOptions(version='2.1', disabled='tool-types'))
+    assert len(calls) == 1
+    assert results.is_valid
+
+    tool['tool_types'] = ['something-else']
+    assert not validate_instance(tool, options).warnings
+    options.disabled = []
+    assert validate_instance(tool, options).warnings
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('compile_schemas', [True, False])
+def test_merged_schemas(monkeypatch, compile_schemas):
+    registry = SchemaRegistry(compile_schemas)
+    monkeypatch.setattr(validator, 'SCHEMA_REGISTRY', registry)
+    observable = json.loads(VALID_OBJECT)
+    # Checking media types needs network access
+    del observable['mime_type']
+    observable['extensions']['x-example-com-foobar-ext'] = {'bar_value': 'foo'}
+    observable['size'] = -1
+    indicator = {
+        "type": "indicator",
+        "spec_version": "2.1",
+        "id": "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f",
+        "created": "2016-04-06T20:03:48.000Z",
+        "modified": "2016-04-06T20:03:48.000Z",
+        "name": "Not Foobar",
+        "pattern_type": "stix",
+        "valid_from": "2016-01-01T00:00:00Z",
+    }
+
+    for instance in [observable, indicator]:
+        separate = validate_instance(instance, ValidationOptions(schema_dir=CUSTOM_SCHEMA_DIR))
+        merged = validate_instance(instance, ValidationOptions(schema_dir=CUSTOM_SCHEMA_DIR, merge_schemas=True))
+        assert len(merged.errors) == 2
+        assert [e.message for e in merged.errors] == [e.message for e in separate.errors]
+
+    # Errors can be told apart by the schema they were found with
+    merged_validator = registry.get_merged_validator(bundled_schema_dir('2.1'), CUSTOM_SCHEMA_DIR, 'indicator')
+    errors = merged_validator.iter_errors(indicator)
+    assert sorted((e.schema_path[1], e.validator) for e in errors) == [(0, 'required'), (1, 'pattern')]
+    assert merged_validator is registry.get_merged_validator(bundled_schema_dir('2.1'), CUSTOM_SCHEMA_DIR, 'indicator')
+
+    # Types without a custom schema only use the bundled one
+    assert (registry.get_merged_validator(bundled_schema_dir('2.1'), CUSTOM_SCHEMA_DIR, 'tool', 'x-no-such-schema') is
+            registry.get_validator(bundled_schema_dir('2.1'), 'tool'))
+
+
+def test_schema_store():
+    registry = SchemaRegistry()
+    store = registry.get_store(bundled_schema_dir('2.1'))
+    assert store is registry.get_store(bundled_schema_dir('2.1'))
+    core_id = 'http://raw.githubusercontent.com/oasis-open/cti-stix2-json-schemas/stix2.1/schemas/common/core.json'
+    assert store[core_id]['title'] == 'core'
+
+    # Custom schema directories get a copy, extended with their own schemas
+    custom = registry.get_store(CUSTOM_SCHEMA_DIR)
+    assert custom[core_id] is store[core_id]
+    assert len(custom) > len(store)
+    with pytest.raises(TypeError):
+        store[core_id] = {}
+
+    # Schemas loaded by validators are only added to their own copy
+    indicator = registry.get_validator(bundled_schema_dir('2.1'), 'indicator')
+    assert indicator.validator.resolver.store is not store
+
+
+@pytest.mark.parametrize('compile_schemas', [True, False])
+def test_concurrent_validation(monkeypatch, compile_schemas):
+    observable = json.loads(VALID_OBJECT)
+    # Checking media types needs network access
+    del observable['mime_type']
+    invalid_observable = copy.deepcopy(observable)
+    invalid_observable['extensions']['ntfs-ext']['alternate_data_streams'][0]['size'] = -1
+    invalid_observable['hashes'] = {'MD5': 'not a hash'}
+    with open(IDENTITY, encoding='utf-8') as f:
+        identity = json.load(f)
+    with open(INVALID_IDENTITY, encoding='utf-8') as f:
+        invalid_identity = json.load(f)
+    instances = [json.loads(VALID_OBSERVED_DATA_DEFINITION), observable,
+                 invalid_observable, identity, invalid_identity]
+    options = ValidationOptions(schema_dir=CUSTOM_SCHEMA_DIR)
+
+    def validate_all():
+        return [validate_instance(instance, options).as_dict() for instance in instances]
+
+    monkeypatch.setattr(validator, 'SCHEMA_REGISTRY', SchemaRegistry(compile_schemas))
+    expected = validate_all()
+
+    # Start from an empty registry, so that threads also race to load schemas
+    monkeypatch.setattr(validator, 'SCHEMA_REGISTRY', SchemaRegistry(compile_schemas))
+    failures = []
+    # Switch threads often, so that they interleave inside schema resolution
+    if hasattr(sys, 'setswitchinterval'):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def run():
+        order = list(range(len(instances)))
+        try:
+            for _ in range(20):
+                random.shuffle(order)
+                for i in order:
+                    result = validate_instance(instances[i], options).as_dict()
+                    if result != expected[i]:
+                        failures.append((i, result))
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if hasattr(sys, 'setswitchinterval'):
+            sys.setswitchinterval(interval)
+    assert failures == []
@@ -6,14 +6,16 @@ import errno
 import os
 import sys
 import textwrap
+import uuid
 
 from appdirs import AppDirs
 import requests_cache
 
+from .formats import timestamp_key
 from .output import set_level, set_silent
 from .v20.enums import CHECK_CODES as CHECK_CODES20
 from .v21.enums import CHECK_CODES as CHECK_CODES21
-from .v21.enums import OBSERVABLE_TYPES as OBSERVABLE_TYPES21
+from .v21.enums import OBSERVABLE_TYPES_SET as OBSERVABLE_TYPES21
 
 DEFAULT_VER = "2.1"
 
@@ -191,6 +193,15 @@ def parse_args(cmd_args, is_script=False):
              "against these schemas in addition to the STIX schemas bundled "
              "with this script."
     )
+    parser.add_argument(
+        "--merge-schemas",
+        dest="merge_schemas",
+        action="store_true",
+        default=False,
+        help="Check each object against the bundled STIX schema and the "
+             "custom schema (see --schemas) for its type in a single pass, "
+             "instead of one after the other."
+    )
     parser.add_argument(
         "--version",
         dest="version",
@@ -292,6 +303,61 @@ def parse_args(cmd_args, is_script=False):
         help="Clear the cache of external source values after validation."
     )
 
+    parser.add_argument(
+        "--pattern-cache",
+        dest="pattern_cache",
+        default=None,
+        help="Path of an sqlite database in which to keep the results of "
+             "parsing indicator patterns, so that later runs need not parse "
+             "the same patterns again. It is created if it doesn't exist."
+    )
+
+    parser.add_argument(
+        "--pattern-processes",
+        dest="pattern_processes",
+        type=int,
+        default=0,
+        help="Parse the patterns of the indicators in each input up front, "
+             "across this many worker processes. Useful for inputs with many "
+             "indicators."
+    )
+
+    parser.add_argument(
+        "--pattern-max-length",
+        dest="pattern_max_length",
+        type=int,
+        default=None,
+        help="Report indicator patterns longer than this many characters as "
+             "errors, without parsing them."
+    )
+
+    parser.add_argument(
+        "--pattern-max-depth",
+        dest="pattern_max_depth",
+        type=int,
+        default=None,
+        help="Report indicator patterns with brackets and parentheses nested "
+             "deeper than this as errors, without parsing them."
+    )
+
+    parser.add_argument(
+        "--pattern-max-comparisons",
+        dest="pattern_max_comparisons",
+        type=int,
+        default=None,
+        help="Report indicator patterns with more than this many comparisons "
+             "as errors, without parsing them."
+    )
+
+    parser.add_argument(
+        "--pattern-timeout",
+        dest="pattern_timeout",
+        type=float,
+        default=None,
+        help="Report indicator patterns which take longer than this many "
+             "seconds to parse as errors."
+    )
+
     parser.add_argument(
         "--enforce-refs",
         dest="enforce_refs",
@@ -301,6 +367,16 @@ def parse_args(cmd_args, is_script=False):
              "within the same bundle."
     )
 
+    parser.add_argument(
+        "--fail-fast",
+        dest="fail_fast",
+        action="store_true",
+        default=False,
+        help="Stop validating each object at the first error found, and only "
+             "report whether it is valid. Recommended best practice checks "
+             "are skipped, and no error messages are reported."
+    )
+
     args = parser.parse_args(cmd_args)
 
     if not is_script:
@@ -330,6 +406,9 @@ class ValidationOptions(object):
             validated.
         recursive: Recursively descend into input directories.
         schema_dir: A user-defined schema directory to validate against.
+        merge_schemas: Specifies that each object should be checked against
+            the bundled and user-defined schemas for its type in a single
+            pass.
         disabled: List of "SHOULD" checks that will be skipped.
         enabled: List of "SHOULD" checks that will be performed.
         strict: Specifies that recommended requirements should produce errors
@@ -345,15 +424,34 @@ class ValidationOptions(object):
             validation.
         clear_cache: Specifies that the cache of values from external sources
             should be cleared after validation.
+        pattern_cache: Path of an sqlite database in which the results of
+            parsing indicator patterns are kept between runs.
+        pattern_processes: If more than 1, the patterns of the indicators in
+            each input are parsed up front across this many worker processes.
+        pattern_max_length: Maximum length of indicator patterns.
+        pattern_max_depth: Maximum nesting depth of the brackets and
+            parentheses in indicator patterns.
+        pattern_max_comparisons: Maximum number of comparisons in indicator
+            patterns.
+        pattern_timeout: Maximum number of seconds to spend parsing each
+            indicator pattern. Parses which time out carry on in the
+            background (see stix2validator.pattern_cache).
         enforce_refs:Ensures that all SDOs being referenced by the SRO are
             contained within the same bundle
+        fail_fast: Specifies that validation of each object should stop at
+            the first error found, without running "SHOULD" checks or
+            building error messages.
 
     """
     def __init__(self, cmd_args=None, version=None, verbose=False, silent=False,
                  files=None, recursive=False, schema_dir=None,
                  disabled="", enabled="", strict=False,
                  strict_types=False, strict_properties=False, no_cache=False,
-                 refresh_cache=False, clear_cache=False, enforce_refs=False):
+                 refresh_cache=False, clear_cache=False, enforce_refs=False,
+                 fail_fast=False, merge_schemas=False, pattern_cache=None,
+                 pattern_processes=0, pattern_max_length=None,
+                 pattern_max_depth=None, pattern_max_comparisons=None,
+                 pattern_timeout=None):
 
         if cmd_args is not None:
             self.version = cmd_args.version
@@ -362,6 +460,7 @@ class ValidationOptions(object):
             self.files = cmd_args.files
             self.recursive = cmd_args.recursive
             self.schema_dir = cmd_args.schema_dir
+            self.merge_schemas = cmd_args.merge_schemas
             self.disabled = cmd_args.disabled
             self.enabled = cmd_args.enabled
             self.strict = cmd_args.strict
@@ -370,13 +469,21 @@ class ValidationOptions(object):
             self.no_cache = cmd_args.no_cache
             self.refresh_cache = cmd_args.refresh_cache
             self.clear_cache = cmd_args.clear_cache
+            self.pattern_cache = cmd_args.pattern_cache
+            self.pattern_processes = cmd_args.pattern_processes
             self.enforce_refs = cmd_args.enforce_refs
+            self.fail_fast = cmd_args.fail_fast
+            self.pattern_max_length = cmd_args.pattern_max_length
+            self.pattern_max_depth = cmd_args.pattern_max_depth
+            self.pattern_max_comparisons = cmd_args.pattern_max_comparisons
+            self.pattern_timeout = cmd_args.pattern_timeout
         else:
             # input options
             self.version = version
             self.files = files
             self.recursive = recursive
             self.schema_dir = schema_dir
+            self.merge_schemas = merge_schemas
 
             # output options
             self.verbose = verbose
@@ -387,11 +494,18 @@ class ValidationOptions(object):
             self.disabled = disabled
             self.enabled = enabled
             self.enforce_refs = enforce_refs
+            self.fail_fast = fail_fast
+            self.pattern_max_length = pattern_max_length
+            self.pattern_max_depth = pattern_max_depth
+            self.pattern_max_comparisons = pattern_max_comparisons
+            self.pattern_timeout = pattern_timeout
 
             # cache options
             self.no_cache = no_cache
             self.refresh_cache = refresh_cache
             self.clear_cache = clear_cache
+            self.pattern_cache = pattern_cache
+            self.pattern_processes = pattern_processes
 
         # Set the output level (e.g., quiet vs. verbose)
         if self.silent and self.verbose:
@@ -439,6 +553,185 @@ def has_cyber_observable_data(instance, version="2.0"):
     return False
 
 
+def compile_vocabularies(enums):
+    """Compile the open vocabularies in a version of STIX's enums module into
+    tables for checking the values of the properties which use them.
+
+    Each vocabulary is a pair of attributes of the module: ``<NAME>_OV``, the
+    list of the vocabulary's values, and ``<NAME>_USES``, a dictionary mapping
+    object types to the properties of those objects which use it.
+
+    Returns:
+        A dictionary mapping each vocabulary's name (e.g. 'TOOL_TYPE') to a
+        dictionary mapping each object type which uses it to a tuple of
+        (property, frozenset of the vocabulary's values) pairs.
+    """
+    vocabularies = {}
+    for uses_name in dir(enums):
+        if not uses_name.endswith('_USES'):
+            continue
+        name = uses_name[:-len('_USES')]
+        values = getattr(enums, name + '_OV', None)
+        if values is None:
+            continue
+        values = frozenset(values)
+        vocabularies[name] = dict(
+            (obj_type, tuple((prop, values) for prop in props))
+            for obj_type, props in getattr(enums, uses_name).items())
+    return vocabularies
+
+
+def applies_to(*types):
+    """Decorator for checks that only apply to objects of the given types.
+
+    The validator only runs a check on objects whose type it applies to;
+    checks without this decorator apply to objects of every type. A check may
+    only declare the types it applies to if it returns without reporting
+    anything for objects of any other type.
+
+    Args:
+        types (str): the STIX object types the check applies to
+    """
+    def inner_applies_to(original_function):
+        original_function.object_types = frozenset(types)
+        return original_function
+    return inner_applies_to
+
+
+def needs_options(original_function):
+    """Decorator for checks which take the validation options as well as the
+    object to check.
+
+    The validator calls such checks with the object and a ValidationOptions
+    instance; it calls all other checks with only the object.
+    """
+    original_function.needs_options = True
+    return original_function
+
+
+def needs_context(original_function):
+    """Decorator for checks which take an ObjectContext as well as the object
+    to check.
+
+    The validator makes one context for each object it checks and calls such
+    checks with the object and that context, which carries the validation
+    options, in place of the options themselves.
+    """
+    original_function.needs_context = True
+    return original_function
+
+
+def visits(*paths):
+    """Decorator for checks which look at the values at the given property
+    paths of the objects they check.
+
+    Each path is a tuple of property names, starting at the object. Rather
+    than looking the values up itself, the check is called with the object
+    and a dictionary mapping each path that is present in the object to the
+    value at it. The validator finds the values for all the checks it runs on
+    an object in a single walk over the object (see PropertyWalker). So
+    that it can still be called with just the object, the check should
+    default the dictionary to None and walk the object itself in that case.
+
+    This must be the outermost decorator of the check.
+
+    Args:
+        paths (tuple): the property paths the check looks at
+    """
+    def inner_visits(original_function):
+        original_function.paths = paths
+        return original_function
+    return inner_visits
+
+
+class PropertyWalker(object):
+    """Finds the values at a set of property paths in STIX objects.
+
+    The paths are kept in a tree, so that properties shared by several paths
+    (such as an object's `extensions`) are only looked up once per object.
+    """
+    def __init__(self, paths=()):
+        self._root = {}
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        """Add a property path (a tuple of property names) to find.
+        """
+        node = self._root
+        for prop in path[:-1]:
+            node = node.setdefault(prop, [None, {}])[1]
+        node.setdefault(path[-1], [None, {}])[0] = tuple(path)
+
+    def walk(self, instance):
+        """Return a dictionary mapping each of the paths present in `instance`
+        to the value at it.
+        """
+        found = {}
+        self._walk(instance, self._root, found)
+        return found
+
+    def _walk(self, value, node, found):
+        for prop, (path, children) in node.items():
+            if prop not in value:
+                continue
+            child = value[prop]
+            if path is not None:
+                found[path] = child
+            if children and isinstance(child, dict):
+                self._walk(child, children, found)
+
+
+class ObjectContext(object):
+    """Facts about a STIX object which several checks use. Each is worked out
+    the first time a check asks for it, and kept for the other checks run on
+    the same object.
+
+    Args:
+        instance: The STIX object being checked.
+        options: ValidationOptions instance it is being validated with.
+    """
+    def __init__(self, instance, options=None):
+        self.instance = instance
+        self.options = options
+        self._uuid = None
+        self._observable = {}
+        self._timestamps = {}
+
+    @property
+    def uuid(self):
+        """The UUID in the object's id, as a uuid.UUID.
+
+        Raises ValueError if it is not a valid UUID.
+        """
+        if self._uuid is None:
+            self._uuid = uuid.UUID(self.instance['id'].split("--")[-1])
+        return self._uuid
+
+    def has_cyber_observable_data(self, version="2.0"):
+        """Return has_cyber_observable_data() for the object.
+        """
+        try:
+            return self._observable[version]
+        except KeyError:
+            pass
+        result = self._observable[version] = has_cyber_observable_data(self.instance, version)
+        return result
+
+    def timestamp_key(self, prop):
+        """Return formats.timestamp_key() of the value of one of the object's
+        properties.
+
+        Raises ValueError if it is not a valid timestamp.
+        """
+        try:
+            return self._timestamps[prop]
+        except KeyError:
+            pass
+        result = self._timestamps[prop] = timestamp_key(self.instance[prop])
+        return result
+
+
 def cyber_observable_check(version, requires_objects=False):
     def inner_cyber_observable_check(original_function):
         """Decorator for functions that require cyber observable data.
@@ -448,34 +741,30 @@ def cyber_observable_check(version, requires_objects=False):
             requires_objects (bool): True if the function requires the 'objects'
                 property, deprecated in 2.1
         """
+        if version == "2.1" and not requires_objects:
+            data_version = "2.1"
+            object_types = frozenset(OBSERVABLE_TYPES21).union(['observed-data'])
+        else:
+            data_version = "2.0"
+            object_types = frozenset(['observed-data'])
+
         def new_function(*args, **kwargs):
             """ Checks to see if instance provided (arg[0]) contains observable
-            data as a top level object or within the observed-data sdo and loops
-            through objects in the latter case to keep checks consistent.
+            data, either as a top level object or within the observed-data
+            sdo, and if so runs the check on it once. Always returns an
+            iterable of errors, so that checks can be chained together.
             """
-            if version == "2.1" and not requires_objects:
-                if not has_cyber_observable_data(args[0], version="2.1"):
-                    return
-                if 'objects' in args[0]:
-                    for obj in args[0]['objects']:
-                        func = original_function(args[0], **kwargs)
-                        if isinstance(func, Iterable):
-                            for x in original_function(args[0], **kwargs):
-                                yield x
-                else:
-                    func = original_function(*args, **kwargs)
-                    if isinstance(func, Iterable):
-                        for x in original_function(args[0], **kwargs):
-                            yield x
-            else:
-                if not has_cyber_observable_data(args[0]):
-                    return
-                func = original_function(*args, **kwargs)
-                if isinstance(func, Iterable):
-                    for x in original_function(*args, **kwargs):
-                        yield x
+            if not has_cyber_observable_data(args[0], version=data_version):
+                return ()
+            result = original_function(*args, **kwargs)
+            if result is None:
+                return ()
+            if isinstance(result, Iterable):
+                return result
+            return (result,)
 
         new_function.__name__ = original_function.__name__
+        new_function.object_types = object_types
         return new_function
     return inner_cyber_observable_check
 
@@ -504,14 +793,11 @@ def check_spec(instance, options):
     return warnings
 
 
-def init_requests_cache(refresh_cache=False):
+def get_cache_dir():
     """
-    Initializes a cache which the ``requests`` library will consult for
-    responses, before making network requests.
-
-    :param refresh_cache: Whether the cache should be cleared out
+    Returns the directory in which the validator caches data between runs,
+    creating it if it doesn't exist yet.
     """
-    # Cache data from external sources; used in some checks
     dirs = AppDirs("stix2-validator", "OASIS")
     # Create cache dir if doesn't exist
     try:
@@ -519,8 +805,20 @@ def init_requests_cache(refresh_cache=False):
     except OSError as e:
         if e.errno != errno.EEXIST:
             raise
+    return dirs.user_cache_dir
+
+
+def init_requests_cache(refresh_cache=False):
+    """
+    Initializes a cache which the ``requests`` library will consult for
+    responses, before making network requests.
+
+    :param refresh_cache: Whether the cache should be cleared out
+    """
+    # Cache data from external sources; used in some checks
+    cache_dir = get_cache_dir()
     requests_cache.install_cache(
-        cache_name=os.path.join(dirs.user_cache_dir, 'py{}cache'.format(
+        cache_name=os.path.join(cache_dir, 'py{}cache'.format(
             sys.version_info[0])),
         expire_after=datetime.timedelta(weeks=1))
 
@@ -1399,9 +1399,9 @@ CHECK_CODES = {
 
 
 def media_types():
-    """Return a list of the IANA Media (MIME) Types, or an empty list if the
+    """Return a set of the IANA Media (MIME) Types, or an empty set if the
     IANA website is unreachable.
-    Store it as a function attribute so that we only build the list once.
+    Store it as a function attribute so that we only build the set once.
     """
     if not hasattr(media_types, 'typelist'):
         tlist = []
@@ -1421,7 +1421,7 @@ def media_types():
                 data = requests.get('http://www.iana.org/assignments/'
                                     'media-types/%s.csv' % cat)
             except requests.exceptions.RequestException:
-                return []
+                return ValueSet()
 
             types = []
             for line in data.iter_lines():
@@ -1435,14 +1435,14 @@ def media_types():
                             types.append(cat + '/' + line.split(',')[0])
 
             tlist.extend(types)
-        media_types.typelist = tlist
+        media_types.typelist = ValueSet(tlist)
     return media_types.typelist
 
 
 def char_sets():
-    """Return a list of the IANA Character Sets, or an empty list if the
+    """Return a set of the IANA Character Sets, or an empty set if the
     IANA website is unreachable.
-    Store it as a function attribute so that we only build the list once.
+    Store it as a function attribute so that we only build the set once.
     """
     if not hasattr(char_sets, 'setlist'):
         clist = []
@@ -1450,7 +1450,7 @@ def char_sets():
             data = requests.get('http://www.iana.org/assignments/character-'
                                 'sets/character-sets-1.csv')
         except requests.exceptions.RequestException:
-            return []
+            return ValueSet()
 
         for line in data.iter_lines():
             if line:
@@ -1462,23 +1462,23 @@ def char_sets():
                     else:
                         clist.append(vals[1])
 
-        char_sets.setlist = clist
+        char_sets.setlist = ValueSet(clist)
     return char_sets.setlist
 
 
 def protocols():
-    """Return a list of values from the IANA Service Name and Transport
-    Protocol Port Number Registry, or an empty list if the IANA website is
+    """Return a set of values from the IANA Service Name and Transport
+    Protocol Port Number Registry, or an empty set if the IANA website is
     unreachable.
-    Store it as a function attribute so that we only build the list once.
+    Store it as a function attribute so that we only build the set once.
     """
     if not hasattr(protocols, 'protlist'):
-        plist = []
+        plist = set()
         try:
             data = requests.get('http://www.iana.org/assignments/service-names'
                                 '-port-numbers/service-names-port-numbers.csv')
         except requests.exceptions.RequestException:
-            return []
+            return ValueSet()
 
         for line in data.iter_lines():
             if line:
@@ -1486,23 +1486,23 @@ def protocols():
                 if line.count(',') > 0:
                     vals = line.split(',')
                     if vals[0]:
-                        plist.append(vals[0])
-                    if len(vals) > 2 and vals[2] and vals[2] not in plist:
-                        plist.append(vals[2])
+                        plist.add(vals[0])
+                    if len(vals) > 2 and vals[2]:
+                        plist.add(vals[2])
 
-        plist.append('ipv4')
-        plist.append('ipv6')
-        plist.append('ssl')
-        plist.append('tls')
-        plist.append('dns')
-        protocols.protlist = plist
+        plist.add('ipv4')
+        plist.add('ipv6')
+        plist.add('ssl')
+        plist.add('tls')
+        plist.add('dns')
+        protocols.protlist = ValueSet(plist)
     return protocols.protlist
 
 
 def ipfix():
-    """Return a list of values from the list of IANA IP Flow Information Export
-    (IPFIX) Entities, or an empty list if the IANA website is unreachable.
-    Store it as a function attribute so that we only build the list once.
+    """Return a set of values from the list of IANA IP Flow Information Export
+    (IPFIX) Entities, or an empty set if the IANA website is unreachable.
+    Store it as a function attribute so that we only build the set once.
     """
     if not hasattr(ipfix, 'ipflist'):
         ilist = []
@@ -1510,7 +1510,7 @@ def ipfix():
             data = requests.get('http://www.iana.org/assignments/ipfix/ipfix-'
                                 'information-elements.csv')
         except requests.exceptions.RequestException:
-            return []
+            return ValueSet()
 
         for line in data.iter_lines():
             if line:
@@ -1520,7 +1520,7 @@ def ipfix():
                     if vals[1]:
                         ilist.append(vals[1])
 
-        ipfix.ipflist = ilist
+        ipfix.ipflist = ValueSet(ilist)
     return ipfix.ipflist
 
 
@@ -1672,3 +1672,67 @@ HTTP_REQUEST_HEADERS = [
     "X-Request-ID",
     "X-Correlation-ID"
 ]
+
+
+class ValueSet(frozenset):
+    """A frozenset which reports that it does not contain an unhashable value
+    instead of raising TypeError, as a list would. The checks may look up any
+    value found in an object, valid or not.
+    """
+    __slots__ = ()
+
+    def __contains__(self, value):
+        try:
+            return frozenset.__contains__(self, value)
+        except TypeError:
+            return False
+
+
+def frozen_table(table):
+    """Return a copy of a list, or of a dictionary of lists at any depth, with
+    each list turned into a ValueSet.
+    """
+    if isinstance(table, dict):
+        return dict((key, frozen_table(value)) for key, value in table.items())
+    return ValueSet(table)
+
+
+# Set forms of the tables above, built once at import, for the checks to test
+# values for membership of. The tables themselves keep their order for
+# messages and for code which iterates over them.
+TYPES_SET = ValueSet(TYPES)
+OBSERVABLE_TYPES_SET = ValueSet(OBSERVABLE_TYPES)
+MARKING_DEFINITION_TYPES_SET = ValueSet(MARKING_DEFINITION_TYPES)
+KILL_CHAIN_PHASE_USES_SET = ValueSet(KILL_CHAIN_PHASE_USES)
+RESERVED_PROPERTIES_SET = ValueSet(RESERVED_PROPERTIES)
+RESERVED_OBJECTS_SET = ValueSet(RESERVED_OBJECTS)
+OBSERVABLE_RESERVED_OBJECTS_SET = ValueSet(OBSERVABLE_RESERVED_OBJECTS)
+NON_SDOS_SET = ValueSet(NON_SDOS)
+COMMON_RELATIONSHIPS_SET = ValueSet(COMMON_RELATIONSHIPS)
+OBSERVABLE_DICT_KEY_EXCEPTIONS_SET = ValueSet(OBSERVABLE_DICT_KEY_EXCEPTIONS)
+HASH_ALGO_OV_SET = ValueSet(HASH_ALGO_OV)
+ENCRYPTION_ALGO_OV_SET = ValueSet(ENCRYPTION_ALGO_OV)
+WINDOWS_PEBINARY_TYPE_OV_SET = ValueSet(WINDOWS_PEBINARY_TYPE_OV)
+ACCOUNT_TYPE_OV_SET = ValueSet(ACCOUNT_TYPE_OV)
+SOCKET_OPTIONS_SET = ValueSet(SOCKET_OPTIONS)
+PDF_DID_SET = ValueSet(PDF_DID)
+SOFTWARE_LANG_CODES_SET = ValueSet(SOFTWARE_LANG_CODES)
+HTTP_REQUEST_HEADERS_SET = ValueSet(HTTP_REQUEST_HEADERS)
+PROPERTIES_SETS = frozen_table(PROPERTIES)
+OBSERVABLE_PROPERTIES_SETS = frozen_table(OBSERVABLE_PROPERTIES)
+OBSERVABLE_EXTENSIONS_SETS = frozen_table(OBSERVABLE_EXTENSIONS)
+OBSERVABLE_EXTENSION_PROPERTIES_SETS = frozen_table(OBSERVABLE_EXTENSION_PROPERTIES)
+OBSERVABLE_EMBEDDED_PROPERTIES_SETS = frozen_table(OBSERVABLE_EMBEDDED_PROPERTIES)
+OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES_SETS = frozen_table(OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES)
+RELATIONSHIPS_SETS = dict(
+    (source, dict((r_type, ValueSet([targets] if isinstance(targets, str) else targets))
+                  for r_type, targets in types.items()))
+    for source, types in RELATIONSHIPS.items())
+
+# Every (source type, relationship type, target type) combination suggested by
+# the specification, so that a relationship can be checked with one lookup
+RELATIONSHIP_MATRIX = ValueSet(
+    (source, r_type, target)
+    for source, types in RELATIONSHIPS_SETS.items()
+    for r_type, targets in types.items()
+    for target in targets)
@@ -3,15 +3,15 @@
 
 import re
 
-from dateutil import parser
 from six import string_types
-from stix2patterns.v20.pattern import Pattern
-from stix2patterns.validator import run_validator as pattern_validator
 
 from . import enums
-from ..errors import PatternError
+from ..errors import PatternError, PatternLimitError
+from ..formats import timestamp_key
 from ..output import info
-from ..util import cyber_observable_check, has_cyber_observable_data
+from ..pattern_cache import parse_pattern, pattern_limit_exceeded
+from ..util import (applies_to, cyber_observable_check, needs_context,
+                    needs_options)
 from .errors import JSONError
 
 CUSTOM_TYPE_PREFIX_RE = re.compile(r"^x\-.+\-.+$")
@@ -20,33 +20,33 @@ CUSTOM_PROPERTY_PREFIX_RE = re.compile(r"^x_.+_.+$")
 CUSTOM_PROPERTY_LAX_PREFIX_RE = re.compile(r"^x_.+$")
 
 
-def timestamp(instance):
+@needs_context
+def timestamp(instance, context):
     """Ensure timestamps contain sane months, days, hours, minutes, seconds.
     """
-    ts_re = re.compile(r"^[0-9]{4}-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])T([01][0-9]|2[0-3]):([0-5][0-9]):([0-5][0-9]|60)(\.[0-9]+)?Z$")
     timestamp_props = ['created', 'modified']
     if instance['type'] in enums.TIMESTAMP_PROPERTIES:
         timestamp_props += enums.TIMESTAMP_PROPERTIES[instance['type']]
 
     for tprop in timestamp_props:
-        if tprop in instance and ts_re.match(instance[tprop]):
+        if tprop in instance:
             # Don't raise an error if schemas will catch it
             try:
-                parser.parse(instance[tprop])
+                context.timestamp_key(tprop)
             except ValueError as e:
                 yield JSONError("'%s': '%s' is not a valid timestamp: %s"
                                 % (tprop, instance[tprop], str(e)), instance['id'])
 
-    if has_cyber_observable_data(instance):
+    if context.has_cyber_observable_data():
         for key, obj in instance['objects'].items():
             if 'type' not in obj:
                 continue
             if obj['type'] in enums.TIMESTAMP_OBSERVABLE_PROPERTIES:
                 for tprop in enums.TIMESTAMP_OBSERVABLE_PROPERTIES[obj['type']]:
-                    if tprop in obj and ts_re.match(obj[tprop]):
+                    if tprop in obj:
                         # Don't raise an error if schemas will catch it
                         try:
-                            parser.parse(obj[tprop])
+                            timestamp_key(obj[tprop])
                         except ValueError as e:
                             yield JSONError("'%s': '%s': '%s' is not a valid timestamp: %s"
                                             % (obj['type'], tprop, obj[tprop], str(e)), instance['id'])
@@ -56,15 +56,15 @@ def timestamp(instance):
                         for tprop in enums.TIMESTAMP_EMBEDDED_PROPERTIES[obj['type']][embed]:
                             if embed == 'extensions':
                                 for ext in obj[embed]:
-                                    if tprop in obj[embed][ext] and ts_re.match(obj[embed][ext][tprop]):
+                                    if tprop in obj[embed][ext]:
                                         try:
-                                            parser.parse(obj[embed][ext][tprop])
+                                            timestamp_key(obj[embed][ext][tprop])
                                         except ValueError as e:
                                             yield JSONError("'%s': '%s': '%s': '%s' is not a valid timestamp: %s"
                                                             % (obj['type'], ext, tprop, obj[embed][ext][tprop], str(e)), instance['id'])
-                            elif tprop in obj[embed] and ts_re.match(obj[embed][tprop]):
+                            elif tprop in obj[embed]:
                                 try:
-                                    parser.parse(obj[embed][tprop])
+                                    timestamp_key(obj[embed][tprop])
                                 except ValueError as e:
                                     yield JSONError("'%s': '%s': '%s' is not a valid timestamp: %s"
                                                     % (obj['type'], tprop, obj[embed][tprop], str(e)), instance['id'])
@@ -80,6 +80,7 @@ def modified_created(instance):
                          instance['id'])
 
 
+@applies_to('marking-definition')
 def object_marking_circular_refs(instance):
     """Ensure that marking definitions do not contain circular references (ie.
     they do not reference themselves in the `object_marking_refs` property).
@@ -95,6 +96,7 @@ def object_marking_circular_refs(instance):
                                 " (no circular references).", instance['id'])
 
 
+@applies_to('marking-definition')
 def granular_markings_circular_refs(instance):
     """Ensure that marking definitions do not contain circular references (ie.
     they do not reference themselves in the `granular_markings` property).
@@ -312,13 +314,15 @@ def software_language(instance):
         if ('type' in obj and obj['type'] == 'software' and
                 'languages' in obj):
             for lang in obj['languages']:
-                if lang not in enums.SOFTWARE_LANG_CODES:
+                if lang not in enums.SOFTWARE_LANG_CODES_SET:
                     yield JSONError("The 'languages' property of object '%s' "
                                     "contains an invalid ISO 639-2 language "
                                     " code ('%s')."
                                     % (key, lang), instance['id'])
 
 
+@applies_to('indicator')
+@needs_options
 def patterns(instance, options):
     """Ensure that the syntax of the pattern of an indicator is valid, and that
     objects and properties referenced by the pattern are valid.
@@ -329,7 +333,12 @@ def patterns(instance, options):
     pattern = instance['pattern']
     if not isinstance(pattern, string_types):
         return  # This error already caught by schemas
-    errors = pattern_validator(pattern, stix_version='2.0')
+    exceeded = pattern_limit_exceeded(pattern, '2.0', options)
+    if exceeded:
+        yield PatternLimitError(*exceeded, instance_id=instance['id'])
+        return
+    parsed = parse_pattern(pattern, '2.0')
+    errors = parsed.errors
 
     # Check pattern syntax
     if errors:
@@ -340,11 +349,10 @@ def patterns(instance, options):
     type_format_re = re.compile(r'^\-?[a-z0-9]+(-[a-z0-9]+)*\-?$')
     property_format_re = re.compile(r'^[a-z0-9_]{3,250}$')
 
-    p = Pattern(pattern)
-    inspection = p.inspect().comparisons
+    inspection = parsed.comparisons
     for objtype in inspection:
         # Check observable object types
-        if objtype in enums.OBSERVABLE_TYPES:
+        if objtype in enums.OBSERVABLE_TYPES_SET:
             pass
         elif (not type_format_re.match(objtype) or
               len(objtype) < 3 or len(objtype) > 250):
@@ -368,7 +376,7 @@ def patterns(instance, options):
             path = exp[0]
             # Get the property name without list index, dictionary key, or referenced object property
             prop = path[0]
-            if objtype in enums.OBSERVABLE_PROPERTIES and prop in enums.OBSERVABLE_PROPERTIES[objtype]:
+            if objtype in enums.OBSERVABLE_PROPERTIES_SETS and prop in enums.OBSERVABLE_PROPERTIES_SETS[objtype]:
                 continue
             elif not property_format_re.match(prop):
                 yield PatternError("'%s' is not a valid observable property name"
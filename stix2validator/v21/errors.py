@@ -2,8 +2,9 @@ from collections import deque
 
 from jsonschema import exceptions as schema_exceptions
 
-from ..errors import (NoJSONFileFoundError, PatternError, SchemaError,  # noqa
-                      SchemaInvalidError, ValidationError, pretty_error)
+from ..errors import (NoJSONFileFoundError, PatternError,  # noqa
+                      PatternLimitError, SchemaError, SchemaInvalidError,
+                      ValidationError, pretty_error)
 from .enums import CHECK_CODES
 
 
@@ -2,17 +2,17 @@
 """
 import operator
 import re
-import uuid
 
-from dateutil import parser
 from six import string_types
-from stix2patterns.v21.pattern import Pattern
-from stix2patterns.validator import run_validator as pattern_validator
 
 from . import enums
-from ..errors import PatternError
+from ..errors import PatternError, PatternLimitError
+from ..formats import timestamp_key
 from ..output import info
-from ..util import cyber_observable_check, has_cyber_observable_data
+from ..pattern_cache import (parse_pattern, pattern_deadline,
+                             pattern_limit_exceeded)
+from ..util import (applies_to, cyber_observable_check, needs_context,
+                    needs_options)
 from .errors import JSONError
 
 TYPE_FORMAT_RE = re.compile(r'^\-?[a-z0-9]+(-[a-z0-9]+)*\-?$')
@@ -25,34 +25,34 @@ CUSTOM_EXT_PREFIX_RE = re.compile(r"^x\-.+\-.+\-ext$")
 CUSTOM_EXT_LAX_PREFIX_RE = re.compile(r"^x\-.+\-ext$")
 
 
-def timestamp(instance):
+@needs_context
+def timestamp(instance, context):
     """Ensure timestamps contain sane months, days, hours, minutes, seconds.
     """
-    ts_re = re.compile(r"^[0-9]{4}-(0[1-9]|1[012])-(0[1-9]|[12][0-9]|3[01])T([01][0-9]|2[0-3]):([0-5][0-9]):([0-5][0-9]|60)(\.[0-9]+)?Z$")
     timestamp_props = ['created', 'modified']
     if instance['type'] in enums.TIMESTAMP_PROPERTIES:
         timestamp_props += enums.TIMESTAMP_PROPERTIES[instance['type']]
 
     for tprop in timestamp_props:
-        if tprop in instance and ts_re.match(instance[tprop]):
+        if tprop in instance:
             # Don't raise an error if schemas will catch it
             try:
-                parser.parse(instance[tprop])
+                context.timestamp_key(tprop)
             except ValueError as e:
                 yield JSONError("'%s': '%s' is not a valid timestamp: %s"
                                 % (tprop, instance[tprop], str(e)), instance['id'])
 
-    if has_cyber_observable_data(instance, "2.1"):
+    if context.has_cyber_observable_data("2.1"):
         if instance['type'] == 'observable-data':
             for key, obj in instance['objects'].items():
                 if 'type' not in obj:
                     continue
                 if obj['type'] in enums.TIMESTAMP_OBSERVABLE_PROPERTIES:
                     for tprop in enums.TIMESTAMP_OBSERVABLE_PROPERTIES[obj['type']]:
-                        if tprop in obj and ts_re.match(obj[tprop]):
+                        if tprop in obj:
                             # Don't raise an error if schemas will catch it
                             try:
-                                parser.parse(obj[tprop])
+                                timestamp_key(obj[tprop])
                             except ValueError as e:
                                 yield JSONError("'%s': '%s': '%s' is not a valid timestamp: %s"
                                                 % (obj['type'], tprop, obj[tprop], str(e)), instance['id'])
@@ -62,15 +62,15 @@ def timestamp(instance):
                             for tprop in enums.TIMESTAMP_EMBEDDED_PROPERTIES[obj['type']][embed]:
                                 if embed == 'extensions':
                                     for ext in obj[embed]:
-                                        if tprop in obj[embed][ext] and ts_re.match(obj[embed][ext][tprop]):
+                                        if tprop in obj[embed][ext]:
                                             try:
-                                                parser.parse(obj[embed][ext][tprop])
+                                                timestamp_key(obj[embed][ext][tprop])
                                             except ValueError as e:
                                                 yield JSONError("'%s': '%s': '%s': '%s' is not a valid timestamp: %s"
                                                                 % (obj['type'], ext, tprop, obj[embed][ext][tprop], str(e)), instance['id'])
-                                elif tprop in obj[embed] and ts_re.match(obj[embed][tprop]):
+                                elif tprop in obj[embed]:
                                     try:
-                                        parser.parse(obj[embed][tprop])
+                                        timestamp_key(obj[embed][tprop])
                                     except ValueError as e:
                                         yield JSONError("'%s': '%s': '%s' is not a valid timestamp: %s"
                                                         % (obj['type'], tprop, obj[embed][tprop], str(e)), instance['id'])
@@ -79,10 +79,10 @@ def timestamp(instance):
                 return
             if instance['type'] in enums.TIMESTAMP_OBSERVABLE_PROPERTIES:
                 for tprop in enums.TIMESTAMP_OBSERVABLE_PROPERTIES[instance['type']]:
-                    if tprop in instance and ts_re.match(instance[tprop]):
+                    if tprop in instance:
                         # Don't raise an error if schemas will catch it
                         try:
-                            parser.parse(instance[tprop])
+                            context.timestamp_key(tprop)
                         except ValueError as e:
                             yield JSONError("'%s': '%s': '%s' is not a valid timestamp: %s"
                                             % (instance['type'], tprop, instance[tprop], str(e)), instance['id'])
@@ -92,15 +92,15 @@ def timestamp(instance):
                         for tprop in enums.TIMESTAMP_EMBEDDED_PROPERTIES[instance['type']][embed]:
                             if embed == 'extensions':
                                 for ext in instance[embed]:
-                                    if tprop in instance[embed][ext] and ts_re.match(instance[embed][ext][tprop]):
+                                    if tprop in instance[embed][ext]:
                                         try:
-                                            parser.parse(instance[embed][ext][tprop])
+                                            timestamp_key(instance[embed][ext][tprop])
                                         except ValueError as e:
                                             yield JSONError("'%s': '%s': '%s': '%s' is not a valid timestamp: %s"
                                                             % (instance['type'], ext, tprop, instance[embed][ext][tprop], str(e)), instance['id'])
-                            elif tprop in instance[embed] and ts_re.match(instance[embed][tprop]):
+                            elif tprop in instance[embed]:
                                 try:
-                                    parser.parse(instance[embed][tprop])
+                                    timestamp_key(instance[embed][tprop])
                                 except ValueError as e:
                                     yield JSONError("'%s': '%s': '%s' is not a valid timestamp: %s"
                                                     % (instance['type'], tprop, instance[embed][tprop], str(e)), instance['id'])
@@ -117,7 +117,37 @@ def get_comparison_string(op):
         raise ValueError('Unknown operator: {}'.format(op))
 
 
-def timestamp_compare(instance):
+def compare_timestamps(comp, first, second):
+    """Compare two timestamps with the given comparison function from the
+    operator module, by the times they represent if they are both valid.
+    """
+    try:
+        first_key = timestamp_key(first)
+        second_key = timestamp_key(second)
+    except (TypeError, ValueError):
+        # Not strings, or not valid timestamps; other checks report those
+        first_key = second_key = None
+    if first_key is None or second_key is None:
+        return comp(first, second)
+    return comp(first_key, second_key)
+
+
+def compare_timestamp_properties(comp, context, first, second):
+    """Compare two timestamp properties of the object a context is for, as
+    compare_timestamps() compares their values.
+    """
+    try:
+        first_key = context.timestamp_key(first)
+        second_key = context.timestamp_key(second)
+    except (TypeError, ValueError):
+        first_key = second_key = None
+    if first_key is None or second_key is None:
+        return comp(context.instance[first], context.instance[second])
+    return comp(first_key, second_key)
+
+
+@needs_context
+def timestamp_compare(instance, context):
     """Ensure timestamp properties with a comparison requirement are valid.
 
     E.g. `modified` must be later or equal to `created`.
@@ -131,7 +161,7 @@ def timestamp_compare(instance):
         comp_str = get_comparison_string(op)
 
         if first in instance and second in instance and \
-                not comp(instance[first], instance[second]):
+                not compare_timestamp_properties(comp, context, first, second):
             msg = "'%s' (%s) must be %s '%s' (%s)"
             yield JSONError(msg % (first, instance[first], comp_str, second, instance[second]),
                             instance['id'])
@@ -148,12 +178,13 @@ def observable_timestamp_compare(instance):
         comp_str = get_comparison_string(op)
 
         if first in instance and second in instance and \
-                not comp(instance[first], instance[second]):
+                not compare_timestamps(comp, instance[first], instance[second]):
             msg = "In object '%s', '%s' (%s) must be %s '%s' (%s)"
             yield JSONError(msg % (instance['id'], first, instance[first], comp_str, second, instance[second]),
                             instance['id'])
 
 
+@applies_to('marking-definition')
 def object_marking_circular_refs(instance):
     """Ensure that marking definitions do not contain circular references (ie.
     they do not reference themselves in the `object_marking_refs` property).
@@ -169,6 +200,7 @@ def object_marking_circular_refs(instance):
                                 " (no circular references).", instance['id'])
 
 
+@applies_to('marking-definition')
 def granular_markings_circular_refs(instance):
     """Ensure that marking definitions do not contain circular references (ie.
     they do not reference themselves in the `granular_markings` property).
@@ -384,7 +416,7 @@ def character_set(obj):
 def language(instance):
     """Ensure the 'lang' property of SDOs is a valid RFC 5646 language code.
     """
-    if ('lang' in instance and instance['lang'] not in enums.LANG_CODES):
+    if ('lang' in instance and instance['lang'] not in enums.LANG_CODES_SET):
         yield JSONError("'%s' is not a valid RFC 5646 language code."
                         % instance['lang'], instance['id'])
 
@@ -397,13 +429,15 @@ def software_language(instance):
     if ('type' in instance and instance['type'] == 'software' and
             'languages' in instance):
         for lang in instance['languages']:
-            if lang not in enums.SOFTWARE_LANG_CODES:
+            if lang not in enums.SOFTWARE_LANG_CODES_SET:
                 yield JSONError("The 'languages' property of object '%s' "
                                 "contains an invalid ISO 639-2 language "
                                 " code ('%s')."
                                 % (instance['id'], lang), instance['id'])
 
 
+@applies_to('indicator')
+@needs_options
 def patterns(instance, options):
     """Ensure that the syntax of the pattern of an indicator is valid, and that
     objects and properties referenced by the pattern are valid.
@@ -423,7 +457,15 @@ def patterns(instance, options):
         pattern_version = instance['spec_version']
     else:
         pattern_version = '2.1'
-    errors = pattern_validator(pattern, pattern_version)
+    if not isinstance(pattern_version, string_types):
+        return  # This error already caught by schemas
+    # Both parses below share one time limit
+    deadline = pattern_deadline(options)
+    exceeded = pattern_limit_exceeded(pattern, pattern_version, options, deadline)
+    if exceeded:
+        yield PatternLimitError(*exceeded, instance_id=instance['id'])
+        return
+    errors = parse_pattern(pattern, pattern_version).errors
 
     # Check pattern syntax
     if errors:
@@ -431,11 +473,14 @@ def patterns(instance, options):
             yield PatternError(str(e), instance['id'])
         return
 
-    p = Pattern(pattern)
-    inspection = p.inspect().comparisons
+    exceeded = pattern_limit_exceeded(pattern, '2.1', options, deadline)
+    if exceeded:
+        yield PatternLimitError(*exceeded, instance_id=instance['id'])
+        return
+    inspection = parse_pattern(pattern, '2.1').comparisons
     for objtype in inspection:
         # Check observable object types
-        if objtype in enums.OBSERVABLE_TYPES:
+        if objtype in enums.OBSERVABLE_TYPES_SET:
             pass
         elif (not TYPE_FORMAT_RE.match(objtype) or
               len(objtype) < 3 or len(objtype) > 250):
@@ -459,7 +504,7 @@ def patterns(instance, options):
             path = exp[0]
             # Get the property name without list index, dictionary key, or referenced object property
             prop = path[0]
-            if objtype in enums.OBSERVABLE_PROPERTIES and prop in enums.OBSERVABLE_PROPERTIES[objtype]:
+            if objtype in enums.OBSERVABLE_PROPERTIES_SETS and prop in enums.OBSERVABLE_PROPERTIES_SETS[objtype]:
                 continue
             elif not PROPERTY_FORMAT_RE.match(prop):
                 yield PatternError("'%s' is not a valid observable property name"
@@ -478,6 +523,7 @@ def patterns(instance, options):
                                    "should start with 'x_'" % prop, instance['id'])
 
 
+@applies_to('language-content')
 def language_contents(instance):
     """Ensure keys in Language Content's 'contents' dictionary are valid
     language codes, and that the keys in the sub-dictionaries match the rules
@@ -487,7 +533,7 @@ def language_contents(instance):
         return
 
     for key, value in instance['contents'].items():
-        if key not in enums.LANG_CODES:
+        if key not in enums.LANG_CODES_SET:
             yield JSONError("Invalid key '%s' in 'contents' property must be"
                             " an RFC 5646 code" % key, instance['id'])
         for subkey, subvalue in value.items():
@@ -497,14 +543,17 @@ def language_contents(instance):
                                 % (subkey, key), instance['id'])
 
 
-def uuid_version_check(instance):
+@applies_to('artifact', 'email-message', 'user-account', 'windows-registry-key',
+            'x509-certificate')
+@needs_context
+def uuid_version_check(instance, context):
     """Ensure that an SCO with only optional ID Contributing Properties use a
     UUIDv4"""
     x = ['artifact', 'email-message', 'user-account', 'windows-registry-key', 'x509-certificate']
     if instance['type'] not in x or 'id' not in instance:
         return
 
-    object_id = uuid.UUID(instance['id'].split("--")[-1])
+    object_id = context.uuid
     if instance['type'] == 'artifact':
         x = ['hashes', 'payload_bin']
     elif instance['type'] == 'email-message':
@@ -521,13 +570,14 @@ def uuid_version_check(instance):
                         "must be used", instance['id'])
 
 
-def process(instance):
+@applies_to('process')
+@needs_context
+def process(instance, context):
     """Ensure that process objects use UUIDv4"""
     if instance['type'] != 'process':
         return
 
-    object_id = uuid.UUID(instance['id'].split("--")[-1])
-    if object_id.version != 4:
+    if context.uuid.version != 4:
         yield JSONError("A process object must use UUIDv4 for its id", instance['id'])
 
 
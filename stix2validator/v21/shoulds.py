@@ -3,6 +3,7 @@
 To add a new check:
 - in this module:
     - define a new function
+    - if it only applies to some object types, decorate it with applies_to()
     - add the function to CHECKS
     - add the function to list_shoulds()
 - in utils.py:
@@ -12,18 +13,18 @@ To add a new check:
 """
 
 from collections import Iterable
-from itertools import chain
 import re
-import uuid
 
 from cpe import CPE
 from six import string_types
-from stix2patterns.v21.pattern import Pattern
 
 from . import enums
 from ..errors import PatternError
 from ..output import info
-from ..util import cyber_observable_check, has_cyber_observable_data
+from ..pattern_cache import parse_pattern, pattern_limit_exceeded
+from ..util import (PropertyWalker, applies_to, compile_vocabularies,
+                    cyber_observable_check, has_cyber_observable_data,
+                    needs_context, visits)
 from ..v20.shoulds import enforce_relationship_refs
 from .errors import JSONError
 from .musts import (CUSTOM_EXT_LAX_PREFIX_RE, CUSTOM_EXT_PREFIX_RE,
@@ -33,14 +34,211 @@ from .musts import (CUSTOM_EXT_LAX_PREFIX_RE, CUSTOM_EXT_PREFIX_RE,
 PROTOCOL_RE = re.compile(r'^[a-zA-Z0-9-]{1,15}$')
 
 
+# Whether a custom name follows the strict naming conventions, only the
+# lenient ones, or neither
+PREFIX_INVALID, PREFIX_LAX, PREFIX_STRICT = range(3)
+
+# The (strict, lenient) expressions for each kind of custom name
+CUSTOM_PREFIX_RES = {
+    'type': (CUSTOM_TYPE_PREFIX_RE, CUSTOM_TYPE_LAX_PREFIX_RE),
+    'extension': (CUSTOM_EXT_PREFIX_RE, CUSTOM_EXT_LAX_PREFIX_RE),
+    'property': (CUSTOM_PROPERTY_PREFIX_RE, CUSTOM_PROPERTY_LAX_PREFIX_RE),
+}
+
+# Maximum number of names to remember the prefix class of
+PREFIX_CACHE_SIZE = 10000
+
+# Maps (kind, name) pairs to their prefix_class()
+_PREFIX_CLASSES = {}
+
+# Messages for custom names which do not follow the strict or the lenient
+# naming conventions, by where in an object the name is
+STRICT_PREFIX_MESSAGES = {
+    'object': "Custom object type '%s' should start with 'x-' followed by a "
+              "source unique identifier (like a domain name with dots "
+              "replaced by hyphens), a hyphen and then the name.",
+    'property': "Custom property '%s' should have a type that starts with "
+                "'x_' followed by a source unique identifier (like a domain "
+                "name with dots replaced by hyphen), a hyphen and then the "
+                "name.",
+    'observable-object': "Custom Observable Object type '%s' should start "
+                         "with 'x-' followed by a source unique identifier "
+                         "(like a domain name with dots replaced by "
+                         "hyphens), a hyphen and then the name.",
+    'extension': "Custom Cyber Observable Object extension type '%s' should "
+                 "start with 'x-' followed by a source unique identifier "
+                 "(like a domain name with dots replaced by hyphens), a "
+                 "hyphen and then the name.",
+    'observable-property': "Cyber Observable Object custom property '%s' "
+                           "should start with 'x_' followed by a source "
+                           "unique identifier (like a domain name with dots "
+                           "replaced by hyphens), a hyphen and then the "
+                           "name.",
+    'embedded-property': "Cyber Observable Object custom property '%s' in the "
+                         "%s property of %s object should start with 'x_' "
+                         "followed by a source unique identifier (like a "
+                         "domain name with dots replaced by hyphens), a "
+                         "hyphen and then the name.",
+    'extension-property': "Cyber Observable Object custom property '%s' in "
+                          "the %s extension should start with 'x_' followed "
+                          "by a source unique identifier (like a domain name "
+                          "with dots replaced by hyphens), a hyphen and then "
+                          "the name.",
+    'extension-embedded-property': "Cyber Observable Object custom property "
+                                   "'%s' in the %s property of the %s "
+                                   "extension should start with 'x_' followed "
+                                   "by a source unique identifier (like a "
+                                   "domain name with dots replaced by "
+                                   "hyphens), a hyphen and then the name.",
+}
+LAX_PREFIX_MESSAGES = {
+    'object': "Custom object type '%s' should start with 'x-' in order to be "
+              "compatible with future versions of the STIX 2 specification.",
+    'property': "Custom property '%s' should have a type that starts with "
+                "'x_' in order to be compatible with future versions of the "
+                "STIX 2 specification.",
+    'observable-object': "Custom Observable Object type '%s' should start "
+                         "with 'x-'.",
+    'extension': "Custom Cyber Observable Object extension type '%s' should "
+                 "start with 'x-'.",
+    'observable-property': "Cyber Observable Object custom property '%s' "
+                           "should start with 'x_'.",
+    'embedded-property': "Cyber Observable Object custom property '%s' in the "
+                         "%s property of %s object should start with 'x_'.",
+    'extension-property': "Cyber Observable Object custom property '%s' in "
+                          "the %s extension should start with 'x_'.",
+    'extension-embedded-property': "Cyber Observable Object custom property "
+                                   "'%s' in the %s property of the %s "
+                                   "extension should start with 'x_'.",
+}
+
+# Where in an object the names checked by each of the observable checks are
+OBSERVABLE_PROPERTY_NAMES = ('observable-property', 'embedded-property',
+                             'extension-property',
+                             'extension-embedded-property')
+
+
+def prefix_class(kind, name):
+    """Return PREFIX_STRICT if a custom name of the given kind ('type',
+    'extension' or 'property') follows the strict naming conventions,
+    PREFIX_LAX if it only follows the lenient ones, or PREFIX_INVALID.
+
+    Names recur across objects, so the results are remembered.
+    """
+    key = (kind, name)
+    try:
+        return _PREFIX_CLASSES[key]
+    except KeyError:
+        pass
+    strict_re, lax_re = CUSTOM_PREFIX_RES[kind]
+    if strict_re.match(name):
+        result = PREFIX_STRICT
+    elif lax_re.match(name):
+        result = PREFIX_LAX
+    else:
+        result = PREFIX_INVALID
+    if len(_PREFIX_CLASSES) >= PREFIX_CACHE_SIZE:
+        _PREFIX_CLASSES.clear()
+    _PREFIX_CLASSES[key] = result
+    return result
+
+
+def custom_names(instance):
+    """Walk the names in a STIX object once, yielding a (where, kind, name,
+    args) tuple for each one which the specification does not define, where
+    ``where`` is a key of the prefix messages, ``kind`` is the kind of name
+    for prefix_class() and ``args`` are the values for the message.
+
+    Does not check property names in custom objects.
+    """
+    type_ = instance['type']
+    if (type_ not in enums.TYPES_SET and
+            type_ not in enums.RESERVED_OBJECTS_SET and
+            type_ not in enums.OBSERVABLE_TYPES_SET):
+        yield 'object', 'type', type_, (type_,)
+
+    if type_ in enums.PROPERTIES_SETS:
+        defined = enums.PROPERTIES_SETS[type_]
+        for prop_name in instance:
+            if (prop_name not in defined and
+                    prop_name not in enums.RESERVED_PROPERTIES_SET):
+                yield 'property', 'property', prop_name, (prop_name,)
+
+    if not has_cyber_observable_data(instance, '2.1'):
+        return
+
+    if (type_ not in enums.OBSERVABLE_TYPES_SET and
+            type_ not in enums.OBSERVABLE_RESERVED_OBJECTS_SET):
+        yield 'observable-object', 'type', type_, (type_,)
+
+    if 'extensions' in instance and type_ in enums.OBSERVABLE_EXTENSIONS_SETS:
+        defined = enums.OBSERVABLE_EXTENSIONS_SETS[type_]
+        for ext_key in instance['extensions']:
+            if ext_key not in defined:
+                yield 'extension', 'extension', ext_key, (ext_key,)
+
+    for prop in instance:
+        # Check objects' properties
+        if (type_ in enums.OBSERVABLE_PROPERTIES_SETS and
+                prop not in enums.OBSERVABLE_PROPERTIES_SETS[type_]):
+            yield 'observable-property', 'property', prop, (prop,)
+        # Check properties of embedded cyber observable types
+        if (type_ in enums.OBSERVABLE_EMBEDDED_PROPERTIES_SETS and
+                prop in enums.OBSERVABLE_EMBEDDED_PROPERTIES_SETS[type_]):
+            defined = enums.OBSERVABLE_EMBEDDED_PROPERTIES_SETS[type_][prop]
+            for embed_prop in instance[prop]:
+                if isinstance(embed_prop, dict):
+                    for embedded in embed_prop:
+                        if embedded not in defined:
+                            yield ('embedded-property', 'property', embedded,
+                                   (embedded, prop, type_))
+                elif embed_prop not in defined:
+                    yield ('embedded-property', 'property', embed_prop,
+                           (embed_prop, prop, type_))
+
+    # Check object extensions' properties
+    if not (type_ in enums.OBSERVABLE_EXTENSIONS_SETS and 'extensions' in instance):
+        return
+    for ext_key in instance['extensions']:
+        if ext_key not in enums.OBSERVABLE_EXTENSIONS_SETS[type_]:
+            continue
+        extension = instance['extensions'][ext_key]
+        for ext_prop in extension:
+            if ext_prop not in enums.OBSERVABLE_EXTENSION_PROPERTIES_SETS[ext_key]:
+                yield ('extension-property', 'property', ext_prop,
+                       (ext_prop, ext_key))
+
+        embedded_props = enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES_SETS.get(ext_key, {})
+        for ext_prop in extension:
+            if ext_prop not in embedded_props:
+                continue
+            for embed_prop in extension[ext_prop]:
+                if not (isinstance(embed_prop, Iterable) and not isinstance(embed_prop, string_types)):
+                    embed_prop = [embed_prop]
+                for p in embed_prop:
+                    if p not in embedded_props[ext_prop]:
+                        yield ('extension-embedded-property', 'property', p,
+                               (p, ext_prop, ext_key))
+
+
+def custom_prefix_errors(instance, level, wheres=None):
+    """Yield an error for each custom name in a STIX object which does not
+    follow the strict (level PREFIX_STRICT) or the lenient (PREFIX_LAX)
+    naming conventions, optionally only for names in the given places.
+    """
+    if level == PREFIX_STRICT:
+        messages, code = STRICT_PREFIX_MESSAGES, 'custom-prefix'
+    else:
+        messages, code = LAX_PREFIX_MESSAGES, 'custom-prefix-lax'
+    for where, kind, name, args in custom_names(instance):
+        if (wheres is None or where in wheres) and prefix_class(kind, name) < level:
+            yield JSONError(messages[where] % args, instance['id'], code)
+
+
 def custom_prefix_strict(instance):
     """Ensure custom content follows strict naming style conventions.
     """
-    for error in chain(custom_object_prefix_strict(instance),
-                       custom_property_prefix_strict(instance),
-                       custom_observable_object_prefix_strict(instance),
-                       custom_object_extension_prefix_strict(instance),
-                       custom_observable_properties_prefix_strict(instance)):
+    for error in custom_prefix_errors(instance, PREFIX_STRICT):
         yield error
 
 
@@ -48,40 +246,23 @@ def custom_prefix_lax(instance):
     """Ensure custom content follows lenient naming style conventions
     for forward-compatibility.
     """
-    for error in chain(custom_object_prefix_lax(instance),
-                       custom_property_prefix_lax(instance),
-                       custom_observable_object_prefix_lax(instance),
-                       custom_object_extension_prefix_lax(instance),
-                       custom_observable_properties_prefix_lax(instance)):
+    for error in custom_prefix_errors(instance, PREFIX_LAX):
         yield error
 
 
 def custom_object_prefix_strict(instance):
     """Ensure custom objects follow strict naming style conventions.
     """
-    if (instance['type'] not in enums.TYPES and
-            instance['type'] not in enums.RESERVED_OBJECTS and
-            instance['type'] not in enums.OBSERVABLE_TYPES and
-            not CUSTOM_TYPE_PREFIX_RE.match(instance['type'])):
-        yield JSONError("Custom object type '%s' should start with 'x-' "
-                        "followed by a source unique identifier (like a "
-                        "domain name with dots replaced by hyphens), a hyphen "
-                        "and then the name." % instance['type'],
-                        instance['id'], 'custom-prefix')
+    for error in custom_prefix_errors(instance, PREFIX_STRICT, ('object',)):
+        yield error
 
 
 def custom_object_prefix_lax(instance):
     """Ensure custom objects follow lenient naming style conventions
     for forward-compatibility.
     """
-    if (instance['type'] not in enums.TYPES and
-            instance['type'] not in enums.RESERVED_OBJECTS and
-            not CUSTOM_TYPE_LAX_PREFIX_RE.match(instance['type'])
-            and instance['type'] not in enums.OBSERVABLE_TYPES):
-        yield JSONError("Custom object type '%s' should start with 'x-' in "
-                        "order to be compatible with future versions of the "
-                        "STIX 2 specification." % instance['type'],
-                        instance['id'], 'custom-prefix-lax')
+    for error in custom_prefix_errors(instance, PREFIX_LAX, ('object',)):
+        yield error
 
 
 def custom_property_prefix_strict(instance):
@@ -89,18 +270,8 @@ def custom_property_prefix_strict(instance):
 
     Does not check property names in custom objects.
     """
-    for prop_name in instance.keys():
-        if (instance['type'] in enums.PROPERTIES and
-                prop_name not in enums.PROPERTIES[instance['type']] and
-                prop_name not in enums.RESERVED_PROPERTIES and
-                not CUSTOM_PROPERTY_PREFIX_RE.match(prop_name)):
-
-            yield JSONError("Custom property '%s' should have a type that "
-                            "starts with 'x_' followed by a source unique "
-                            "identifier (like a domain name with dots "
-                            "replaced by hyphen), a hyphen and then the name."
-                            % prop_name, instance['id'],
-                            'custom-prefix')
+    for error in custom_prefix_errors(instance, PREFIX_STRICT, ('property',)):
+        yield error
 
 
 def custom_property_prefix_lax(instance):
@@ -109,18 +280,11 @@ def custom_property_prefix_lax(instance):
 
     Does not check property names in custom objects.
     """
-    for prop_name in instance.keys():
-        if (instance['type'] in enums.PROPERTIES and
-                prop_name not in enums.PROPERTIES[instance['type']] and
-                prop_name not in enums.RESERVED_PROPERTIES and
-                not CUSTOM_PROPERTY_LAX_PREFIX_RE.match(prop_name)):
-            yield JSONError("Custom property '%s' should have a type that "
-                            "starts with 'x_' in order to be compatible with "
-                            "future versions of the STIX 2 specification." %
-                            prop_name, instance['id'],
-                            'custom-prefix-lax')
+    for error in custom_prefix_errors(instance, PREFIX_LAX, ('property',)):
+        yield error
 
 
+@applies_to(*enums.DEPRECATED_PROPERTIES)
 def deprecated_property_check(instance):
     """Check to see if any included properties are deprecated within the spec
     """
@@ -135,6 +299,7 @@ def deprecated_property_check(instance):
                             'deprecated-properties')
 
 
+@applies_to('indicator')
 def indicator_property_check(instance):
     """Check to see if name and decription properties are present
     """
@@ -146,7 +311,8 @@ def indicator_property_check(instance):
                         'indicator-properties')
 
 
-def uuid_check(instance):
+@needs_context
+def uuid_check(instance, context):
     """Ensure Domain Objects, Relationship Objects, Meta Objects, and Bundles
     use UUIDv4 for their IDs, and Cyber Observables use UUIDv5.
 
@@ -155,8 +321,8 @@ def uuid_check(instance):
     if 'id' not in instance:
         return
 
-    object_id = uuid.UUID(instance['id'].split("--")[-1])
-    if has_cyber_observable_data(instance, "2.1") and instance['type'] != 'process':
+    object_id = context.uuid
+    if context.has_cyber_observable_data("2.1") and instance['type'] != 'process':
         if object_id.version != 5:
             yield JSONError("Cyber Observable ID value %s is not a valid UUIDv5 ID."
                             % instance['id'], instance['id'], 'uuid-check')
@@ -179,6 +345,7 @@ def os_execution_envs_check(instance):
                             'os-execution-envs')
 
 
+@applies_to(*enums.VOCAB_PROPERTIES)
 def open_vocab_values(instance):
     """Ensure that the values of all properties which use open vocabularies are
     in lowercase and use hyphens instead of spaces or underscores as word
@@ -206,11 +373,12 @@ def open_vocab_values(instance):
                                     'open-vocab-format')
 
 
+@applies_to(*enums.KILL_CHAIN_PHASE_USES)
 def kill_chain_phase_names(instance):
     """Ensure the `kill_chain_name` and `phase_name` properties of
     `kill_chain_phase` objects follow naming style conventions.
     """
-    if instance['type'] in enums.KILL_CHAIN_PHASE_USES and 'kill_chain_phases' in instance:
+    if instance['type'] in enums.KILL_CHAIN_PHASE_USES_SET and 'kill_chain_phases' in instance:
         for phase in instance['kill_chain_phases']:
 
             if 'kill_chain_name' not in phase:
@@ -232,6 +400,10 @@ def kill_chain_phase_names(instance):
                                 instance['id'], 'kill-chain-names')
 
 
+# The open vocabularies in enums, by name and then by object type
+VOCABULARIES = compile_vocabularies(enums)
+
+
 def check_vocab(instance, vocab, code):
     """Ensure that the open vocabulary specified by `vocab` is used properly.
 
@@ -239,141 +411,163 @@ def check_vocab(instance, vocab, code):
     dictionary to determine which properties SHOULD use the given vocabulary,
     then checks that the values in those properties are from the vocabulary.
     """
-    vocab_uses = getattr(enums, vocab + "_USES")
-    for k in vocab_uses.keys():
-        if instance['type'] == k:
-            for prop in vocab_uses[k]:
-                if prop not in instance:
-                    continue
+    for prop, vocab_ov in VOCABULARIES[vocab].get(instance['type'], ()):
+        if prop not in instance:
+            continue
 
-                vocab_ov = getattr(enums, vocab + "_OV")
-                if type(instance[prop]) is list:
-                    is_in = set(instance[prop]).issubset(set(vocab_ov))
-                else:
-                    is_in = instance[prop] in vocab_ov
+        value = instance[prop]
+        try:
+            if type(value) is list:
+                is_in = vocab_ov.issuperset(value)
+            else:
+                is_in = value in vocab_ov
+        except TypeError:
+            # Unhashable values such as objects aren't in any vocabulary
+            is_in = False
 
-                if not is_in:
-                    vocab_name = vocab.replace('_', '-').lower()
-                    yield JSONError("%s contains a value not in the %s-ov "
-                                    "vocabulary." % (prop, vocab_name),
-                                    instance['id'], code)
+        if not is_in:
+            vocab_name = vocab.replace('_', '-').lower()
+            yield JSONError("%s contains a value not in the %s-ov "
+                            "vocabulary." % (prop, vocab_name),
+                            instance['id'], code)
 
 
+@applies_to(*enums.ATTACK_MOTIVATION_USES)
 def vocab_attack_motivation(instance):
     return check_vocab(instance, "ATTACK_MOTIVATION",
                        'attack-motivation')
 
 
+@applies_to(*enums.ATTACK_RESOURCE_LEVEL_USES)
 def vocab_attack_resource_level(instance):
     return check_vocab(instance, "ATTACK_RESOURCE_LEVEL",
                        'attack-resource-level')
 
 
+@applies_to(*enums.COURSE_OF_ACTION_TYPE_USES)
 def vocab_course_of_action_type(instance):
     return check_vocab(instance, "COURSE_OF_ACTION_TYPE",
                        'course-of-action-type')
 
 
+@applies_to(*enums.GROUPING_CONTEXT_USES)
 def vocab_grouping_context(instance):
     return check_vocab(instance, "GROUPING_CONTEXT",
                        'grouping-context')
 
 
+@applies_to(*enums.IDENTITY_CLASS_USES)
 def vocab_identity_class(instance):
     return check_vocab(instance, "IDENTITY_CLASS",
                        'identity-class')
 
 
+@applies_to(*enums.IMPLEMENTATION_LANGUAGES_USES)
 def vocab_implementation_languages(instance):
     return check_vocab(instance, "IMPLEMENTATION_LANGUAGES",
                        'implementation-languages')
 
 
+@applies_to(*enums.INDICATOR_TYPE_USES)
 def vocab_indicator_types(instance):
     return check_vocab(instance, "INDICATOR_TYPE",
                        'indicator-types')
 
 
+@applies_to(*enums.INFRASTRUCTURE_TYPE_USES)
 def vocab_infrastructure_types(instance):
     return check_vocab(instance, "INFRASTRUCTURE_TYPE",
                        'infrastructure-types')
 
 
+@applies_to(*enums.INDUSTRY_SECTOR_USES)
 def vocab_industry_sector(instance):
     return check_vocab(instance, "INDUSTRY_SECTOR",
                        'industry-sector')
 
 
+@applies_to(*enums.MALWARE_TYPE_USES)
 def vocab_malware_types(instance):
     return check_vocab(instance, "MALWARE_TYPE",
                        'malware-types')
 
 
+@applies_to(*enums.MALWARE_CAPABILITIES_USES)
 def vocab_malware_capabilities(instance):
     return check_vocab(instance, "MALWARE_CAPABILITIES",
                        'malware-capabilities')
 
 
+@applies_to(*enums.PROCESSOR_ARCHITECTURE_USES)
 def vocab_processor_architecture(instance):
     return check_vocab(instance, "PROCESSOR_ARCHITECTURE",
                        'processor-architecture')
 
 
+@applies_to(*enums.REPORT_TYPE_USES)
 def vocab_report_types(instance):
     return check_vocab(instance, "REPORT_TYPE",
                        'report-types')
 
 
+@applies_to(*enums.THREAT_ACTOR_TYPE_USES)
 def vocab_threat_actor_types(instance):
     return check_vocab(instance, "THREAT_ACTOR_TYPE",
                        'threat-actor-types')
 
 
+@applies_to(*enums.THREAT_ACTOR_ROLE_USES)
 def vocab_threat_actor_role(instance):
     return check_vocab(instance, "THREAT_ACTOR_ROLE",
                        'threat-actor-role')
 
 
+@applies_to(*enums.THREAT_ACTOR_SOPHISTICATION_USES)
 def vocab_threat_actor_sophistication_level(instance):
     return check_vocab(instance, "THREAT_ACTOR_SOPHISTICATION",
                        'threat-actor-sophistication')
 
 
+@applies_to(*enums.TOOL_TYPE_USES)
 def vocab_tool_types(instance):
     return check_vocab(instance, "TOOL_TYPE",
                        'tool-types')
 
 
+@applies_to(*enums.REGION_USES)
 def vocab_region(instance):
     return check_vocab(instance, "REGION",
                        'region')
 
 
+@applies_to(*enums.INDICATOR_PATTERN_USES)
 def vocab_pattern_type(instance):
     return check_vocab(instance, "INDICATOR_PATTERN",
                        'indicator-pattern-types')
 
 
+@applies_to('marking-definition')
 def vocab_marking_definition(instance):
     """Ensure that the `definition_type` property of `marking-definition`
     objects is one of the values in the STIX 2.0 specification.
     """
     if (instance['type'] == 'marking-definition' and
             'definition_type' in instance and not
-            instance['definition_type'] in enums.MARKING_DEFINITION_TYPES):
+            instance['definition_type'] in enums.MARKING_DEFINITION_TYPES_SET):
 
         return JSONError("Marking definition `definition_type` should be one "
                          "of: %s." % ', '.join(enums.MARKING_DEFINITION_TYPES),
                          instance['id'], 'marking-definition-type')
 
 
+@applies_to('relationship')
 def relationships_strict(instance):
     """Ensure that only the relationship types defined in the specification are
     used.
     """
     # Don't check objects that aren't relationships or that are custom objects
     if (instance['type'] != 'relationship' or
-            instance['type'] not in enums.TYPES):
+            instance['type'] not in enums.TYPES_SET):
         return
 
     if ('relationship_type' not in instance or 'source_ref' not in instance or
@@ -383,59 +577,79 @@ def relationships_strict(instance):
 
     r_type = instance['relationship_type']
     try:
-        r_source = re.search(r"(.+)\-\-", instance['source_ref']).group(1)
-        r_target = re.search(r"(.+)\-\-", instance['target_ref']).group(1)
-    except (AttributeError, TypeError):
+        r_source = instance['source_ref'].rpartition('--')[0]
+        r_target = instance['target_ref'].rpartition('--')[0]
+    except AttributeError:
+        r_source = r_target = None
+    if not r_source or not r_target:
         # Schemas already catch errors of these properties not being strings or
         # not containing the string '--'.
         return
 
-    if (r_type in enums.COMMON_RELATIONSHIPS or
-            r_source in enums.NON_SDOS or
-            r_target in enums.NON_SDOS):
+    if (r_source, r_type, r_target) in enums.RELATIONSHIP_MATRIX:
+        return
+
+    if (r_type in enums.COMMON_RELATIONSHIPS_SET or
+            r_source in enums.NON_SDOS_SET or
+            r_target in enums.NON_SDOS_SET):
         # If all objects can have this relationship type, no more checks needed
         # Schemas already catch if source/target type cannot have relationship
         return
 
-    if r_source not in enums.RELATIONSHIPS:
+    if r_source not in enums.RELATIONSHIPS_SETS:
         return JSONError("'%s' is not a suggested relationship source object "
                          "for the '%s' relationship." % (r_source, r_type),
                          instance['id'], 'relationship-types')
 
-    if r_type not in enums.RELATIONSHIPS[r_source]:
+    if r_type not in enums.RELATIONSHIPS_SETS[r_source]:
         return JSONError("'%s' is not a suggested relationship type for '%s' "
                          "objects." % (r_type, r_source), instance['id'],
                          'relationship-types')
 
-    if r_target not in enums.RELATIONSHIPS[r_source][r_type]:
+    if r_target not in enums.RELATIONSHIPS_SETS[r_source][r_type]:
         return JSONError("'%s' is not a suggested relationship target object "
                          "for '%s' objects with the '%s' relationship."
                          % (r_target, r_source, r_type), instance['id'],
                          'relationship-types')
 
 
+# Property paths of the hashes of cyber observable objects and their extensions
+HASHES_PATH = ('hashes',)
+NTFS_ADS_PATH = ('extensions', 'ntfs-ext', 'alternate_data_streams')
+PE_FILE_HEADER_HASHES_PATH = ('extensions', 'windows-pebinary-ext', 'file_header_hashes')
+PE_OPTIONAL_HEADER_HASHES_PATH = ('extensions', 'windows-pebinary-ext', 'optional_header', 'hashes')
+PE_SECTIONS_PATH = ('extensions', 'windows-pebinary-ext', 'sections')
+HASHES_PATHS = (HASHES_PATH, NTFS_ADS_PATH, PE_FILE_HEADER_HASHES_PATH,
+                PE_OPTIONAL_HEADER_HASHES_PATH, PE_SECTIONS_PATH)
+# Finds the hashes for the checks when they are called directly
+HASHES_WALKER = PropertyWalker(HASHES_PATHS)
+
+
 def valid_hash_value(hashname):
     """Return true if given value is a valid, recommended hash name according
     to the STIX 2 specification.
     """
     custom_hash_prefix_re = re.compile(r"^x_")
-    if hashname in enums.HASH_ALGO_OV or custom_hash_prefix_re.match(hashname):
+    if hashname in enums.HASH_ALGO_OV_SET or custom_hash_prefix_re.match(hashname):
         return True
     else:
         return False
 
 
+@visits(*HASHES_PATHS)
 @cyber_observable_check("2.1")
-def vocab_hash_algo(instance):
+def vocab_hash_algo(instance, properties=None):
     """Ensure objects with 'hashes' properties only use values from the
     hash-algorithm-ov vocabulary.
     """
     key = instance['id']
     if 'type' not in instance:
         return
+    if properties is None:
+        properties = HASHES_WALKER.walk(instance)
 
-    if instance['type'] in ['file', 'artifact', 'x509-certificate'] and 'hashes' in instance:
-        hashes = instance['hashes']
+    if instance['type'] in ['file', 'artifact', 'x509-certificate'] and HASHES_PATH in properties:
+        hashes = properties[HASHES_PATH]
         for h in hashes:
             if not (valid_hash_value(h)):
                 yield JSONError("Object '%s' has a 'hashes' dictionary"
@@ -445,9 +659,8 @@ def vocab_hash_algo(instance):
                                 % (key, h), instance['id'], 'hash-algo')
 
     if instance['type'] == 'file' and 'extensions' in instance:
-        # if 'ntfs-ext' in instance['extensions'] and 'alternate_data_streams' in instance['extensions']['ntfs-ext']:
         try:
-            ads = instance['extensions']['ntfs-ext']['alternate_data_streams']
+            ads = properties[NTFS_ADS_PATH]
         except KeyError:
             pass
         else:
@@ -465,7 +678,7 @@ def vocab_hash_algo(instance):
                                         % (key, h), instance['id'], 'hash-algo')
 
         try:
-            head_hashes = instance['extensions']['windows-pebinary-ext']['file_header_hashes']
+            head_hashes = properties[PE_FILE_HEADER_HASHES_PATH]
         except KeyError:
             pass
         else:
@@ -479,7 +692,7 @@ def vocab_hash_algo(instance):
                                     % (key, h), instance['id'], 'hash-algo')
 
         try:
-            hashes = instance['extensions']['windows-pebinary-ext']['optional_header']['hashes']
+            hashes = properties[PE_OPTIONAL_HEADER_HASHES_PATH]
         except KeyError:
             pass
         else:
@@ -493,7 +706,7 @@ def vocab_hash_algo(instance):
                                     % (key, h), instance['id'], 'hash-algo')
 
         try:
-            sections = instance['extensions']['windows-pebinary-ext']['sections']
+            sections = properties[PE_SECTIONS_PATH]
         except KeyError:
             pass
         else:
@@ -521,7 +734,7 @@ def vocab_windows_pebinary_type(instance):
             pe_type = instance['extensions']['windows-pebinary-ext']['pe_type']
         except KeyError:
             return
-        if pe_type not in enums.WINDOWS_PEBINARY_TYPE_OV:
+        if pe_type not in enums.WINDOWS_PEBINARY_TYPE_OV_SET:
             yield JSONError("Object '%s' has a Windows PE Binary File "
                             "extension with a 'pe_type' of '%s', which is not a "
                             "value in the windows-pebinary-type-ov vocabulary."
@@ -540,7 +753,7 @@ def vocab_account_type(instance):
             acct_type = instance['account_type']
         except KeyError:
             return
-        if acct_type not in enums.ACCOUNT_TYPE_OV:
+        if acct_type not in enums.ACCOUNT_TYPE_OV_SET:
             yield JSONError("Object '%s' is a User Account Object "
                             "with an 'account_type' of '%s', which is not a "
                             "value in the account-type-ov vocabulary."
@@ -570,7 +783,7 @@ def test_dict_keys(item, inst_id):
             yield JSONError("As a dictionary key, '%s' should be lowercase."
                             % k, inst_id, 'observable-dictionary-keys')
 
-        if type(v) is dict and k not in enums.OBSERVABLE_DICT_KEY_EXCEPTIONS:
+        if type(v) is dict and k not in enums.OBSERVABLE_DICT_KEY_EXCEPTIONS_SET:
             for error in test_dict_keys(v, inst_id):
                 yield error
 
@@ -588,28 +801,16 @@ def observable_dictionary_keys(instance):
 def custom_observable_object_prefix_strict(instance):
     """Ensure custom observable objects follow strict naming style conventions.
     """
-    if ('type' in instance and instance['type'] not in enums.OBSERVABLE_TYPES and
-            instance['type'] not in enums.OBSERVABLE_RESERVED_OBJECTS and
-            not CUSTOM_TYPE_PREFIX_RE.match(instance['type'])):
-        yield JSONError("Custom Observable Object type '%s' should start "
-                        "with 'x-' followed by a source unique identifier "
-                        "(like a domain name with dots replaced by "
-                        "hyphens), a hyphen and then the name."
-                        % instance['type'], instance['id'],
-                        'custom-prefix')
+    for error in custom_prefix_errors(instance, PREFIX_STRICT, ('observable-object',)):
+        yield error
 
 
 @cyber_observable_check("2.1")
 def custom_observable_object_prefix_lax(instance):
     """Ensure custom observable objects follow naming style conventions.
     """
-    if ('type' in instance and instance['type'] not in enums.OBSERVABLE_TYPES and
-            instance['type'] not in enums.OBSERVABLE_RESERVED_OBJECTS and
-            not CUSTOM_TYPE_LAX_PREFIX_RE.match(instance['type'])):
-        yield JSONError("Custom Observable Object type '%s' should start "
-                        "with 'x-'."
-                        % instance['type'], instance['id'],
-                        'custom-prefix-lax')
+    for error in custom_prefix_errors(instance, PREFIX_LAX, ('observable-object',)):
+        yield error
 
 
 @cyber_observable_check("2.1")
@@ -617,18 +818,8 @@ def custom_object_extension_prefix_strict(instance):
     """Ensure custom observable object extensions follow strict naming style
     conventions.
     """
-    if not ('extensions' in instance and 'type' in instance and
-            instance['type'] in enums.OBSERVABLE_EXTENSIONS):
-        return
-    for ext_key in instance['extensions']:
-        if (ext_key not in enums.OBSERVABLE_EXTENSIONS[instance['type']] and
-                not CUSTOM_EXT_PREFIX_RE.match(ext_key)):
-            yield JSONError("Custom Cyber Observable Object extension type"
-                            " '%s' should start with 'x-' followed by a source "
-                            "unique identifier (like a domain name with dots "
-                            "replaced by hyphens), a hyphen and then the name."
-                            % ext_key, instance['id'],
-                            'custom-prefix')
+    for error in custom_prefix_errors(instance, PREFIX_STRICT, ('extension',)):
+        yield error
 
 
 @cyber_observable_check("2.1")
@@ -636,16 +827,8 @@ def custom_object_extension_prefix_lax(instance):
     """Ensure custom observable object extensions follow naming style
     conventions.
     """
-    if not ('extensions' in instance and 'type' in instance and
-            instance['type'] in enums.OBSERVABLE_EXTENSIONS):
-        return
-    for ext_key in instance['extensions']:
-        if (ext_key not in enums.OBSERVABLE_EXTENSIONS[instance['type']] and
-                not CUSTOM_EXT_LAX_PREFIX_RE.match(ext_key)):
-            yield JSONError("Custom Cyber Observable Object extension type"
-                            " '%s' should start with 'x-'."
-                            % ext_key, instance['id'],
-                            'custom-prefix-lax')
+    for error in custom_prefix_errors(instance, PREFIX_LAX, ('extension',)):
+        yield error
 
 
 @cyber_observable_check("2.1")
@@ -653,87 +836,8 @@ def custom_observable_properties_prefix_strict(instance):
     """Ensure observable object custom properties follow strict naming style
     conventions.
     """
-    if 'type' not in instance:
-        return
-    type_ = instance['type']
-
-    for prop in instance:
-        # Check objects' properties
-        if (type_ in enums.OBSERVABLE_PROPERTIES and
-            prop not in enums.OBSERVABLE_PROPERTIES[type_] and
-                not CUSTOM_PROPERTY_PREFIX_RE.match(prop)):
-            yield JSONError("Cyber Observable Object custom property '%s' "
-                            "should start with 'x_' followed by a source "
-                            "unique identifier (like a domain name with "
-                            "dots replaced by hyphens), a hyphen and then the"
-                            " name."
-                            % prop, instance['id'],
-                            'custom-prefix')
-        # Check properties of embedded cyber observable types
-        if (type_ in enums.OBSERVABLE_EMBEDDED_PROPERTIES and
-                prop in enums.OBSERVABLE_EMBEDDED_PROPERTIES[type_]):
-            for embed_prop in instance[prop]:
-                if isinstance(embed_prop, dict):
-                    for embedded in embed_prop:
-                        if (embedded not in enums.OBSERVABLE_EMBEDDED_PROPERTIES[type_][prop] and
-                                not CUSTOM_PROPERTY_PREFIX_RE.match(embedded)):
-                            yield JSONError("Cyber Observable Object custom "
-                                            "property '%s' in the %s property of "
-                                            "%s object should start with 'x_' "
-                                            "followed by a source unique "
-                                            "identifier (like a domain name with "
-                                            "dots replaced by hyphens), a hyphen and "
-                                            "then the name."
-                                            % (embedded, prop, type_), instance['id'],
-                                            'custom-prefix')
-                elif (embed_prop not in enums.OBSERVABLE_EMBEDDED_PROPERTIES[type_][prop] and
-                        not CUSTOM_PROPERTY_PREFIX_RE.match(embed_prop)):
-                    yield JSONError("Cyber Observable Object custom "
-                                    "property '%s' in the %s property of "
-                                    "%s object should start with 'x_' "
-                                    "followed by a source unique "
-                                    "identifier (like a domain name with "
-                                    "dots replaced by hyphens), a hyphen and "
-                                    "then the name."
-                                    % (embed_prop, prop, type_), instance['id'],
-                                    'custom-prefix')
-
-    # Check object extensions' properties
-    if (type_ in enums.OBSERVABLE_EXTENSIONS and 'extensions' in instance):
-        for ext_key in instance['extensions']:
-
-            if ext_key in enums.OBSERVABLE_EXTENSIONS[type_]:
-                for ext_prop in instance['extensions'][ext_key]:
-                    if (ext_prop not in enums.OBSERVABLE_EXTENSION_PROPERTIES[ext_key] and
-                            not CUSTOM_PROPERTY_PREFIX_RE.match(ext_prop)):
-                        yield JSONError("Cyber Observable Object custom "
-                                        "property '%s' in the %s extension "
-                                        "should start with 'x_' followed by a "
-                                        "source unique identifier (like a "
-                                        "domain name with dots replaced by "
-                                        "hyphens), a hyphen and then the name."
-                                        % (ext_prop, ext_key), instance['id'],
-                                        'custom-prefix')
-
-            if ext_key in enums.OBSERVABLE_EXTENSIONS[type_]:
-                for ext_prop in instance['extensions'][ext_key]:
-                    if (ext_key in enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES and
-                            ext_prop in enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES[ext_key]):
-                        for embed_prop in instance['extensions'][ext_key][ext_prop]:
-                            if not (isinstance(embed_prop, Iterable) and not isinstance(embed_prop, string_types)):
-                                embed_prop = [embed_prop]
-                            for p in embed_prop:
-                                if (p not in enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES[ext_key][ext_prop] and
-                                        not CUSTOM_PROPERTY_PREFIX_RE.match(p)):
-                                    yield JSONError("Cyber Observable Object "
-                                                    "custom property '%s' in the %s "
-                                                    "property of the %s extension should "
-                                                    "start with 'x_' followed by a source "
-                                                    "unique identifier (like a domain name"
-                                                    " with dots replaced by hyphens), a "
-                                                    "hyphen and then the name."
-                                                    % (p, ext_prop, ext_key), instance['id'],
-                                                    'custom-prefix')
+    for error in custom_prefix_errors(instance, PREFIX_STRICT, OBSERVABLE_PROPERTY_NAMES):
+        yield error
 
 
 @cyber_observable_check("2.1")
@@ -741,70 +845,8 @@ def custom_observable_properties_prefix_lax(instance):
     """Ensure observable object custom properties follow naming style
     conventions.
     """
-    if 'type' not in instance:
-        return
-    type_ = instance['type']
-
-    for prop in instance:
-        # Check objects' properties
-        if (type_ in enums.OBSERVABLE_PROPERTIES and
-            prop not in enums.OBSERVABLE_PROPERTIES[type_] and
-                not CUSTOM_PROPERTY_LAX_PREFIX_RE.match(prop)):
-            yield JSONError("Cyber Observable Object custom property '%s' "
-                            "should start with 'x_'."
-                            % prop, instance['id'],
-                            'custom-prefix-lax')
-        # Check properties of embedded cyber observable types
-        if (type_ in enums.OBSERVABLE_EMBEDDED_PROPERTIES and
-                prop in enums.OBSERVABLE_EMBEDDED_PROPERTIES[type_]):
-            for embed_prop in instance[prop]:
-                if isinstance(embed_prop, dict):
-                    for embedded in embed_prop:
-                        if (embedded not in enums.OBSERVABLE_EMBEDDED_PROPERTIES[type_][prop] and
-                                not CUSTOM_PROPERTY_LAX_PREFIX_RE.match(embedded)):
-                            yield JSONError("Cyber Observable Object custom "
-                                            "property '%s' in the %s property of "
-                                            "%s object should start with 'x_'."
-                                            % (embedded, prop, type_), instance['id'],
-                                            'custom-prefix-lax')
-                elif (embed_prop not in enums.OBSERVABLE_EMBEDDED_PROPERTIES[type_][prop] and
-                        not CUSTOM_PROPERTY_LAX_PREFIX_RE.match(embed_prop)):
-                    yield JSONError("Cyber Observable Object custom "
-                                    "property '%s' in the %s property of "
-                                    "%s object should start with 'x_'."
-                                    % (embed_prop, prop, type_), instance['id'],
-                                    'custom-prefix-lax')
-
-    # Check object extensions' properties
-    if (type_ in enums.OBSERVABLE_EXTENSIONS and 'extensions' in instance):
-        for ext_key in instance['extensions']:
-
-            if ext_key in enums.OBSERVABLE_EXTENSIONS[type_]:
-                for ext_prop in instance['extensions'][ext_key]:
-                    if (ext_prop not in enums.OBSERVABLE_EXTENSION_PROPERTIES[ext_key] and
-                            not CUSTOM_PROPERTY_LAX_PREFIX_RE.match(ext_prop)):
-                        yield JSONError("Cyber Observable Object custom "
-                                        "property '%s' in the %s extension "
-                                        "should start with 'x_'."
-                                        % (ext_prop, ext_key), instance['id'],
-                                        'custom-prefix-lax')
-
-            if ext_key in enums.OBSERVABLE_EXTENSIONS[type_]:
-                for ext_prop in instance['extensions'][ext_key]:
-                    if (ext_key in enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES and
-                            ext_prop in enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES[ext_key]):
-                        for embed_prop in instance['extensions'][ext_key][ext_prop]:
-                            if not (isinstance(embed_prop, Iterable) and not isinstance(embed_prop, string_types)):
-                                embed_prop = [embed_prop]
-                            for p in embed_prop:
-                                if (p not in enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES[ext_key][ext_prop] and
-                                        not CUSTOM_PROPERTY_LAX_PREFIX_RE.match(p)):
-                                    yield JSONError("Cyber Observable Object "
-                                                    "custom property '%s' in the %s "
-                                                    "property of the %s extension should "
-                                                    "start with 'x_'."
-                                                    % (p, ext_prop, ext_key), instance['id'],
-                                                    'custom-prefix-lax')
+    for error in custom_prefix_errors(instance, PREFIX_LAX, OBSERVABLE_PROPERTY_NAMES):
+        yield error
 
 
 @cyber_observable_check("2.1")
@@ -915,7 +957,7 @@ def http_request_headers(instance):
             return
 
         for hdr in headers:
-            if hdr not in enums.HTTP_REQUEST_HEADERS:
+            if hdr not in enums.HTTP_REQUEST_HEADERS_SET:
                 yield JSONError("The 'request_header' property of object "
                                 "'%s' contains an invalid HTTP request "
                                 "header ('%s')."
@@ -935,7 +977,7 @@ def socket_options(instance):
             return
 
         for opt in options:
-            if opt not in enums.SOCKET_OPTIONS:
+            if opt not in enums.SOCKET_OPTIONS_SET:
                 yield JSONError("The 'options' property of object '%s' "
                                 "contains a key ('%s') that is not a valid"
                                 " socket option (SO|ICMP|ICMP6|IP|IPV6|MCAST|TCP|IRLMP)_*."
@@ -955,7 +997,7 @@ def pdf_doc_info(instance):
             return
 
         for elem in did:
-            if elem not in enums.PDF_DID:
+            if elem not in enums.PDF_DID_SET:
                 yield JSONError("The 'document_info_dict' property of "
                                 "object '%s' contains a key ('%s') that is"
                                 " not a valid PDF Document Information "
@@ -964,12 +1006,13 @@ def pdf_doc_info(instance):
                                 'pdf-doc-info')
 
 
+@applies_to('location')
 def countries(instance):
     """Ensure that the `country` property of `location` objects is a valid
     ISO 3166-1 ALPHA-2 Code.
     """
     if (instance['type'] == 'location' and 'country' in instance and not
-            instance['country'].upper() in enums.COUNTRY_CODES):
+            instance['country'].upper() in enums.COUNTRY_CODES_SET):
 
         return JSONError("Location `country` should be a valid ISO 3166-1 "
                          "ALPHA-2 Code.",
@@ -992,6 +1035,7 @@ def windows_process_priority_format(instance):
                             'windows-process-priority-format')
 
 
+@applies_to('malware-analysis')
 def malware_analysis_product(instance):
     """Ensure product name is all lowercase with words seperated by a dash
     """
@@ -1004,17 +1048,20 @@ def malware_analysis_product(instance):
                             'malware-analysis-product')
 
 
+@visits(*HASHES_PATHS)
 @cyber_observable_check("2.1")
-def hash_length(instance):
+def hash_length(instance, properties=None):
     """Ensure keys in 'hashes'-type properties are no more than 30 characters long.
     """
     key = instance['id']
     if 'type' not in instance:
         return
+    if properties is None:
+        properties = HASHES_WALKER.walk(instance)
 
     if instance['type'] == 'file':
         try:
-            hashes = instance['hashes']
+            hashes = properties[HASHES_PATH]
         except KeyError:
             return
         else:
@@ -1026,7 +1073,7 @@ def hash_length(instance):
                                      % (key, h), instance['id'], 'hash-length')
 
         try:
-            ads = instance['extensions']['ntfs-ext']['alternate_data_streams']
+            ads = properties[NTFS_ADS_PATH]
         except KeyError:
             return
         else:
@@ -1043,7 +1090,7 @@ def hash_length(instance):
                                          % (key, h), instance['id'], 'hash-length')
 
         try:
-            head_hashes = instance['extensions']['windows-pebinary-ext']['file_header_hashes']
+            head_hashes = properties[PE_FILE_HEADER_HASHES_PATH]
         except KeyError:
             return
         else:
@@ -1056,7 +1103,7 @@ def hash_length(instance):
                                      % (key, h), instance['id'], 'hash-length')
 
         try:
-            hashes = instance['extensions']['windows-pebinary-ext']['optional_header']['hashes']
+            hashes = properties[PE_OPTIONAL_HEADER_HASHES_PATH]
         except KeyError:
             return
         else:
@@ -1069,7 +1116,7 @@ def hash_length(instance):
                                      % (key, h), instance['id'], 'hash-length')
 
         try:
-            sections = instance['extensions']['windows-pebinary-ext']['sections']
+            sections = properties[PE_SECTIONS_PATH]
         except KeyError:
             return
         else:
@@ -1086,7 +1133,7 @@ def hash_length(instance):
 
     elif instance['type'] == 'artifact' or instance['type'] == 'x509-certificate':
         try:
-            hashes = instance['hashes']
+            hashes = properties[HASHES_PATH]
         except KeyError:
             return
         else:
@@ -1107,6 +1154,7 @@ def extref_hashes(instance):
                                  % (src), instance['id'], 'extref-hashes')
 
 
+@applies_to('bundle')
 def duplicate_ids(instance):
     """Ensure objects with duplicate IDs have different `modified` timestamps.
     """
@@ -1126,17 +1174,18 @@ def duplicate_ids(instance):
                             % obj['id'], instance['id'], 'duplicate-ids')
 
 
-def types_strict(instance):
+@needs_context
+def types_strict(instance, context):
     """Ensure that no custom object types are used, but only the official ones
     from the specification.
     """
-    if instance['type'] not in enums.TYPES:
+    if instance['type'] not in enums.TYPES_SET:
         yield JSONError("Object type '%s' is not one of those defined in the"
                         " specification." % instance['type'], instance['id'])
 
-    if has_cyber_observable_data(instance, "2.1") and instance['type'] == 'observable-data':
+    if context.has_cyber_observable_data("2.1") and instance['type'] == 'observable-data':
         for key, obj in instance['objects'].items():
-            if 'type' in obj and obj['type'] not in enums.OBSERVABLE_TYPES:
+            if 'type' in obj and obj['type'] not in enums.OBSERVABLE_TYPES_SET:
                 yield JSONError("Observable object %s is type '%s' which is "
                                 "not one of those defined in the "
                                 "specification."
@@ -1144,29 +1193,31 @@ def types_strict(instance):
 
     if instance['type'] == 'indicator' and 'pattern' in instance:
         pattern = instance['pattern']
-        if isinstance(pattern, string_types):
-            p = Pattern(pattern)
-            inspection = p.inspect().comparisons
+        # Patterns exceeding the pattern limits are reported by the MUST check
+        if (isinstance(pattern, string_types) and
+                not pattern_limit_exceeded(pattern, '2.1', context.options)):
+            inspection = parse_pattern(pattern, '2.1').comparisons
             for objtype in inspection:
-                if objtype not in enums.OBSERVABLE_TYPES:
+                if objtype not in enums.OBSERVABLE_TYPES_SET:
                     yield PatternError("'%s' is not a valid stix observable type"
                                        % objtype, instance['id'])
 
 
-def properties_strict(instance):
+@needs_context
+def properties_strict(instance, context):
     """Ensure that no custom properties are used, but only the official ones
     from the specification.
     """
-    if instance['type'] not in enums.TYPES and instance['type'] not in enums.OBSERVABLE_TYPES:
+    if instance['type'] not in enums.TYPES_SET and instance['type'] not in enums.OBSERVABLE_TYPES_SET:
         return  # only check properties for official objects
 
-    defined_props = enums.PROPERTIES.get(instance['type'], [])
+    defined_props = enums.PROPERTIES_SETS.get(instance['type'], [])
     for prop in instance.keys():
         if prop not in defined_props:
             yield JSONError("Property '%s' is not one of those defined in the"
                             " specification." % prop, instance['id'])
 
-    if has_cyber_observable_data(instance, "2.1"):
+    if context.has_cyber_observable_data("2.1"):
         if instance['type'] == 'observable_data':
             for key, obj in instance['objects'].items():
                 for error in properties_strict_helper(obj, instance['id']):
@@ -1177,26 +1228,27 @@ def properties_strict(instance):
 
     if instance['type'] == 'indicator' and 'pattern' in instance:
         pattern = instance['pattern']
-        if isinstance(pattern, string_types):
-            p = Pattern(pattern)
-            inspection = p.inspect().comparisons
+        # Patterns exceeding the pattern limits are reported by the MUST check
+        if (isinstance(pattern, string_types) and
+                not pattern_limit_exceeded(pattern, '2.1', context.options)):
+            inspection = parse_pattern(pattern, '2.1').comparisons
             for objtype, expression_list in inspection.items():
                 for exp in expression_list:
                     path = exp[0]
                     # Get the property name without list index, dictionary key, or referenced object property
                     prop = path[0]
-                    if objtype in enums.OBSERVABLE_PROPERTIES and prop not in enums.OBSERVABLE_PROPERTIES[objtype]:
+                    if objtype in enums.OBSERVABLE_PROPERTIES_SETS and prop not in enums.OBSERVABLE_PROPERTIES_SETS[objtype]:
                         yield PatternError("'%s' is not a valid property for '%s' objects"
                                            % (prop, objtype), instance['id'])
 
 
 def properties_strict_helper(obj, obj_id):
     type_ = obj.get('type', '')
-    if type_ not in enums.OBSERVABLE_PROPERTIES:
+    if type_ not in enums.OBSERVABLE_PROPERTIES_SETS:
         return  # custom observable types handled outside this function
-    observable_props = enums.OBSERVABLE_PROPERTIES.get(type_, [])
-    embedded_props = enums.OBSERVABLE_EMBEDDED_PROPERTIES.get(type_, {})
-    extensions = enums.OBSERVABLE_EXTENSIONS.get(type_, [])
+    observable_props = enums.OBSERVABLE_PROPERTIES_SETS.get(type_, [])
+    embedded_props = enums.OBSERVABLE_EMBEDDED_PROPERTIES_SETS.get(type_, {})
+    extensions = enums.OBSERVABLE_EXTENSIONS_SETS.get(type_, [])
     for prop in obj.keys():
         if prop not in observable_props:
             yield JSONError("Property '%s' is not one of those defined in the"
@@ -1221,13 +1273,13 @@ def properties_strict_helper(obj, obj_id):
     for ext_key in obj.get('extensions', {}):
         if ext_key not in extensions:
             continue  # don't check custom extensions
-        extension_props = enums.OBSERVABLE_EXTENSION_PROPERTIES[ext_key]
+        extension_props = enums.OBSERVABLE_EXTENSION_PROPERTIES_SETS[ext_key]
         for ext_prop in obj['extensions'][ext_key]:
             if ext_prop not in extension_props:
                 yield JSONError("Property '%s' is not one of those defined in the"
                                 " specification for the %s extension in %s objects."
                                 % (ext_prop, ext_key, type_), obj_id)
-            embedded_ext_props = enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES.get(ext_key, {}).get(ext_prop, [])
+            embedded_ext_props = enums.OBSERVABLE_EXTENSION_EMBEDDED_PROPERTIES_SETS.get(ext_key, {}).get(ext_prop, [])
             if embedded_ext_props:
                 for embed_ext_prop in obj['extensions'][ext_key].get(ext_prop, []):
                     if embed_ext_prop not in embedded_ext_props:
@@ -1239,16 +1291,12 @@ def properties_strict_helper(obj, obj_id):
 # Mapping of check names to the functions which perform the checks
 CHECKS = {
     'all': [
-        custom_object_prefix_strict,
-        custom_property_prefix_strict,
+        custom_prefix_strict,
         uuid_check,
         open_vocab_values,
         kill_chain_phase_names,
         observable_object_keys,
         observable_dictionary_keys,
-        custom_observable_object_prefix_strict,
-        custom_object_extension_prefix_strict,
-        custom_observable_properties_prefix_strict,
         malware_analysis_product,
         windows_process_priority_format,
         hash_length,
@@ -1291,16 +1339,12 @@ CHECKS = {
         deprecated_property_check,
     ],
     'format-checks': [
-        custom_object_prefix_strict,
-        custom_property_prefix_strict,
+        custom_prefix_strict,
         uuid_check,
         open_vocab_values,
         kill_chain_phase_names,
         observable_object_keys,
         observable_dictionary_keys,
-        custom_observable_object_prefix_strict,
-        custom_object_extension_prefix_strict,
-        custom_observable_properties_prefix_strict,
         malware_analysis_product,
         windows_process_priority_format,
         hash_length,
@@ -1,12 +1,14 @@
 """Custom jsonschema.IValidator class and validator functions.
 """
 
-from collections import Iterable
+from collections import Iterable, Mapping
+import hashlib
 import io
 from itertools import chain
 import os
 import re
 import sys
+import threading
 
 from jsonschema import Draft7Validator, RefResolver, draft7_format_checker
 from jsonschema import exceptions as schema_exceptions
@@ -14,11 +16,16 @@ from jsonschema.validators import extend
 import simplejson as json
 from six import iteritems, string_types, text_type
 
-from . import output
+from . import output, schema_bundle
+from .compiler import compile_validator
 from .errors import (NoJSONFileFoundError, SchemaError, SchemaInvalidError,
                      ValidationError, pretty_error)
-from .util import (DEFAULT_VER, ValidationOptions, check_spec,
-                   clear_requests_cache, init_requests_cache)
+from .pattern_cache import (clear_prefetched_patterns, close_pattern_pool,
+                            complexity_limit_exceeded, init_pattern_pool,
+                            init_pattern_store, prefetch_patterns)
+from .util import (DEFAULT_VER, ObjectContext, PropertyWalker,
+                   ValidationOptions, check_spec, clear_requests_cache,
+                   get_cache_dir, init_requests_cache)
 from .v20 import musts as musts20
 from .v20 import shoulds as shoulds20
 from .v21 import musts as musts21
@@ -42,23 +49,95 @@ def _is_stix_obj(obj):
     return isinstance(obj, dict) and 'id' in obj and 'type' in obj
 
 
-def _iter_errors_custom(instance, checks, options):
+class CheckTable(dict):
+    """Maps STIX object types to the checks that apply to objects of each
+    type, as declared with :func:`~stix2validator.util.applies_to`.
+
+    Each check is paired with whether it takes the validation options as well
+    as the object to check, as declared with
+    :func:`~stix2validator.util.needs_options`, whether it visits property
+    paths, and whether it takes an ObjectContext, as declared with
+    :func:`~stix2validator.util.needs_context`. The checks for a type are
+    looked up the first time an object of that type is checked, and keep the
+    order in which they were given, along with a PropertyWalker for the
+    property paths they visit (see :func:`~stix2validator.util.visits`), or
+    None if they visit none.
+    """
+    def __init__(self, checks):
+        super(CheckTable, self).__init__()
+        self.checks = list(checks)
+        self.names = ", ".join(check.__name__ for check in self.checks)
+        self._calls = [(check, getattr(check, 'needs_options', False),
+                        hasattr(check, 'paths'),
+                        getattr(check, 'needs_context', False))
+                       for check in self.checks]
+
+    def __missing__(self, obj_type):
+        calls = [call for call in self._calls
+                 if obj_type in getattr(call[0], 'object_types', (obj_type,))]
+        self[obj_type] = type_checks = (calls, self._walker(calls))
+        return type_checks
+
+    def _walker(self, calls):
+        paths = [path for check, needs_options, visits, needs_context in calls
+                 if visits for path in check.paths]
+        if paths:
+            return PropertyWalker(paths)
+        return None
+
+    def for_object(self, instance):
+        """Return a list of ``(check, needs_options, visits, needs_context)``
+        tuples for the checks that apply to `instance`, and a PropertyWalker
+        for the paths they visit (or None).
+        """
+        try:
+            return self[instance['type']]
+        except TypeError:
+            # Unhashable type; let the checks themselves deal with it
+            return self._calls, self._walker(self._calls)
+
+
+def _iter_errors_custom(instance, checks, options, contexts=None):
     """Perform additional validation not possible merely with JSON schemas.
 
     Args:
         instance: The STIX object to be validated.
-        checks: A sequence of callables which do the checks.  Each callable
-            may be written to accept 1 arg, which is the object to check,
-            or 2 args, which are the object and a ValidationOptions instance.
+        checks: A sequence of callables which do the checks, or a CheckTable
+            of them.  Each callable accepts the object to check, and also a
+            ValidationOptions instance if it is decorated with
+            :func:`~stix2validator.util.needs_options`, the values at the
+            property paths it visits if it is decorated with
+            :func:`~stix2validator.util.visits`, or an ObjectContext for the
+            object if it is decorated with
+            :func:`~stix2validator.util.needs_context`.
         options: ValidationOptions instance with settings affecting how
             validation should be done.
+        contexts: A dictionary in which to keep the ObjectContext for each
+            object checked, by the object's id(), so that they are shared
+            with other calls given the same dictionary.
     """
+    if not isinstance(checks, CheckTable):
+        checks = CheckTable(checks)
+
     # Perform validation
-    for v_function in checks:
-        try:
-            result = v_function(instance)
-        except TypeError:
+    calls, walker = checks.for_object(instance)
+    if walker is not None:
+        properties = walker.walk(instance)
+    if contexts is None:
+        context = ObjectContext(instance, options)
+    else:
+        context = contexts.get(id(instance))
+        if context is None:
+            context = contexts[id(instance)] = ObjectContext(instance, options)
+    for v_function, needs_options, visits, needs_context in calls:
+        if visits:
+            result = v_function(instance, properties)
+        elif needs_context:
+            result = v_function(instance, context)
+        elif needs_options:
             result = v_function(instance, options)
+        else:
+            result = v_function(instance)
         if isinstance(result, Iterable):
             for x in result:
                 yield x
@@ -70,7 +149,7 @@ def _iter_errors_custom(instance, checks, options):
         if type(instance[field]) is list:
             for obj in instance[field]:
                 if _is_stix_obj(obj):
-                    for err in _iter_errors_custom(obj, checks, options):
+                    for err in _iter_errors_custom(obj, checks, options, contexts):
                         yield err
 
 
@@ -358,15 +437,22 @@ def run_validation(options):
             this validation run.
 
     """
-    if options.files == sys.stdin:
-        results = validate(options.files, options)
-        return [FileValidationResults(is_valid=results.is_valid,
-                                      filepath='stdin',
-                                      object_results=results)]
+    # Share one pool of pattern parsing processes between all the files
+    if options.pattern_processes > 1:
+        init_pattern_pool(options.pattern_processes)
+    try:
+        if options.files == sys.stdin:
+            results = validate(options.files, options)
+            return [FileValidationResults(is_valid=results.is_valid,
+                                          filepath='stdin',
+                                          object_results=results)]
 
-    files = get_json_files(options.files, options.recursive)
+        files = get_json_files(options.files, options.recursive)
 
-    results = [validate_file(fn, options) for fn in files]
+        results = [validate_file(fn, options) for fn in files]
+    finally:
+        if options.pattern_processes > 1:
+            close_pattern_pool()
 
     return results
 
@@ -393,6 +479,15 @@ def validate_parsed_json(obj_json, options=None):
     if not options.no_cache:
         init_requests_cache(options.refresh_cache)
 
+    if options.pattern_cache:
+        init_pattern_store(options.pattern_cache)
+
+    if options.pattern_processes > 1:
+        # Leave patterns which exceed the pattern limits to the pattern checks
+        prefetch_patterns((key for key in _pattern_keys(obj_json, options.version)
+                           if not complexity_limit_exceeded(key[0], options)),
+                          options.pattern_processes, options.pattern_timeout)
+
     results = None
     if validating_list:
         results = []
@@ -416,9 +511,35 @@ def validate_parsed_json(obj_json, options=None):
     if not options.no_cache and options.clear_cache:
         clear_requests_cache()
 
+    if options.pattern_processes > 1:
+        clear_prefetched_patterns()
+
     return results
 
 
+def _pattern_keys(obj_json, version=None):
+    """Yield the (pattern, version) pairs which the pattern checks parse for
+    the indicators in `obj_json`: an object, a bundle, or a list of them.
+    """
+    objs = obj_json if isinstance(obj_json, list) else [obj_json]
+    for obj in objs:
+        if not isinstance(obj, dict):
+            continue
+        obj_version = version or obj.get('spec_version')
+        if obj.get('type') == 'bundle' and isinstance(obj.get('objects'), list):
+            for key in _pattern_keys(obj['objects'], obj_version):
+                yield key
+        elif obj.get('type') == 'indicator' and isinstance(obj.get('pattern'), string_types):
+            pattern = obj['pattern']
+            if obj_version == '2.0':
+                yield pattern, '2.0'
+            elif obj.get('pattern_type') == 'stix':
+                pattern_version = obj.get('pattern_version', obj.get('spec_version', '2.1'))
+                if isinstance(pattern_version, string_types):
+                    yield pattern, pattern_version
+                yield pattern, '2.1'
+
+
 def validate(in_, options=None):
     """
     Validate objects from JSON data in a textual stream.
@@ -497,38 +618,75 @@ def validate_string(string, options=None):
     return validate(stream, options)
 
 
-SCHEMA_STORE = {}
+def load_local_ref(resolver, ref):
+    """Add the local copy of the schema referenced by `ref` to the resolver's
+    store, if it is not there already, so that the local schemas are used and
+    remote refs are only downloaded if the local one is not present.
 
-
-def ref_store(validator, ref, instance, schema):
-    """When validating '$ref' properties, add to global store.
+    Returns:
+        The path of the local copy of the referenced schema, or None if there
+        is no such file.
     """
-    remote_path = validator.resolver._urljoin_cache(validator.resolver.base_uri, ref)
-
-    if remote_path not in validator.resolver.store:
-        # Add local schema to Resolver store if present, so validator will use local
-        # schemas and only download remote refs in local is not present.
-        local_base_uri = validator.resolver._scopes_stack[0]
+    local_base_uri = resolver._scopes_stack[0]
 
-        # Take out the the 'file:' prefix
-        if os.name == 'nt':
-            local_base_uri = local_base_uri[8:]
-        else:
-            local_base_uri = local_base_uri[5:]
+    # Take out the the 'file:' prefix
+    if os.name == 'nt':
+        local_base_uri = local_base_uri[8:]
+    else:
+        local_base_uri = local_base_uri[5:]
+    local_filepath = os.path.abspath(os.path.join(local_base_uri, '../'+ref))
 
+    remote_path = resolver._urljoin_cache(resolver.base_uri, ref)
+    if remote_path not in resolver.store:
         try:
-            local_filepath = os.path.abspath(os.path.join(local_base_uri, '../'+ref))
             local_schema = load_schema(local_filepath)
-            schema_id = local_schema.get('$id', '')
-            if schema_id:
-                validator.resolver.store[schema_id] = local_schema
         except FileNotFoundError:
-            pass
+            return None
+        schema_id = local_schema.get('$id', '')
+        if schema_id:
+            resolver.store[schema_id] = local_schema
 
+    if os.path.isfile(local_filepath):
+        return local_filepath
+    return None
+
+
+def ref_store(validator, ref, instance, schema):
+    """When validating '$ref' properties, add the referenced schema to the
+    resolver's store if needed.
+    """
+    load_local_ref(validator.resolver, ref)
     return Draft7Validator.VALIDATORS['$ref'](validator, ref, instance, schema)
 
 
-STIXValidator = extend(Draft7Validator, {'$ref': ref_store})
+def pattern(validator, patrn, instance, schema):
+    """Validate 'pattern' properties, using the validator's table of
+    precompiled patterns.
+    """
+    if validator.is_type(instance, 'string') and not validator.patterns.compile(patrn).search(instance):
+        yield schema_exceptions.ValidationError("%r does not match %r" % (instance, patrn))
+
+
+def pattern_properties(validator, patternProperties, instance, schema):
+    """Validate 'patternProperties' properties, using the validator's table of
+    precompiled patterns.
+    """
+    if not validator.is_type(instance, 'object'):
+        return
+
+    for patrn, subschema in iteritems(patternProperties):
+        regex = validator.patterns.compile(patrn)
+        for k, v in iteritems(instance):
+            if regex.search(k):
+                for error in validator.descend(v, subschema, path=k, schema_path=patrn):
+                    yield error
+
+
+STIXValidator = extend(Draft7Validator, {
+    '$ref': ref_store,
+    'pattern': pattern,
+    'patternProperties': pattern_properties,
+})
 
 
 # Built-in checker only ensures emails contain an '@'; we want a more robust check
@@ -539,46 +697,246 @@ def is_email(instance):
     return EMAIL_RE.match(instance)
 
 
-def load_validator(schema_path, schema):
+class STIXRefResolver(RefResolver):
+    """RefResolver which keeps a separate resolution scope for each thread,
+    so that one validator can be used by several threads at once.
+    """
+    def __init__(self, base_uri, referrer, *args, **kwargs):
+        self._thread_scopes = threading.local()
+        super(STIXRefResolver, self).__init__(base_uri, referrer, *args, **kwargs)
+
+    @property
+    def _scopes_stack(self):
+        try:
+            return self._thread_scopes.stack
+        except AttributeError:
+            self._thread_scopes.stack = [self._base_scope]
+            return self._thread_scopes.stack
+
+    @_scopes_stack.setter
+    def _scopes_stack(self, stack):
+        self._base_scope = stack[0]
+        self._thread_scopes.stack = list(stack)
+
+
+def load_validator(schema_path, schema, store=None, patterns=None):
     """Create a JSON schema validator for the given schema.
 
     Args:
         schema_path: The filename of the JSON schema.
         schema: A Python object representation of the same schema.
+        store: A mapping of schema $ids to schemas, which $refs are resolved
+            against before looking for local files or downloading them. It is
+            copied, not modified.
+        patterns: The PatternCache the validator looks up the regular
+            expressions for 'pattern' and 'patternProperties' in. By default,
+            the validator gets a cache of its own.
 
     Returns:
-        An instance of Draft7Validator.
+        A STIXValidator (a Draft7Validator extended with the validator's own
+        '$ref', 'pattern' and 'patternProperties' keywords), resolving $refs
+        with a STIXRefResolver, with the PatternCache it uses as its
+        `patterns` attribute.
 
     """
-    global SCHEMA_STORE
-
     # Get correct prefix based on OS
     if os.name == 'nt':
         file_prefix = 'file:///'
     else:
         file_prefix = 'file:'
 
-    resolver = RefResolver(file_prefix + schema_path.replace("\\", "/"), schema, store=SCHEMA_STORE)
+    # RefResolver copies the store, so schemas loaded while validating are
+    # only added to this validator's copy
+    resolver = STIXRefResolver(file_prefix + schema_path.replace("\\", "/"), schema,
+                               store=store if store is not None else {})
     schema_id = schema.get('$id', '')
     if schema_id:
         resolver.store[schema_id] = schema
-    # RefResolver creates a new store internally; persist it so we can use the same mappings every time
-    SCHEMA_STORE = resolver.store
     validator = STIXValidator(schema, resolver=resolver, format_checker=draft7_format_checker)
+    validator.patterns = patterns if patterns is not None else PatternCache()
     return validator
 
 
+class SchemaIndex(object):
+    """Index of the schemas in a schema directory, mapping each schema's name
+    (its filename without the ``.json`` extension) to its path.
+
+    The index lists every schema in the directory, so a name that isn't in
+    it is known to have no schema without searching the directory again.
+    Indexes are saved in the validator's cache directory and reused by later
+    runs until one of the indexed directories is modified.
+
+    Args:
+        schema_dir (str): The absolute path of the schema directory.
+        schemas (dict): Mapping of schema names to file paths.
+        dir_mtimes (dict): Modification time of each directory searched while
+            building the index.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, schema_dir, schemas=None, dir_mtimes=None):
+        self.schema_dir = schema_dir
+        self.schemas = schemas if schemas is not None else {}
+        self.dir_mtimes = dir_mtimes if dir_mtimes is not None else {}
+
+    @classmethod
+    def from_paths(cls, schema_dir, paths):
+        """Build an index of the schemas at the given paths in `schema_dir`,
+        without searching it.
+        """
+        index = cls(schema_dir)
+        for path in paths:
+            index.schemas.setdefault(os.path.basename(path)[:-len('.json')], path)
+        return index
+
+    @classmethod
+    def build(cls, schema_dir):
+        """Search `schema_dir` and build a new index of its schemas.
+        """
+        index = cls(schema_dir)
+        for root, dirnames, filenames in os.walk(schema_dir):
+            # Example STIX content is not schemas; don't descend into it
+            dirnames[:] = [d for d in dirnames if "examples" not in d]
+            index.dir_mtimes[root] = os.stat(root).st_mtime
+            for filename in filenames:
+                if filename.endswith('.json'):
+                    # Keep the first match for each name
+                    index.schemas.setdefault(filename[:-len('.json')],
+                                             os.path.join(root, filename))
+        return index
+
+    @classmethod
+    def load(cls, schema_dir):
+        """Return the index for `schema_dir`, reusing the saved one if it is
+        still up to date, or building (and saving) a new one otherwise.
+        """
+        schema_dir = os.path.abspath(schema_dir)
+        index_path = cls.index_path(schema_dir)
+        try:
+            with open(index_path) as index_file:
+                saved = json.load(index_file)
+            if (saved['format_version'] == cls.FORMAT_VERSION and
+                    saved['schema_dir'] == schema_dir):
+                index = cls(schema_dir, saved['schemas'], saved['dir_mtimes'])
+                if index.is_current():
+                    return index
+        except (EnvironmentError, ValueError, KeyError, TypeError):
+            pass
+
+        index = cls.build(schema_dir)
+        if index.dir_mtimes:
+            index.save(index_path)
+        return index
+
+    @staticmethod
+    def index_path(schema_dir):
+        """Return the path of the saved index for `schema_dir`.
+        """
+        digest = hashlib.sha1(schema_dir.encode('utf-8')).hexdigest()
+        return os.path.join(get_cache_dir(), 'schema-index-%s.json' % digest)
+
+    def is_current(self):
+        """Return True if none of the indexed directories have had files
+        added, removed, or renamed since the index was built.
+        """
+        if not self.dir_mtimes:
+            return False
+        try:
+            return all(os.stat(d).st_mtime == mtime
+                       for d, mtime in iteritems(self.dir_mtimes))
+        except EnvironmentError:
+            return False
+
+    def save(self, index_path):
+        """Save this index to `index_path`. Failure to save is not an error;
+        the index will simply be rebuilt next time.
+        """
+        try:
+            with open(index_path, 'w') as index_file:
+                json.dump({
+                    'format_version': self.FORMAT_VERSION,
+                    'schema_dir': self.schema_dir,
+                    'schemas': self.schemas,
+                    'dir_mtimes': self.dir_mtimes,
+                }, index_file)
+        except EnvironmentError:
+            pass
+
+    def find(self, name):
+        """Return the path of the schema called `name`, or None if there is
+        no such schema.
+        """
+        return self.schemas.get(name)
+
+
+_SCHEMA_INDEXES = {}
+
+
+def get_schema_index(schema_dir):
+    """Return the SchemaIndex for `schema_dir`, loading it on first use. The
+    index is kept until clear_schema_indexes() is called.
+    """
+    try:
+        return _SCHEMA_INDEXES[schema_dir]
+    except KeyError:
+        bundle = get_schema_bundle(schema_dir)
+        if bundle is not None:
+            index = SchemaIndex.from_paths(os.path.abspath(schema_dir), bundle)
+        else:
+            index = SchemaIndex.load(schema_dir)
+        _SCHEMA_INDEXES[schema_dir] = index
+        return index
+
+
+# Path of each schema file -> the schema, for schemas loaded from a bundle
+_BUNDLED_SCHEMAS = {}
+# Schema directory -> paths of the schemas in its bundle, or None
+_SCHEMA_BUNDLES = {}
+
+
+def clear_schema_indexes():
+    """Forget the indexes and bundles of the schema directories loaded so far,
+    so that they are loaded again, with any changes, when next used.
+    """
+    _SCHEMA_INDEXES.clear()
+    _SCHEMA_BUNDLES.clear()
+    _BUNDLED_SCHEMAS.clear()
+
+
+def get_schema_bundle(schema_dir):
+    """Load the bundle of the schemas in `schema_dir` (see
+    :mod:`stix2validator.schema_bundle`), if it is one of the schema
+    directories bundled with this package and its bundle was built when the
+    package was.
+
+    Schemas loaded from a bundle are returned by :func:`load_schema` without
+    reading their files.
+
+    Returns:
+        The paths of the schemas in the bundle, or None if there is no bundle.
+    """
+    schema_dir = os.path.abspath(schema_dir)
+    try:
+        return _SCHEMA_BUNDLES[schema_dir]
+    except KeyError:
+        schemas = None
+        if schema_dir in (bundled_schema_dir('2.0'), bundled_schema_dir('2.1')):
+            schemas = schema_bundle.read_bundle(schema_dir)
+        paths = None
+        if schemas is not None:
+            paths = []
+            for path, schema in schemas:
+                paths.append(path)
+                _BUNDLED_SCHEMAS[path] = schema
+        _SCHEMA_BUNDLES[schema_dir] = paths
+        return paths
+
+
 def find_schema(schema_dir, obj_type):
     """Search the `schema_dir` directory for a schema called `obj_type`.json.
     Return the file path of the first match it finds.
     """
-    schema_filename = obj_type + '.json'
-
-    for root, dirnames, filenames in os.walk(schema_dir):
-        if "examples" in root:
-            continue
-        if schema_filename in filenames:
-            return os.path.join(root, schema_filename)
+    return get_schema_index(schema_dir).find(obj_type)
 
 
 def load_schema(schema_path):
@@ -591,6 +949,11 @@ def load_schema(schema_path):
         A Python object representation of the schema.
 
     """
+    try:
+        return _BUNDLED_SCHEMAS[os.path.abspath(schema_path)]
+    except KeyError:
+        pass
+
     try:
         with open(schema_path) as schema_file:
             schema = json.load(schema_file)
@@ -601,7 +964,357 @@ def load_schema(schema_path):
     return schema
 
 
-def _get_error_generator(type, obj, schema_dir=None, version=DEFAULT_VER, default='core'):
+def bundled_schema_dir(version=DEFAULT_VER):
+    """Return the path to the schemas bundled with this package for the given
+    version of the STIX specification.
+    """
+    return os.path.abspath(os.path.dirname(__file__) + '/schemas-'
+                           + version + '/')
+
+
+class SchemaStore(Mapping):
+    """Immutable mapping of schema $ids to schemas, which $refs are resolved
+    against.
+
+    A store is built once for each schema directory and shared by all the
+    validators for that directory's schemas, each of which resolves $refs
+    with its own copy of it. Use :meth:`extend` to get a store with more
+    schemas in it, leaving the original unchanged.
+    """
+    def __init__(self, schemas=()):
+        self._schemas = dict(schemas)
+
+    @classmethod
+    def from_dir(cls, schema_dir):
+        """Build a store of all the schemas in `schema_dir` with an $id.
+        """
+        schemas = {}
+        for schema_path in get_schema_index(schema_dir).schemas.values():
+            try:
+                schema = load_schema(schema_path)
+            except SchemaInvalidError:
+                # Reported if (and when) the schema is actually used
+                continue
+            if isinstance(schema, dict) and schema.get('$id'):
+                schemas[schema['$id']] = schema
+        return cls(schemas)
+
+    def extend(self, other):
+        """Return a new store with the schemas in both this store and
+        `other`, preferring those in `other` if they have the same $id.
+        """
+        store = SchemaStore(self._schemas)
+        store._schemas.update(other)
+        return store
+
+    def __getitem__(self, schema_id):
+        return self._schemas[schema_id]
+
+    def __iter__(self):
+        return iter(self._schemas)
+
+    def __len__(self):
+        return len(self._schemas)
+
+
+class PatternCache(object):
+    """Compiled regular expressions for the 'pattern' and 'patternProperties'
+    keywords of JSON schemas.
+
+    The schema registry compiles every pattern in the schemas it loads ahead
+    of time, and its validators look patterns up here rather than relying on
+    the much smaller cache in the `re` module, which mixed bundles of objects
+    can exhaust. A pattern which has not been compiled is compiled the first
+    time it is looked up; if the cache is full then, it is emptied first.
+
+    Args:
+        maxsize (int): The number of patterns the cache can hold.
+
+    Attributes:
+        hits (int): The number of lookups of patterns which had already been
+            compiled.
+        misses (int): The number of lookups which had to compile a pattern.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._regexes = {}
+
+    def add(self, pattern):
+        """Compile `pattern` ahead of time, unless it is not a valid regular
+        expression (the error is left for validation to report).
+        """
+        if pattern not in self._regexes:
+            try:
+                regex = re.compile(pattern)
+            except (re.error, TypeError):
+                return
+            self._add(pattern, regex)
+
+    def add_schema(self, schema):
+        """Compile every pattern in `schema` ahead of time.
+        """
+        if isinstance(schema, dict):
+            for keyword, value in iteritems(schema):
+                if keyword == 'pattern' and isinstance(value, string_types):
+                    self.add(value)
+                elif keyword == 'patternProperties' and isinstance(value, dict):
+                    for pattern in value:
+                        self.add(pattern)
+                self.add_schema(value)
+        elif isinstance(schema, list):
+            for value in schema:
+                self.add_schema(value)
+
+    def compile(self, pattern):
+        """Return the compiled regular expression for `pattern`.
+        """
+        try:
+            regex = self._regexes[pattern]
+        except KeyError:
+            self.misses += 1
+            regex = re.compile(pattern)
+            self._add(pattern, regex)
+            return regex
+        self.hits += 1
+        return regex
+
+    def clear(self):
+        """Forget all compiled patterns, and reset the counters.
+        """
+        self._regexes.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _add(self, pattern, regex):
+        if len(self._regexes) >= self.maxsize:
+            self._regexes.clear()
+        self._regexes[pattern] = regex
+
+    def __len__(self):
+        return len(self._regexes)
+
+
+class SchemaRegistry(object):
+    """Cache of JSON schema validators, compiled once per process.
+
+    Schemas are located, parsed, and compiled into validators the first time
+    an object type is looked up; every later lookup for that type returns the
+    same validator. Call :meth:`load_all` to compile every schema in a
+    directory ahead of time instead.
+
+    The registry is safe to use from multiple threads, as are the validators
+    it returns. Its validators share one PatternCache, available as the
+    :attr:`patterns` attribute, holding every pattern in the schemas loaded.
+
+    Args:
+        compile_schemas (bool): Generate Python code specialized for each
+            schema (see :mod:`stix2validator.compiler`) instead of using
+            generic validators.
+    """
+    def __init__(self, compile_schemas=True):
+        self.compile_schemas = compile_schemas
+        # Held while adding to the caches below
+        self._lock = threading.RLock()
+        # (schema_dir, name) -> schema file path, or None if not found
+        self._schema_paths = {}
+        # schema file path -> validator
+        self._validators = {}
+        # schema_dir -> SchemaStore
+        self._stores = {}
+        self.patterns = PatternCache()
+
+    def clear(self):
+        """Forget all schemas found and validators compiled so far, and the
+        indexes of the schema directories searched. Call this in a
+        long-running process after adding, removing or changing schemas.
+        """
+        with self._lock:
+            clear_schema_indexes()
+            self._schema_paths.clear()
+            self._validators.clear()
+            self._stores.clear()
+            self.patterns.clear()
+
+    def find_schema(self, schema_dir, name):
+        """Return the path to the schema called `name` in `schema_dir`, or
+        None if there is no such schema.
+        """
+        key = (schema_dir, name)
+        try:
+            return self._schema_paths[key]
+        except KeyError:
+            with self._lock:
+                schema_path = find_schema(schema_dir, name)
+                self._schema_paths[key] = schema_path
+                return schema_path
+
+    def get_store(self, schema_dir):
+        """Return the store used to resolve $refs in the schemas in
+        `schema_dir`.
+
+        The store for one of the schema directories bundled with this package
+        holds all of its schemas. The store for any other directory holds its
+        own schemas, added to those from every bundled directory.
+        """
+        try:
+            return self._stores[schema_dir]
+        except KeyError:
+            with self._lock:
+                bundled_dirs = [bundled_schema_dir(version) for version in ('2.0', '2.1')]
+                if os.path.abspath(schema_dir) in bundled_dirs:
+                    store = SchemaStore.from_dir(schema_dir)
+                else:
+                    store = SchemaStore()
+                    for bundled_dir in bundled_dirs:
+                        store = store.extend(self.get_store(bundled_dir))
+                    store = store.extend(SchemaStore.from_dir(schema_dir))
+                for schema in store.values():
+                    self.patterns.add_schema(schema)
+                self._stores[schema_dir] = store
+                return store
+
+    def load_validator(self, schema_dir, schema_path):
+        """Return the validator for the schema file at `schema_path` in
+        `schema_dir`, compiling it if this is the first time it is needed.
+        """
+        try:
+            return self._validators[schema_path]
+        except KeyError:
+            with self._lock:
+                if schema_path in self._validators:
+                    # Loaded by another thread while waiting for the lock
+                    return self._validators[schema_path]
+
+                schema = load_schema(schema_path)
+                validator = load_validator(schema_path, schema, self.get_store(schema_dir), self.patterns)
+                validator = self._compile(validator, schema_path)
+                self._validators[schema_path] = validator
+                return validator
+
+    def load_merged_validator(self, schema_dir, schema_path, custom_schema_dir, custom_schema_path):
+        """Return a validator for both the schema file at `schema_path` in
+        `schema_dir` and the one at `custom_schema_path` in
+        `custom_schema_dir`, compiling it if this is the first time it is
+        needed.
+
+        The validator's schema is an 'allOf' of the two schemas, so objects
+        are checked against both in a single pass. The schema path of each
+        error found starts with ``allOf``, followed by 0 if the error was
+        found with the first schema, or 1 if it was found with the custom one.
+        """
+        key = (schema_path, custom_schema_path)
+        try:
+            return self._validators[key]
+        except KeyError:
+            with self._lock:
+                if key in self._validators:
+                    return self._validators[key]
+
+                custom_schema = load_schema(custom_schema_path)
+                schema = {'allOf': [load_schema(schema_path), custom_schema]}
+                validator = load_validator(custom_schema_path, schema,
+                                           self.get_store(custom_schema_dir), self.patterns)
+                # Resolve $refs relative to the custom schema's own file in
+                # that schema, as its own validator would, not in the merged one
+                validator.resolver.store[validator.resolver.base_uri] = custom_schema
+                validator = self._compile(validator, custom_schema_path, schema_path)
+                self._validators[key] = validator
+                return validator
+
+    def _compile(self, validator, schema_path, merged_schema_path=None):
+        if not self.compile_schemas:
+            return validator
+        try:
+            return compile_validator(validator, schema_path, load_local_ref, merged_schema_path)
+        except Exception:
+            # Anything the compiler can't handle (e.g. a $ref which fails to
+            # resolve) is left to the generic validator, which reports it
+            # when validating.
+            return validator
+
+    def _find_schema_or_default(self, schema_dir, obj_type, default):
+        schema_path = self.find_schema(schema_dir, obj_type)
+        if schema_path is None:
+            # Assume a custom object with no schema
+            schema_path = self.find_schema(schema_dir, default)
+        return schema_path
+
+    def get_validator(self, schema_dir, obj_type, default='core'):
+        """Return the validator for objects of type `obj_type`.
+
+        Args:
+            schema_dir (str): The path in which to search for schemas.
+            obj_type (str): The object type to find the schema for.
+            default (str): If the schema for the given type cannot be found,
+                use the one with this name instead.
+
+        Returns:
+            A validator, or None if neither the type's schema nor the default
+            schema can be found in `schema_dir`.
+        """
+        schema_path = self._find_schema_or_default(schema_dir, obj_type, default)
+        if schema_path is None:
+            return None
+        return self.load_validator(schema_dir, schema_path)
+
+    def get_merged_validator(self, schema_dir, custom_schema_dir, obj_type, default='core'):
+        """Return a single validator for objects of type `obj_type`, which
+        checks them against their schemas in both `schema_dir` and
+        `custom_schema_dir` (see :meth:`load_merged_validator`).
+
+        Args:
+            schema_dir (str): The path in which to search for schemas.
+            custom_schema_dir (str): The path in which to search for custom
+                schemas to check objects against as well.
+            obj_type (str): The object type to find the schemas for.
+            default (str): If the schema for the given type cannot be found
+                in either directory, use the one with this name instead.
+
+        Returns:
+            A validator, or None if neither the type's schema nor the default
+            schema can be found in `schema_dir`. If neither can be found in
+            `custom_schema_dir`, this is the validator for `schema_dir` alone.
+        """
+        schema_path = self._find_schema_or_default(schema_dir, obj_type, default)
+        if schema_path is None:
+            return None
+        custom_schema_path = self._find_schema_or_default(custom_schema_dir, obj_type, default)
+        if custom_schema_path is None:
+            return self.load_validator(schema_dir, schema_path)
+        return self.load_merged_validator(schema_dir, schema_path, custom_schema_dir, custom_schema_path)
+
+    def load_all(self, version=DEFAULT_VER, schema_dir=None):
+        """Compile every schema in `schema_dir`, so that no schema needs to be
+        loaded during validation.
+
+        Args:
+            version (str): The version of the STIX specification whose bundled
+                schemas should be loaded. Only used if schema_dir is None.
+            schema_dir (str): The path in which to search for schemas.
+
+        Returns:
+            The number of schemas in `schema_dir`.
+        """
+        if schema_dir is None:
+            schema_dir = bundled_schema_dir(version)
+
+        with self._lock:
+            schemas = get_schema_index(schema_dir).schemas
+            for name, schema_path in iteritems(schemas):
+                self._schema_paths[(schema_dir, name)] = schema_path
+                self.load_validator(schema_dir, schema_path)
+        return len(schemas)
+
+    def __len__(self):
+        return len(self._validators)
+
+
+SCHEMA_REGISTRY = SchemaRegistry()
+
+
+def _get_error_generator(type, obj, schema_dir=None, version=DEFAULT_VER, default='core', fail_fast=False):
     """Get a generator for validating against the schema for the given object type.
 
     Args:
@@ -612,49 +1325,59 @@ def _get_error_generator(type, obj, schema_dir=None, version=DEFAULT_VER, defaul
             against. Only used to find base schemas when schema_dir is None.
         default (str): If the schema for the given type cannot be found, use
             the one with this name instead.
+        fail_fast (bool): If True, return FAIL_FAST_SCHEMA_ERRORS instead of
+            the errors for an invalid object.
 
     Returns:
         A generator for errors found when validating the object against the
-        appropriate schema, or None if schema_dir is None and the schema
-        cannot be found.
+        appropriate schema (or an empty tuple if the object is valid), or None
+        if schema_dir is None and the schema cannot be found.
     """
     # If no schema directory given, use default for the given STIX version,
     # which comes bundled with this package
     default_path = False
     if schema_dir is None:
         default_path = True
-        schema_dir = os.path.abspath(os.path.dirname(__file__) + '/schemas-'
-                                     + version + '/')
-
-    try:
-        schema_path = find_schema(schema_dir, type)
-        schema = load_schema(schema_path)
-    except (KeyError, TypeError):
-        # Assume a custom object with no schema
-        try:
-            schema_path = find_schema(schema_dir, default)
-            schema = load_schema(schema_path)
-        except (KeyError, TypeError):
-            # Only raise an error when checking against default schemas, not custom
-            if default_path is False:
-                return None
-            if schema_path is None:
-                raise SchemaInvalidError("Cannot locate a schema for the object's "
-                                         "type, nor the base schema ({}.json).".format(default))
-
-    if type == 'observed-data' and schema_dir is None:
-        # Validate against schemas for specific observed data object types later.
-        # If schema_dir is not None the schema is custom and won't need to be modified.
-        schema['allOf'][1]['properties']['objects'] = {
-            "objects": {
-                "type": "object",
-                "minProperties": 1
-            }
-        }
+        schema_dir = bundled_schema_dir(version)
 
     # Don't use custom validator; only check schemas, no additional checks
-    validator = load_validator(schema_path, schema)
+    validator = SCHEMA_REGISTRY.get_validator(schema_dir, type, default)
+    if validator is None:
+        # Only raise an error when checking against default schemas, not custom
+        if default_path is False:
+            return None
+        raise SchemaInvalidError("Cannot locate a schema for the object's "
+                                 "type, nor the base schema ({}.json).".format(default))
+    return _iter_schema_errors(validator, obj, fail_fast)
+
+
+def _get_merged_error_generator(type, obj, schema_dir, version=DEFAULT_VER, default='core', fail_fast=False):
+    """Get a generator for validating against both the bundled schema for the
+    given object type and the schema for it in `schema_dir`, in a single pass.
+
+    Args are as for _get_error_generator(), except that `schema_dir` is
+    required.
+    """
+    validator = SCHEMA_REGISTRY.get_merged_validator(bundled_schema_dir(version), schema_dir, type, default)
+    if validator is None:
+        raise SchemaInvalidError("Cannot locate a schema for the object's "
+                                 "type, nor the base schema ({}.json).".format(default))
+    return _iter_schema_errors(validator, obj, fail_fast)
+
+
+# Stands in for the schema errors of an invalid object in fail-fast mode, where
+# only whether there are any matters
+FAIL_FAST_SCHEMA_ERRORS = (None,)
+
+
+def _iter_schema_errors(validator, obj, fail_fast=False):
     try:
+        # Most objects are valid, so first check validity cheaply, and only
+        # collect the details of the errors if there are any
+        if validator.is_valid(obj):
+            return ()
+        if fail_fast:
+            return FAIL_FAST_SCHEMA_ERRORS
         error_gen = validator.iter_errors(obj)
     except schema_exceptions.RefResolutionError:
         raise SchemaInvalidError('Invalid JSON schema: a JSON '
@@ -662,39 +1385,75 @@ def _get_error_generator(type, obj, schema_dir=None, version=DEFAULT_VER, defaul
     return error_gen
 
 
+# Maximum number of distinct sets of options to remember the checks of
+CHECK_TABLE_CACHE_SIZE = 256
+
+# Maps the functions which list checks, together with the options they select
+# checks by, to CheckTables of the checks they list
+_CHECK_TABLES = {}
+
+
+def _options_key(value):
+    if _is_iterable_non_string(value):
+        return tuple(value)
+    return value
+
+
+def _get_check_table(list_checks, options):
+    """Return a CheckTable of the checks `list_checks` lists for `options`,
+    only calling it the first time it is called with the same options.
+    """
+    key = (list_checks, options.version, _options_key(options.enabled),
+           _options_key(options.disabled), options.strict_types,
+           options.strict_properties, options.enforce_refs)
+    try:
+        return _CHECK_TABLES[key]
+    except KeyError:
+        pass
+    checks = CheckTable(list_checks(options))
+    if len(_CHECK_TABLES) >= CHECK_TABLE_CACHE_SIZE:
+        _CHECK_TABLES.clear()
+    _CHECK_TABLES[key] = checks
+    return checks
+
+
 def _get_musts(options):
-    """Return the list of 'MUST' validators for the correct version of STIX.
+    """Return a CheckTable of the 'MUST' validators for the correct version of
+    STIX.
 
     Args:
         options: ValidationOptions instance with validation options for this
             validation run, including the STIX spec version.
     """
     if options.version == '2.0':
-        return musts20.list_musts(options)
+        return _get_check_table(musts20.list_musts, options)
     else:
-        return musts21.list_musts(options)
+        return _get_check_table(musts21.list_musts, options)
 
 
 def _get_shoulds(options):
-    """Return the list of 'SHOULD' validators for the correct version of STIX.
+    """Return a CheckTable of the 'SHOULD' validators for the correct version
+    of STIX.
 
     Args:
         options: ValidationOptions instance with validation options for this
             validation run, including the STIX spec version.
     """
     if options.version == '2.0':
-        return shoulds20.list_shoulds(options)
+        return _get_check_table(shoulds20.list_shoulds, options)
     else:
-        return shoulds21.list_shoulds(options)
+        return _get_check_table(shoulds21.list_shoulds, options)
 
 
-def _schema_validate(sdo, options):
+def _schema_validate(sdo, options, fail_fast=False):
     """Set up validation of a single STIX object against its type's schema.
     This does no actual validation; it just returns generators which must be
     iterated to trigger the actual generation.
 
     This function first creates generators for the built-in schemas, then adds
-    generators for additional schemas from the options, if specified.
+    generators for additional schemas from the options, if specified. If
+    `fail_fast` is True, FAIL_FAST_SCHEMA_ERRORS stands in for the errors of
+    an invalid object.
 
     Do not call this function directly; use validate_instance() instead, as it
     calls this one. This function does not perform any custom checks.
@@ -718,16 +1477,25 @@ def _schema_validate(sdo, options):
 
     options.set_check_codes(version)
 
-    # Get validator for built-in schema
-    base_sdo_errors = _get_error_generator(sdo['type'], sdo, version=version)
-    if base_sdo_errors:
-        error_gens.append((base_sdo_errors, error_prefix))
+    merge_schemas = options.schema_dir and options.merge_schemas
+
+    if merge_schemas:
+        # Get a single validator for both built-in and user-supplied schemas
+        sdo_errors = _get_merged_error_generator(sdo['type'], sdo, options.schema_dir, version,
+                                                 fail_fast=fail_fast)
+        if sdo_errors:
+            error_gens.append((sdo_errors, error_prefix))
+    else:
+        # Get validator for built-in schema
+        base_sdo_errors = _get_error_generator(sdo['type'], sdo, version=version, fail_fast=fail_fast)
+        if base_sdo_errors:
+            error_gens.append((base_sdo_errors, error_prefix))
 
-    # Get validator for any user-supplied schema
-    if options.schema_dir:
-        custom_sdo_errors = _get_error_generator(sdo['type'], sdo, options.schema_dir)
-        if custom_sdo_errors:
-            error_gens.append((custom_sdo_errors, error_prefix))
+        # Get validator for any user-supplied schema
+        if options.schema_dir:
+            custom_sdo_errors = _get_error_generator(sdo['type'], sdo, options.schema_dir, fail_fast=fail_fast)
+            if custom_sdo_errors:
+                error_gens.append((custom_sdo_errors, error_prefix))
 
     # Validate each cyber observable object separately
     if sdo['type'] == 'observed-data' and 'objects' in sdo:
@@ -742,12 +1510,26 @@ def _schema_validate(sdo, options):
                 error_gens.append(([schema_exceptions.ValidationError("Observable object must contain a 'type' property.", error_prefix)],
                                    error_prefix + 'object \'' + key + '\': '))
                 continue
+            if merge_schemas:
+                # Get a single validator for both built-in and user-supplied schemas
+                obs_errors = _get_merged_error_generator(obj['type'],
+                                                         obj,
+                                                         options.schema_dir,
+                                                         version,
+                                                         'cyber-observable-core',
+                                                         fail_fast)
+                if obs_errors:
+                    error_gens.append((obs_errors,
+                                       error_prefix + 'object \'' + key + '\': '))
+                continue
+
             # Get validator for built-in schemas
             base_obs_errors = _get_error_generator(obj['type'],
                                                    obj,
                                                    None,
                                                    version,
-                                                   'cyber-observable-core')
+                                                   'cyber-observable-core',
+                                                   fail_fast)
             if base_obs_errors:
                 error_gens.append((base_obs_errors,
                                    error_prefix + 'object \'' + key + '\': '))
@@ -758,7 +1540,8 @@ def _schema_validate(sdo, options):
                                                          obj,
                                                          options.schema_dir,
                                                          version,
-                                                         'cyber-observable-core')
+                                                         'cyber-observable-core',
+                                                         fail_fast)
                 if custom_obs_errors:
                     error_gens.append((custom_obs_errors,
                                        error_prefix + 'object \'' + key + '\': '))
@@ -766,6 +1549,71 @@ def _schema_validate(sdo, options):
     return error_gens
 
 
+def _instance_error_gens(instance, options, fail_fast=False):
+    """Set up schema validation of `instance` and, if it is a bundle, of each
+    object in it. Returns a list of error generators and message prefixes, as
+    for _schema_validate().
+
+    If `fail_fast` is True, the errors of schema-invalid objects are not
+    collected, and objects after the first invalid one are not checked.
+    """
+    if 'type' not in instance:
+        raise ValidationError("Input must be an object with a 'type' property.")
+
+    error_gens = _schema_validate(instance, options, fail_fast)
+    if instance['type'] == 'bundle' and 'objects' in instance:
+        if options.version is None and 'spec_version' in instance:
+            options.version = instance['spec_version']
+        # Validate each object in a bundle separately
+        for sdo in instance['objects']:
+            if 'type' not in sdo:
+                raise ValidationError("Each object in bundle must have a 'type' property.")
+            if fail_fast and error_gens:
+                continue
+            error_gens += _schema_validate(sdo, options, fail_fast)
+    return error_gens
+
+
+def _is_valid(instance, error_gens, options):
+    """Return True if neither the error generators in `error_gens` nor the
+    'MUST' checks find an error in `instance`, stopping at the first error
+    found. 'SHOULD' checks are not run, and no error messages are built.
+    """
+    try:
+        errors = _iter_errors_custom(instance, _get_musts(options), options)
+    except schema_exceptions.RefResolutionError:
+        raise SchemaInvalidError('Invalid JSON schema: a JSON reference '
+                                 'failed to resolve')
+    for gen in chain((gen for gen, prefix in error_gens), [errors]):
+        for error in gen:
+            return False
+    return True
+
+
+def is_valid_instance(instance, options=None):
+    """Check whether a STIX object is valid, without collecting the errors.
+
+    This is faster than validate_instance() for rejecting invalid input, since
+    it stops at the first error found, skips the 'SHOULD' checks entirely,
+    and builds no error messages. Since 'SHOULD' checks are not run, the
+    ``strict`` option has no effect.
+
+    Args:
+        instance: A Python dictionary representing a STIX object with a
+            'type' property.
+        options: ValidationOptions instance with validation options for this
+            validation run.
+
+    Returns:
+        True if the object is valid and False otherwise.
+
+    """
+    if not options:
+        options = ValidationOptions()
+
+    return _is_valid(instance, _instance_error_gens(instance, options, fail_fast=True), options)
+
+
 def validate_instance(instance, options=None):
     """Perform STIX JSON Schema validation against STIX input.
 
@@ -779,27 +1627,22 @@ def validate_instance(instance, options=None):
             validation run.
 
     Returns:
-        A dictionary of validation results
+        A dictionary of validation results. If the ``fail_fast`` option is
+        set, validation stops at the first error found (see
+        is_valid_instance()), and the results contain no error messages or
+        warnings.
 
     """
-    if 'type' not in instance:
-        raise ValidationError("Input must be an object with a 'type' property.")
-
     if not options:
         options = ValidationOptions()
 
-    error_gens = []
-
     # Schema validation
-    error_gens += _schema_validate(instance, options)
-    if instance['type'] == 'bundle' and 'objects' in instance:
-        if options.version is None and 'spec_version' in instance:
-            options.version = instance['spec_version']
-        # Validate each object in a bundle separately
-        for sdo in instance['objects']:
-            if 'type' not in sdo:
-                raise ValidationError("Each object in bundle must have a 'type' property.")
-            error_gens += _schema_validate(sdo, options)
+    error_gens = _instance_error_gens(instance, options, options.fail_fast)
+
+    if options.fail_fast:
+        return ObjectValidationResults(is_valid=_is_valid(instance, error_gens, options),
+                                       object_id=instance.get('id', ''),
+                                       errors=[], warnings=[])
 
     spec_warnings = check_spec(instance, options)
 
@@ -807,10 +1650,13 @@ def validate_instance(instance, options=None):
     must_checks = _get_musts(options)
     should_checks = _get_shoulds(options)
     output.info("Running the following additional checks: %s."
-                % ", ".join(x.__name__ for x in chain(must_checks, should_checks)))
+                % ", ".join(x.names for x in (must_checks, should_checks) if x.names))
     try:
-        errors = _iter_errors_custom(instance, must_checks, options)
-        warnings = _iter_errors_custom(instance, should_checks, options)
+        # The 'MUST' and 'SHOULD' checks share what they find out about
+        # each object
+        contexts = {}
+        errors = _iter_errors_custom(instance, must_checks, options, contexts)
+        warnings = _iter_errors_custom(instance, should_checks, options, contexts)
 
         if options.strict:
             chained_errors = chain(errors, warnings)